@@ -0,0 +1,94 @@
+from flask import Blueprint, Response, current_app, jsonify, request, stream_with_context
+from database import db_container
+from transfer import export_records, import_records, to_ndjson, from_ndjson
+from migrations import background_migrations
+import functools
+import hmac
+import os
+
+ADMIN_TOKEN = "ADMIN_TOKEN"
+ADMIN_TOKEN_HEADER = "X-Admin-Token"
+
+admin_api = Blueprint('admin_api', __name__)
+
+@admin_api.record_once
+def load_config(state):
+    state.app.config.setdefault(ADMIN_TOKEN, os.environ.get(ADMIN_TOKEN, None))
+
+def admin_required(route):
+    """
+    Description:
+    Only lets requests through that send the configured ADMIN_TOKEN in the
+    X-Admin-Token header. Admin routes are disabled when no token is configured.
+    """
+    @functools.wraps(route)
+    def check_token(*args, **kwargs):
+        token = current_app.config[ADMIN_TOKEN]
+        given = request.headers.get(ADMIN_TOKEN_HEADER, "")
+        if token == None or not hmac.compare_digest(token.encode(), given.encode()):
+            response = jsonify("Admin token required")
+            response.status_code = 403
+            return response
+        return route(*args, **kwargs)
+    return check_token
+
+@admin_api.route("/export", methods=['GET'])
+@admin_required
+def exportRooms():
+    after = request.args.get("after", None)
+    database = db_container.get_database()
+    records = export_records(database, after)
+    return Response(stream_with_context(to_ndjson(record) for record in records),
+        status=200, mimetype="application/x-ndjson")
+
+@admin_api.route("/import", methods=['POST'])
+@admin_required
+def importRooms():
+    written = 0
+    for written in import_records(db_container.get_database(), from_ndjson(request.stream)):
+        pass
+    response = jsonify({"records": written})
+    response.status_code = 200
+    return response
+
+@admin_api.route("/profiling", methods=['GET', 'POST'])
+@admin_required
+def handleProfiling():
+    profiler = current_app.extensions["profiling"]
+    if request.method == 'POST':
+        sample_rate = request.json.get("sample_rate", None) if request.is_json else None
+        if type(sample_rate) not in [int, float] or sample_rate < 0 or sample_rate > 1:
+            response = jsonify("sample_rate must be between 0 and 1")
+            response.status_code = 400
+            return response
+        profiler.sample_rate = sample_rate
+
+    response = jsonify({"sample_rate": profiler.sample_rate, "profile_dir": profiler.profile_dir, "routes": profiler.summary})
+    response.status_code = 200
+    return response
+
+@admin_api.route("/migrations", methods=['GET', 'POST', 'DELETE'])
+@admin_required
+def handleMigrations():
+    database = db_container.get_database()
+    if request.method == 'POST':
+        options = request.json if request.is_json else {}
+        rate = options.get("rate", 50)
+        batch_size = options.get("batch_size", 100)
+        if type(rate) not in [int, float] or rate < 0 or type(batch_size) != int or batch_size <= 0:
+            response = jsonify("rate must be at least 0 and batch_size a positive integer")
+            response.status_code = 400
+            return response
+        if not background_migrations.start(database, batch_size, rate, options.get("restart", False) == True):
+            response = jsonify("Migrations are already running")
+            response.status_code = 409
+            return response
+        response = jsonify(background_migrations.status(database))
+        response.status_code = 202
+        return response
+    elif request.method == 'DELETE':
+        background_migrations.stop.set()
+
+    response = jsonify(background_migrations.status(database))
+    response.status_code = 200
+    return response
@@ -0,0 +1,81 @@
+import json
+import unittest
+
+from main import app
+from database import db_container
+from admin import ADMIN_TOKEN, ADMIN_TOKEN_HEADER
+from games import USERNAME
+
+class BasicTests(unittest.TestCase):
+
+    ############################
+    #### setup and teardown ####
+    ############################
+
+    # executed prior to each test
+    def setUp(self):
+        self.app = app.test_client()
+        db_container.set_test_mode()
+        db_container.get_database()._reset()
+
+        self.token = app.config[ADMIN_TOKEN]
+        app.config[ADMIN_TOKEN] = "test-token"
+
+    # executed after each test
+    def tearDown(self):
+        app.config[ADMIN_TOKEN] = self.token
+
+    def make_game(self):
+        room_id = self.app.post('/rooms/').json
+        for options in [["a", "b"], ["c", "d"]]:
+            question_id = self.app.post('/questions/%s' % room_id, data=json.dumps({"opt": options})).json
+            for player in ["P1", "P2"]:
+                self.app.post('/responses/%s' % question_id, json=options[0], headers={USERNAME: player})
+        return room_id
+
+    def test_requires_token(self):
+        result_export = self.app.get('/admin/export')
+        self.assertEqual(result_export.status_code, 403)
+
+        result_export = self.app.get('/admin/export', headers={ADMIN_TOKEN_HEADER: "wrong"})
+        self.assertEqual(result_export.status_code, 403)
+
+    def test_export_import(self):
+        room_ids = [self.make_game() for _ in range(3)]
+        rooms = {room_id: self.app.get('/rooms/%s' % room_id).json for room_id in room_ids}
+        questions = {room_id: self.app.get('/questions/%s' % room_id).json for room_id in room_ids}
+        scores = {room_id: self.app.get('/rooms/%s/scores' % room_id).json for room_id in room_ids}
+        tallies = {room_id: self.app.get('/questions/%s?expand=responses' % room_id).json for room_id in room_ids}
+
+        result_export = self.app.get('/admin/export', headers={ADMIN_TOKEN_HEADER: "test-token"})
+        self.assertEqual(result_export.status_code, 200)
+        lines = result_export.data.decode().splitlines()
+        # A room, two questions with their history entry, two responses and tally shards each,
+        # and the scores of both players
+        shards = sum(len(shards) for shards in db_container.get_database().tally_shards.values())
+        self.assertEqual(len(lines), 3 * (1 + 2 * 4 + 2) + shards)
+
+        db_container.get_database()._reset()
+        result_import = self.app.post('/admin/import', data=result_export.data,
+            headers={ADMIN_TOKEN_HEADER: "test-token"})
+        self.assertEqual(result_import.status_code, 200)
+        self.assertEqual(result_import.json, {"records": len(lines)})
+
+        for room_id in room_ids:
+            self.assertEqual(self.app.get('/rooms/%s' % room_id).json, rooms[room_id])
+            self.assertEqual(self.app.get('/questions/%s' % room_id).json, questions[room_id])
+            self.assertEqual(self.app.get('/rooms/%s/scores' % room_id).json, scores[room_id])
+            self.assertEqual(self.app.get('/questions/%s?expand=responses' % room_id).json, tallies[room_id])
+            question_id = questions[room_id][0]
+            self.assertEqual(self.app.get('/responses/%s' % question_id).json, {"P1": "c", "P2": "c"})
+
+    def test_export_after(self):
+        room_ids = sorted([self.make_game() for _ in range(3)])
+        result_export = self.app.get('/admin/export?after=%s' % room_ids[0],
+            headers={ADMIN_TOKEN_HEADER: "test-token"})
+        records = [json.loads(line) for line in result_export.data.decode().splitlines()]
+        self.assertEqual([record["id"] for record in records if record["type"] == "room"], room_ids[1:])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,35 @@
+"""
+Description:
+WSGI app for serving benchmarks. Uses the in-memory test database with a room
+created before workers fork, and sleeps for BENCH_DB_LATENCY_MS on every room
+read to stand in for a Firestore round trip.
+
+Setting BENCH_FAULT_RATE fails that fraction of database calls, and
+BENCH_FAULT_LATENCY_MS slows every call down, to see how the circuit breaker
+and request deadlines behave under a partial outage.
+
+Usage:
+gunicorn -c gunicorn.conf.py benchmarks.bench_app:app
+"""
+import os
+import time
+
+from main import app
+from database import db_container, TestDatabaseManager
+from resilience import CircuitBreaker
+from resilience.faults import FaultInjector
+
+DB_LATENCY = float(os.environ.get("BENCH_DB_LATENCY_MS", "20")) / 1000
+FAULT_RATE = float(os.environ.get("BENCH_FAULT_RATE", "0"))
+FAULT_LATENCY = float(os.environ.get("BENCH_FAULT_LATENCY_MS", "0")) / 1000
+
+class LatencyDatabaseManager(TestDatabaseManager):
+    def _get_room_fields(self, room_id, fields):
+        time.sleep(DB_LATENCY)
+        return TestDatabaseManager._get_room_fields(self, room_id, fields)
+
+db_container.database = LatencyDatabaseManager()
+db_container.get_database().create_room()
+if FAULT_RATE > 0 or FAULT_LATENCY > 0:
+    db_container.get_database().breaker = CircuitBreaker()
+    db_container.get_database().faults = FaultInjector(FAULT_RATE, FAULT_LATENCY)
@@ -0,0 +1,75 @@
+"""
+Description:
+Compares the room document bytes read per route with whole-document reads
+against the projected reads used by DatabaseManager. Runs against the in-memory
+test database, the size of each read is measured as its JSON encoding which
+approximates the payload Firestore sends for the same fields.
+
+Usage:
+python -m benchmarks.bench_projection [players] [questions]
+"""
+import json
+import sys
+
+from main import app
+from database import db_container, TestDatabaseManager, PLAYERS_KEY, ROOM_ID_KEY
+from games import ROOM_ID, USERNAME
+
+class CountingDatabaseManager(TestDatabaseManager):
+    def __init__(self, projected):
+        self.projected = projected
+        self.bytes_read = 0
+        TestDatabaseManager.__init__(self)
+
+    def _get_room_fields(self, room_id, fields):
+        room_data = TestDatabaseManager._get_room_fields(self, room_id, fields if self.projected else None)
+        if room_data != None:
+            self.bytes_read += len(json.dumps(room_data))
+        return room_data
+
+    def room_exists(self, room_id):
+        # DatabaseManager answers existence checks with a read of the room id field
+        if room_id not in self.rooms:
+            return False
+        return self._get_room_fields(room_id, [ROOM_ID_KEY]) != None
+
+def measure(projected, num_players, num_questions):
+    database = CountingDatabaseManager(projected)
+    db_container.database = database
+    client = app.test_client()
+
+    room_id = client.post('/rooms/').json
+    database.update_room(room_id, {PLAYERS_KEY: ["PLAYER%d" % i for i in range(num_players)]})
+    for i in range(num_questions):
+        client.post('/questions/%s' % room_id, data=json.dumps({"opt": ["yes", "no", str(i)]}))
+    question_id = client.get('/rooms/%s/active' % room_id).json
+
+    routes = [
+        ("GET /rooms/<id>", lambda: client.get('/rooms/%s' % room_id)),
+        ("GET /rooms/<id>/active", lambda: client.get('/rooms/%s/active' % room_id)),
+        ("GET /questions/<id>", lambda: client.get('/questions/%s?limit=20' % room_id)),
+        ("GET /questions/<id>/<qid>", lambda: client.get('/questions/%s/%s' % (room_id, question_id))),
+        ("POST /games/join", lambda: app.test_client().post('/games/join', headers={ROOM_ID: room_id, USERNAME: "NEWUSER"})),
+    ]
+    results = {}
+    for name, call in routes:
+        database.bytes_read = 0
+        call()
+        results[name] = database.bytes_read
+    return results
+
+def main():
+    num_players = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    num_questions = int(sys.argv[2]) if len(sys.argv) > 2 else 50
+    app.secret_key = "bench-key"
+
+    before = measure(False, num_players, num_questions)
+    after = measure(True, num_players, num_questions)
+
+    print("room bytes read per route (%d players, %d questions)" % (num_players, num_questions))
+    print("%-28s %12s %12s" % ("route", "full reads", "projected"))
+    for name in before:
+        print("%-28s %12d %12d" % (name, before[name], after[name]))
+
+if __name__ == '__main__':
+    main()
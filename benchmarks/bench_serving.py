@@ -0,0 +1,56 @@
+"""
+Description:
+Compares request throughput of gunicorn worker/thread layouts. Each layout is
+started with gunicorn.conf.py serving benchmarks.bench_app and polled with
+GET /rooms/<id> from a pool of client threads.
+
+Usage:
+python -m benchmarks.bench_serving [clients] [requests]
+"""
+from concurrent.futures import ThreadPoolExecutor
+import json
+import subprocess
+import sys
+import time
+import urllib.request
+
+LAYOUTS = [(1, 1), (1, 8), (2, 4), (4, 2), (4, 8)]
+PORT = 8765
+
+def wait_until_ready(base_url, timeout=20):
+    end = time.time() + timeout
+    while time.time() < end:
+        try:
+            return json.loads(urllib.request.urlopen(base_url + "/rooms/").read())
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError("gunicorn did not start")
+
+def run_layout(workers, threads, clients, requests):
+    base_url = "http://127.0.0.1:%d" % PORT
+    server = subprocess.Popen(
+        ["gunicorn", "-c", "gunicorn.conf.py",
+         "-b", "127.0.0.1:%d" % PORT, "-w", str(workers), "--threads", str(threads),
+         "benchmarks.bench_app:app"],
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        room_id = wait_until_ready(base_url)[0]
+        url = "%s/rooms/%s" % (base_url, room_id)
+        start = time.time()
+        with ThreadPoolExecutor(clients) as pool:
+            list(pool.map(lambda _: urllib.request.urlopen(url).read(), range(requests)))
+        return requests / (time.time() - start)
+    finally:
+        server.terminate()
+        server.wait()
+
+def main():
+    clients = int(sys.argv[1]) if len(sys.argv) > 1 else 32
+    requests = int(sys.argv[2]) if len(sys.argv) > 2 else 1000
+
+    print("%8s %8s %12s" % ("workers", "threads", "requests/s"))
+    for workers, threads in LAYOUTS:
+        print("%8d %8d %12.1f" % (workers, threads, run_layout(workers, threads, clients, requests)))
+
+if __name__ == '__main__':
+    main()
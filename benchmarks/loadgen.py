@@ -0,0 +1,160 @@
+"""
+Description:
+Load generator playing scripted game nights against a running server. Every
+room gets a host and a number of players, each on their own thread with their
+own session cookie. The host creates the room and posts questions, players join
+through /games/join, poll for the active question, fetch its options and
+answer, and the host polls the responses. Prints the throughput and the
+p50/p95/p99 latency of each endpoint.
+
+Usage:
+python main.py  (or gunicorn -c gunicorn.conf.py main:app)
+python -m benchmarks.loadgen --url http://127.0.0.1:5000 --rooms 5 --players 20
+
+The in-memory benchmark app keeps state per process, so serve it with a single
+worker: gunicorn -c gunicorn.conf.py -w 1 benchmarks.bench_app:app
+"""
+from http.cookiejar import CookieJar
+import argparse
+import json
+import random
+import threading
+import time
+import urllib.error
+import urllib.request
+
+class LatencyRecorder:
+    def __init__(self):
+        self.latencies = dict()
+        self.errors = dict()
+        self.lock = threading.Lock()
+
+    def record(self, endpoint, seconds, ok):
+        with self.lock:
+            self.latencies.setdefault(endpoint, []).append(seconds)
+            if not ok:
+                self.errors[endpoint] = self.errors.get(endpoint, 0) + 1
+
+    def report(self, duration):
+        total = sum([len(latencies) for latencies in self.latencies.values()])
+        print("%d requests in %.1fs, %.1f requests/s" % (total, duration, total / duration))
+        print("%-32s %8s %8s %9s %9s %9s" % ("endpoint", "requests", "errors", "p50 ms", "p95 ms", "p99 ms"))
+        for endpoint in sorted(self.latencies):
+            latencies = sorted(self.latencies[endpoint])
+            print("%-32s %8d %8d %9.1f %9.1f %9.1f" % (
+                endpoint, len(latencies), self.errors.get(endpoint, 0),
+                percentile(latencies, 50) * 1000, percentile(latencies, 95) * 1000, percentile(latencies, 99) * 1000))
+
+def percentile(sorted_values, percent):
+    index = min(len(sorted_values) - 1, int(round(percent / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+class Client:
+    """
+    Description:
+    HTTP client with its own cookie jar, so each simulated person keeps their own session.
+    """
+    def __init__(self, base_url, recorder):
+        self.base_url = base_url
+        self.recorder = recorder
+        self.opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(CookieJar()))
+
+    def call(self, method, endpoint, path, body=None, headers=None, json_body=None):
+        headers = dict(headers or {})
+        if json_body != None:
+            body = json.dumps(json_body).encode()
+            headers["Content-Type"] = "application/json"
+        request = urllib.request.Request(self.base_url + path, data=body, method=method, headers=headers)
+        start = time.perf_counter()
+        try:
+            with self.opener.open(request) as response:
+                data = response.read()
+                ok = True
+        except urllib.error.HTTPError as error:
+            data = error.read()
+            ok = False
+        except OSError:
+            data = b""
+            ok = False
+        self.recorder.record("%s %s" % (method, endpoint), time.perf_counter() - start, ok)
+        return json.loads(data) if ok and len(data) > 0 else None
+
+def think(mean):
+    if mean > 0:
+        time.sleep(random.expovariate(1 / mean))
+
+def play_player(client, room_id, name, questions, options, config, joined, finished):
+    client.call("POST", "/games/join", "/games/join", headers={"ROOM": room_id, "USERNAME": name})
+    joined.wait()
+    answered = set()
+    while len(answered) < questions and not finished.is_set():
+        think(config.poll_interval)
+        client.call("GET", "/games/ping", "/games/ping")
+        question_id = client.call("GET", "/rooms/<id>/active", "/rooms/%s/active" % room_id)
+        if question_id == None or question_id == "" or question_id in answered:
+            continue
+        think(config.think_time)
+        client.call("GET", "/questions/<id>/<qid>", "/questions/%s/%s" % (room_id, question_id))
+        client.call("POST", "/responses/<qid>", "/responses/%s" % question_id,
+            json_body=random.choice(options), headers={"USERNAME": name})
+        answered.add(question_id)
+
+def play_room(base_url, recorder, config):
+    host = Client(base_url, recorder)
+    room_id = host.call("POST", "/rooms/", "/rooms/")
+    if room_id == None:
+        return
+    options = ["option-%d" % i for i in range(config.options)]
+    joined = threading.Event()
+    finished = threading.Event()
+    players = [threading.Thread(target=play_player, args=(
+        Client(base_url, recorder), room_id, "P%03d" % i, config.questions, options, config, joined, finished))
+        for i in range(config.players)]
+    for player in players:
+        player.start()
+    joined.set()
+
+    for _ in range(config.questions):
+        think(config.think_time)
+        question_id = host.call("POST", "/questions/<id>", "/questions/%s" % room_id,
+            body=json.dumps({"opt": options}).encode(), headers={"Content-Type": "text/plain"})
+        if question_id == None:
+            continue
+        # Poll until every player answered or the answer window closed
+        deadline = time.time() + config.answer_window
+        while time.time() < deadline:
+            think(config.poll_interval)
+            responses = host.call("GET", "/responses/<qid>", "/responses/%s" % question_id)
+            host.call("GET", "/rooms/<id>", "/rooms/%s" % room_id)
+            if responses != None and len(responses) >= config.players:
+                break
+
+    finished.set()
+    for player in players:
+        player.join()
+    host.call("GET", "/questions/<id>", "/questions/%s" % room_id)
+    host.call("DELETE", "/rooms/<id>", "/rooms/%s" % room_id)
+
+def main():
+    parser = argparse.ArgumentParser(description="Simulate game nights against a running server")
+    parser.add_argument("--url", default="http://127.0.0.1:5000", help="Base url of the server")
+    parser.add_argument("--rooms", type=int, default=5, help="Number of concurrent rooms")
+    parser.add_argument("--players", type=int, default=10, help="Players per room")
+    parser.add_argument("--questions", type=int, default=5, help="Questions per game")
+    parser.add_argument("--options", type=int, default=4, help="Options per question")
+    parser.add_argument("--think-time", type=float, default=1.0, help="Mean seconds before acting")
+    parser.add_argument("--poll-interval", type=float, default=0.5, help="Mean seconds between polls")
+    parser.add_argument("--answer-window", type=float, default=30.0, help="Seconds the host waits for answers")
+    config = parser.parse_args()
+
+    recorder = LatencyRecorder()
+    rooms = [threading.Thread(target=play_room, args=(config.url, recorder, config)) for _ in range(config.rooms)]
+    start = time.time()
+    for room in rooms:
+        room.start()
+    for room in rooms:
+        room.join()
+    recorder.report(time.time() - start)
+
+if __name__ == '__main__':
+    main()
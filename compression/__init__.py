@@ -0,0 +1,83 @@
+from flask import request
+from collections import OrderedDict
+import gzip
+import hashlib
+import os
+import threading
+import zlib
+
+COMPRESS_MIN_SIZE = "COMPRESS_MIN_SIZE"
+COMPRESS_LEVEL = "COMPRESS_LEVEL"
+COMPRESS_CACHE_SIZE = "COMPRESS_CACHE_SIZE"
+
+COMPRESSIBLE_TYPES = ["application/json", "text/html", "text/plain"]
+
+def _gzip(data, level):
+    # A fixed mtime keeps the output identical for identical payloads
+    return gzip.compress(data, level, mtime=0)
+
+ENCODERS = OrderedDict([
+    ("gzip", _gzip),
+    ("deflate", zlib.compress),
+])
+
+class CompressionCache:
+    """
+    Description:
+    Least recently used cache of compressed payloads keyed by encoding and the
+    hash of the uncompressed payload, so payloads many clients poll for are
+    compressed once.
+    """
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def compress(self, encoding, data, level):
+        key = (encoding, hashlib.sha1(data).digest())
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                return self.entries[key]
+        compressed = ENCODERS[encoding](data, level)
+        with self.lock:
+            self.entries[key] = compressed
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+        return compressed
+
+def _compress_response(app, cache, response):
+    if response.direct_passthrough or response.is_streamed:
+        return response
+    if response.status_code < 200 or response.status_code >= 300 or response.status_code == 204:
+        return response
+    if "Content-Encoding" in response.headers or response.mimetype not in COMPRESSIBLE_TYPES:
+        return response
+
+    response.vary.add("Accept-Encoding")
+    encoding = request.accept_encodings.best_match(list(ENCODERS.keys()))
+    if encoding == None:
+        return response
+    data = response.get_data()
+    if len(data) < app.config[COMPRESS_MIN_SIZE]:
+        return response
+
+    response.set_data(cache.compress(encoding, data, app.config[COMPRESS_LEVEL]))
+    response.headers["Content-Encoding"] = encoding
+    return response
+
+def init_app(app):
+    """
+    Parameters:
+    app - Flask app
+
+    Description:
+    Compresses JSON and text responses of at least COMPRESS_MIN_SIZE bytes with
+    gzip or deflate, whichever the client prefers in its Accept-Encoding header.
+    """
+    app.config.setdefault(COMPRESS_MIN_SIZE, int(os.environ.get(COMPRESS_MIN_SIZE, "512")))
+    app.config.setdefault(COMPRESS_LEVEL, int(os.environ.get(COMPRESS_LEVEL, "6")))
+    app.config.setdefault(COMPRESS_CACHE_SIZE, int(os.environ.get(COMPRESS_CACHE_SIZE, "256")))
+
+    cache = CompressionCache(app.config[COMPRESS_CACHE_SIZE])
+    app.after_request(lambda response: _compress_response(app, cache, response))
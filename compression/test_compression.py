@@ -0,0 +1,62 @@
+import gzip
+import unittest
+import zlib
+
+from main import app
+from database import db_container, PLAYERS_KEY
+from compression import COMPRESS_MIN_SIZE
+
+class BasicTests(unittest.TestCase):
+
+    ############################
+    #### setup and teardown ####
+    ############################
+
+    # executed prior to each test
+    def setUp(self):
+        self.app = app.test_client()
+        db_container.set_test_mode()
+        db_container.get_database()._reset()
+
+        self.room_id = self.app.post('/rooms/').json
+        players = ["PLAYER%d" % i for i in range(200)]
+        db_container.get_database().update_room(self.room_id, {PLAYERS_KEY: players})
+        self.room = self.app.get('/rooms/%s' % self.room_id).data
+
+    # executed after each test
+    def tearDown(self):
+        pass
+
+    def test_uncompressed_by_default(self):
+        result_get = self.app.get('/rooms/%s' % self.room_id)
+        self.assertNotIn("Content-Encoding", result_get.headers)
+        self.assertIn("Accept-Encoding", result_get.headers["Vary"])
+
+    def test_gzip(self):
+        result_get = self.app.get('/rooms/%s' % self.room_id, headers={"Accept-Encoding": "gzip, deflate"})
+        self.assertEqual(result_get.headers["Content-Encoding"], "gzip")
+        self.assertEqual(gzip.decompress(result_get.data), self.room)
+        self.assertLess(len(result_get.data), len(self.room))
+
+    def test_deflate(self):
+        result_get = self.app.get('/rooms/%s' % self.room_id, headers={"Accept-Encoding": "gzip;q=0.5, deflate"})
+        self.assertEqual(result_get.headers["Content-Encoding"], "deflate")
+        self.assertEqual(zlib.decompress(result_get.data), self.room)
+
+    def test_refused_encoding(self):
+        result_get = self.app.get('/rooms/%s' % self.room_id, headers={"Accept-Encoding": "gzip;q=0, br"})
+        self.assertNotIn("Content-Encoding", result_get.headers)
+
+    def test_small_payload(self):
+        self.assertLess(len(self.app.get('/rooms/%s/active' % self.room_id).data), app.config[COMPRESS_MIN_SIZE])
+        result_get = self.app.get('/rooms/%s/active' % self.room_id, headers={"Accept-Encoding": "gzip"})
+        self.assertNotIn("Content-Encoding", result_get.headers)
+
+    def test_repeated_payload(self):
+        first = self.app.get('/rooms/%s' % self.room_id, headers={"Accept-Encoding": "gzip"})
+        second = self.app.get('/rooms/%s' % self.room_id, headers={"Accept-Encoding": "gzip"})
+        self.assertEqual(first.data, second.data)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,6 +1,21 @@
 from itertools import product
 from random import shuffle
 from firebase_admin import firestore
+from google.api_core.datetime_helpers import DatetimeWithNanoseconds
+from google.api_core.exceptions import Aborted, Conflict, FailedPrecondition, NotFound
+from google.cloud.firestore_v1.field_path import FieldPath
+import copy
+import hashlib
+import json
+import urllib.parse
+from database.replica import RoomReplica
+from database.cache import MicroCache
+from database.scoring import player_deltas, apply_player_deltas, compute_player_scores, combine_player_scores, \
+    empty_scores, PLAYER_PAIRS_KEY, PLAYER_ANSWERED_KEY
+from tracing import trace_calls
+from resilience import guard_calls, rpc_timeout, CircuitBreaker, HedgedReads
+from packs import question_packs
+import threading
 import time
 import uuid
 
@@ -12,14 +27,83 @@ TIME_START_KEY = "time_start"
 ROOM_STATUS_KEY = "room_status"
 ROOM_TYPE_KEY = "room_type"
 MAX_PLAYERS_KEY = "max_players"
-QUESTION_LIST_KEY = "all_questions"
 ACTIVE_QUESTION_KEY = "active_question"
+ROOM_QUESTIONS_KEY = "questions"
+# Collection of the presence summaries of each room, kept out of the room document
+PRESENCE_KEY = "presence"
+# Time an instance wrote its presence summary of a room
+PRESENCE_UPDATED_KEY = "updated"
+# Collection of the records of requests sent with an idempotency key
+IDEMPOTENCY_KEY = "idempotency"
+REQUEST_FINGERPRINT_KEY = "fingerprint"
+REQUEST_RESULT_KEY = "result"
+# Time after which a request record can be replaced by a new request with its key
+REQUEST_EXPIRES_KEY = "expires"
+# Number of changes made to a room through update_room and patch_room
+ROOM_VERSION_KEY = "version"
+# Subcollection of a room logging the change made by each version
+ROOM_CHANGES_KEY = "changes"
+# Subcollection of a room's scores document holding the score document of each player
+SCORES_PLAYERS_KEY = "players"
+# Question history kept in the room document before it moved to a subcollection
+LEGACY_QUESTION_LIST_KEY = "all_questions"
 
 QUESTION_ID_KEY = "question_id"
 QUESTION_OPTIONS_KEY = "options"
 QUESTION_RESPONSES_KEY = "responses"
+QUESTION_TALLIES_KEY = "tallies"
+# Subcollection of a question counting its answers across several documents, so
+# answers recorded at the same time do not all write the question document
+TALLY_SHARDS_KEY = "tally_shards"
+# Questions created from a question pack store the reference of their entry instead of options
+QUESTION_PACK_ENTRY_KEY = "pack_entry"
+# Collection of the options of every version of the pack entries questions were created from
+PACK_ENTRIES_KEY = "pack_entries"
 RESPONSE_KEY_ID = "selected"
 
+CHANGE_VERSION_KEY = "version"
+CHANGE_TIME_KEY = "time"
+CHANGE_SET_KEY = "set"
+# Number of changes kept in the change log of each room
+MAX_ROOM_CHANGES = 100
+# Number of times a room patch is retried against a fresh read after another write
+MAX_PATCH_RETRIES = 5
+# Number of attempts of a room transaction, retried transactions keep their
+# place in line so a burst of joins to a room commits one after the other
+MAX_ROOM_TRANSACTION_ATTEMPTS = 25
+
+# Maximum number of writes in a single Firestore batch commit
+MAX_BATCH_WRITES = 500
+
+# Layout version of room and question documents, documents without one are version 1
+SCHEMA_VERSION_KEY = "schema_version"
+# Rooms keep their question history in the questions subcollection
+ROOM_SCHEMA_VERSION = 2
+# Questions keep up to date answer tallies
+QUESTION_SCHEMA_VERSION = 2
+
+# Number of tally shards of each question, each player's answers are counted in one of them
+TALLY_SHARDS = 8
+
+# Number of question pack references remembered by each instance
+MAX_PACK_ENTRIES = 10000
+
+# Most players a room can have, each player's score document holds a count per other player
+MAX_ROOM_PLAYERS = 500
+DEFAULT_MAX_PLAYERS = MAX_ROOM_PLAYERS
+DEFAULT_ROOM_TYPE = "game"
+
+def room_capacity(room_data):
+    """
+    Parameters:
+    room_data - Room document with its maximum number of players
+
+    Returns:
+    Number of players the room can hold, no more than MAX_ROOM_PLAYERS even for
+    rooms created with a higher maximum
+    """
+    return min(room_data[MAX_PLAYERS_KEY], MAX_ROOM_PLAYERS)
+
 def get_uuid():
     """
     Description:
@@ -59,83 +143,676 @@ def room_id_generator():
     for room_numbers in product(index_1_numbers, index_2_numbers, index_3_numbers, index_4_numbers):
         yield "".join(room_numbers)
 
+def project_fields(data, fields):
+    """
+    Parameters:
+    data - Document data as a dictionary
+    fields - List of fields to keep, None to keep all of them
+
+    Description:
+    Copies the given fields of a document, skipping fields the document does not have.
+    """
+    if fields == None:
+        return dict(data)
+    return {field: data[field] for field in fields if field in data}
+
+def merge_update(data, update_data):
+    """
+    Parameters:
+    data - Document data as a dictionary
+    update_data - Update as given to update_room
+
+    Description:
+    Applies an update to a copy of a document the way Firestore applies it, where
+    a dotted key such as "a.b" sets the nested field b of a.
+
+    Returns:
+    The updated copy of the document
+    """
+    merged = copy.deepcopy(data)
+    for key, value in update_data.items():
+        parts = key.split(".")
+        target = merged
+        for part in parts[:-1]:
+            if not isinstance(target.get(part, None), dict):
+                target[part] = dict()
+            target = target[part]
+        target[parts[-1]] = value
+    return merged
+
+def versioned_update(update_data, version):
+    # The version is applied last so an update can not overwrite it
+    return dict(update_data, **{ROOM_VERSION_KEY: version})
+
+def change_id(version):
+    # Zero padded so the change log sorts by version
+    return "%010d" % version
+
+def change_record(version, update_data):
+    """
+    Parameters:
+    version - Room version the change produced
+    update_data - Update applied to the room, as given to update_room
+
+    Returns:
+    The change log entry of the update
+    """
+    return {CHANGE_VERSION_KEY: version, CHANGE_TIME_KEY: time.time(), CHANGE_SET_KEY: update_data}
+
+def schema_version(data):
+    """
+    Parameters:
+    data - Room or question document data
+
+    Description:
+    Gets the layout version of a document, documents written before versions
+    were recorded are version 1.
+    """
+    return data.get(SCHEMA_VERSION_KEY, 1)
+
+def merge_legacy_history(history, legacy_history):
+    """
+    Parameters:
+    history - Question ids from the questions subcollection, newest first
+    legacy_history - Question ids from the legacy all_questions array, oldest first
+
+    Description:
+    Combines the question history of a room that has not been migrated yet.
+    Questions in the legacy array were all asked before any in the subcollection.
+    """
+    recorded = set(history)
+    return history + [question_id for question_id in reversed(legacy_history) if question_id not in recorded]
+
+def page_history(history, limit=None, after=None):
+    """
+    Parameters:
+    history - Question ids, newest first
+    limit - Maximum number of question ids to return, None for all of them
+    after - Question id to start after, None to start from the newest question
+
+    Returns:
+    List of question ids or None if the after cursor is not in the history
+    """
+    start = 0
+    if after is not None:
+        if after not in history:
+            return None
+        start = history.index(after) + 1
+    end = len(history) if limit is None else start + limit
+    return history[start:end]
+
+def tally_key(response):
+    """
+    Parameters:
+    response - Answer to a question
+
+    Description:
+    Gets the key an answer is counted under in the question tallies. Answers
+    that are not strings are counted under their JSON encoding.
+    """
+    return response if type(response) == str else json.dumps(response, sort_keys=True)
+
+def tally_responses(responses):
+    """
+    Parameters:
+    responses - Dictionary of the answers to a question by player
+
+    Description:
+    Counts the players that gave each answer.
+    """
+    tallies = dict()
+    for response in responses.values():
+        key = tally_key(response)
+        tallies[key] = tallies.get(key, 0) + 1
+    return tallies
+
+def tally_shard(user_id):
+    """
+    Parameters:
+    user_id - Name of the player answering
+
+    Returns:
+    Id of the tally shard counting the player's answers, the same on every instance
+    """
+    return str(int(hashlib.sha1(user_id.encode()).hexdigest(), 16) % TALLY_SHARDS)
+
+def sum_tallies(tallies_list):
+    """
+    Parameters:
+    tallies_list - List of answer tallies, such as those of the shards of a question
+
+    Returns:
+    Dictionary of the total count of each answer, answers counted zero times are left out
+    """
+    total = dict()
+    for tallies in tallies_list:
+        for key, count in tallies.items():
+            total[key] = total.get(key, 0) + count
+    return {key: count for key, count in total.items() if count != 0}
+
+def pack_entry_id(pack_entry):
+    """
+    Parameters:
+    pack_entry - Versioned reference of a question pack entry
+
+    Returns:
+    Id of the document archiving the options of the entry
+    """
+    return urllib.parse.quote(pack_entry, safe="@")
+
+def question_options(question_data):
+    """
+    Parameters:
+    question_data - Question document, with at least its options or pack entry
+
+    Description:
+    Gets the options of a question, resolving questions created from a question
+    pack from the packs in memory.
+
+    Returns:
+    List of the question's options, None if its pack entry is not loaded, in
+    which case get_pack_options reads the archived options
+    """
+    if question_data.get(QUESTION_PACK_ENTRY_KEY, None) != None:
+        return question_packs.get_options(question_data[QUESTION_PACK_ENTRY_KEY])
+    return question_data.get(QUESTION_OPTIONS_KEY, None)
+
+def expired_summaries(summaries, updated, max_age):
+    """
+    Parameters:
+    summaries - Dictionary of the presence summaries of a room by instance id
+    updated - Time of the summary being written
+    max_age - Seconds a summary is kept for without being updated, None to keep them all
+
+    Returns:
+    List of the ids of the instances whose summaries have expired
+    """
+    if max_age == None:
+        return []
+    return [instance_id for instance_id, summary in summaries.items()
+        if updated - summary.get(PRESENCE_UPDATED_KEY, 0) > max_age]
+
+def room_snapshot(room_doc):
+    """
+    Parameters:
+    room_doc - Firestore document snapshot of a room
+
+    Description:
+    Gets the data of a room with its version, the time of its last update.
+
+    Returns:
+    Tuple of the room data and version or None if the room does not exist
+    """
+    if not room_doc.exists:
+        return None
+    return room_doc.to_dict(), room_doc.update_time.rfc3339()
+
+class VersionConflict(Exception):
+    """
+    Description:
+    Raised when a room changed after the version an update was based on.
+    """
+    pass
+
+@trace_calls
+@guard_calls
 class DatabaseManager:
+    def __init__(self):
+        self.replica = None
+        self.room_cache = None
+        self.breaker = None
+        self.hedger = None
+        self.faults = None
+        self.pack_entries = dict()
+        self.archived_pack_entries = set()
+        self.pack_entries_lock = threading.Lock()
+
+    def enable_replica(self, max_rooms=500, max_staleness=10.0, idle_timeout=300.0):
+        """
+        Parameters:
+        max_rooms - Maximum number of rooms to keep in memory
+        max_staleness - Seconds a room can be served from memory after its last
+            snapshot once its listener stopped
+        idle_timeout - Seconds after the last read before a room is dropped
+
+        Description:
+        Serves room reads from an in-memory replica of the rooms this instance
+        reads, kept current with Firestore snapshot listeners.
+        """
+        self.replica = RoomReplica(self._watch_room, max_rooms, max_staleness, idle_timeout)
+
+    def enable_room_cache(self, ttl):
+        """
+        Parameters:
+        ttl - Seconds a room read is shared for, usually well under a second
+
+        Description:
+        Shares room reads between the requests on this instance for a short time.
+        Requests for a room that is already being read wait for that read instead
+        of making their own.
+        """
+        self.room_cache = MicroCache(ttl)
+
+    def enable_circuit_breaker(self, error_rate=0.5, min_calls=20, window=10.0, cooldown=5.0):
+        """
+        Parameters:
+        error_rate - Fraction of failed calls that opens the circuit
+        min_calls - Minimum number of calls in the window before the circuit can open
+        window - Seconds of calls the error rate is measured over
+        cooldown - Seconds calls are refused for once the circuit opens
+
+        Description:
+        Fails database calls straight away while too many of them are failing,
+        instead of tying up request threads waiting on an unhealthy database.
+        """
+        self.breaker = CircuitBreaker(error_rate, min_calls, window, cooldown)
+
+    def enable_hedged_reads(self, percentile=95, min_delay=0.005, max_delay=1.0):
+        """
+        Parameters:
+        percentile - Percentile of recent read latencies to wait before hedging
+        min_delay - Minimum seconds to wait before hedging
+        max_delay - Maximum seconds to wait before hedging
+
+        Description:
+        Sends a second copy of single document reads that are slower than most,
+        using whichever copy answers first.
+        """
+        self.hedger = HedgedReads(percentile, min_delay=min_delay, max_delay=max_delay)
+
+    def _hedged(self, read):
+        if self.hedger == None:
+            return read()
+        return self.hedger.read(read)
+
+    def _invalidate_room(self, room_id):
+        # Makes the next read of a room on this instance see this instance's writes
+        if self.room_cache != None:
+            self.room_cache.invalidate(room_id)
+        if self.replica != None:
+            self.replica.invalidate(room_id)
+
+    def _watch_room(self, room_id, callback):
+        def on_snapshot(doc_snapshots, changes, read_time):
+            for doc in doc_snapshots:
+                callback(room_snapshot(doc))
+        db = firestore.client()
+        # The watch stops being active once its stream fails without recovering
+        return db.collection('rooms').document(room_id).on_snapshot(on_snapshot)
+
     def _get_new_question_id(self):
         qid = get_uuid()
         while self.question_exists(qid):
             qid = get_uuid()
         return qid
 
+    def _remember_pack_entry(self, question_id, pack_entry):
+        # The entry of a question never changes, so its options need no reads once it is known
+        with self.pack_entries_lock:
+            if len(self.pack_entries) >= MAX_PACK_ENTRIES:
+                del self.pack_entries[next(iter(self.pack_entries))]
+            self.pack_entries[question_id] = pack_entry
+
+    def _archive_pack_entry(self, pack_entry):
+        # Keeps the options of the version of a pack entry a question is created
+        # from, once per version, for when the version is no longer loaded
+        if pack_entry in self.archived_pack_entries:
+            return
+        db = firestore.client()
+        db.collection(PACK_ENTRIES_KEY).document(pack_entry_id(pack_entry)) \
+            .set({QUESTION_OPTIONS_KEY: question_packs.get_options(pack_entry)}, timeout=rpc_timeout())
+        with self.pack_entries_lock:
+            self.archived_pack_entries.add(pack_entry)
+
     def set_question_response(self, question_id, user_id, response):
-        if not self.question_exists(question_id):
-            return None
+        """
+        Parameters:
+        question_id - Id of the question
+        user_id - Name of the player answering
+        response - Answer of the player
+
+        Description:
+        Records a player's answer to a question and, in the same transaction,
+        updates the player's tally shard of the question and the player's score
+        document with the matches gained or lost by the answer. The question
+        document itself is not written, so answers of many players to the same
+        question do not contend for it.
+
+        Returns:
+        The response or None if the question does not exist
+        """
         db = firestore.client()
-        db.collection('questions') \
-            .document(question_id) \
-            .collection(QUESTION_RESPONSES_KEY) \
-            .document(user_id).set({RESPONSE_KEY_ID: response})
+        question_ref = db.collection('questions').document(question_id)
+        question_doc = question_ref.get(field_paths=[ROOM_ID_KEY], timeout=rpc_timeout())
+        if not question_doc.exists:
+            return None
+        room_id = question_doc.to_dict().get(ROOM_ID_KEY, None)
+        response_ref = question_ref.collection(QUESTION_RESPONSES_KEY).document(user_id)
+
+        @firestore.transactional
+        def record_response(transaction):
+            previous_doc = response_ref.get(transaction=transaction, timeout=rpc_timeout())
+            previous = previous_doc.to_dict()[RESPONSE_KEY_ID] if previous_doc.exists else None
+            if previous == response:
+                return
+
+            # Only the players with the old or new answer change the score. Transactions
+            # can not read after writing, so they are read before anything is written
+            matching = dict()
+            if room_id != None:
+                for answer in [response] if previous == None else [response, previous]:
+                    query = question_ref.collection(QUESTION_RESPONSES_KEY).where(RESPONSE_KEY_ID, "==", answer)
+                    for doc in transaction.get(query, timeout=rpc_timeout()):
+                        matching[doc.id] = doc.to_dict()[RESPONSE_KEY_ID]
+
+            transaction.set(response_ref, {RESPONSE_KEY_ID: response})
+            tallies = {tally_key(response): firestore.Increment(1)}
+            if previous != None:
+                tallies[tally_key(previous)] = firestore.Increment(-1)
+            shard_ref = question_ref.collection(TALLY_SHARDS_KEY).document(tally_shard(user_id))
+            transaction.set(shard_ref, {QUESTION_TALLIES_KEY: tallies}, merge=True)
+            if room_id == None:
+                return
+            deltas = player_deltas(user_id, previous, response, matching)
+
+            increments = dict()
+            if deltas[PLAYER_ANSWERED_KEY] != 0:
+                increments[PLAYER_ANSWERED_KEY] = firestore.Increment(deltas[PLAYER_ANSWERED_KEY])
+            if len(deltas[PLAYER_PAIRS_KEY]) > 0:
+                increments[PLAYER_PAIRS_KEY] = {other: firestore.Increment(amount)
+                    for other, amount in deltas[PLAYER_PAIRS_KEY].items()}
+            if len(increments) > 0:
+                player_scores_ref = db.collection('scores').document(room_id) \
+                    .collection(SCORES_PLAYERS_KEY).document(user_id)
+                transaction.set(player_scores_ref, increments, merge=True)
+
+        record_response(db.transaction())
         return response
 
-    def get_question_options(self, question_id):
-        if not self.question_exists(question_id):
+    def get_scores(self, room_id):
+        """
+        Parameters:
+        room_id - Id of the room
+
+        Description:
+        Gets the scoreboard of a room, combined from the score documents of its
+        players which are kept up to date as answers are recorded. A scoreboard
+        stored for the whole room by earlier versions is added in until the
+        scores are rebuilt.
+
+        Returns:
+        Dictionary with the matches of each player, the matches of each pair of
+        players and the number of questions each player answered. None if the room
+        does not exist.
+        """
+        db = firestore.client()
+        scores_ref = db.collection('scores').document(room_id)
+        player_scores = {doc.id: doc.to_dict()
+            for doc in scores_ref.collection(SCORES_PLAYERS_KEY).stream(timeout=rpc_timeout())}
+        scores_doc = scores_ref.get(timeout=rpc_timeout())
+        if len(player_scores) == 0 and not scores_doc.exists:
+            return empty_scores() if self.room_exists(room_id) else None
+        return combine_player_scores(player_scores, scores_doc.to_dict() if scores_doc.exists else None)
+
+    def rebuild_scores(self, room_id):
+        """
+        Parameters:
+        room_id - Id of the room
+
+        Description:
+        Recomputes the score document of every player of a room from every
+        recorded answer and replaces the stored ones with them, along with any
+        scoreboard stored for the whole room by earlier versions.
+
+        Returns:
+        The recomputed scoreboard or None if the room does not exist
+        """
+        if not self.room_exists(room_id):
             return None
-        question_data = self.get_question(question_id)
-        options = question_data[QUESTION_OPTIONS_KEY]
+        question_responses = [self.get_question_responses(qid) for qid in self.get_question_list(room_id)]
+        player_scores = compute_player_scores([responses for responses in question_responses if responses != None])
+        db = firestore.client()
+        scores_ref = db.collection('scores').document(room_id)
+        players_path = "scores/%s/%s" % (room_id, SCORES_PLAYERS_KEY)
+        self.write_documents([(players_path, player, player_doc) for player, player_doc in player_scores.items()])
+        stale = [doc.reference for doc in scores_ref.collection(SCORES_PLAYERS_KEY).stream(timeout=rpc_timeout())
+            if doc.id not in player_scores]
+        stale.append(scores_ref)
+        for start in range(0, len(stale), MAX_BATCH_WRITES):
+            batch = db.batch()
+            for reference in stale[start:start + MAX_BATCH_WRITES]:
+                batch.delete(reference)
+            batch.commit(timeout=rpc_timeout())
+        return combine_player_scores(player_scores)
+
+    def get_pack_options(self, pack_entries):
+        """
+        Parameters:
+        pack_entries - List of references of question pack entries
+
+        Description:
+        Gets the options of pack entries from the packs in memory, and the
+        options of versions no longer loaded, such as those of an edited or
+        removed pack, from the options archived when the first question was
+        created from them, in one batched read.
+
+        Returns:
+        Dictionary of the options of each entry found
+        """
+        options = dict()
+        archived_ids = dict()
+        for pack_entry in pack_entries:
+            entry_options = question_packs.get_options(pack_entry)
+            if entry_options != None:
+                options[pack_entry] = entry_options
+            else:
+                archived_ids[pack_entry_id(pack_entry)] = pack_entry
+        if len(archived_ids) > 0:
+            archived = self.get_documents(PACK_ENTRIES_KEY, list(archived_ids), [QUESTION_OPTIONS_KEY])
+            for document_id, entry_data in archived.items():
+                options[archived_ids[document_id]] = entry_data.get(QUESTION_OPTIONS_KEY, None)
         return options
 
+    def get_question_options(self, question_id):
+        pack_entry = self.pack_entries.get(question_id, None)
+        if pack_entry != None:
+            return self.get_pack_options([pack_entry]).get(pack_entry, None)
+        db = firestore.client()
+        question_ref = db.collection('questions').document(question_id)
+        timeout = rpc_timeout()
+        question_doc = self._hedged(lambda: question_ref.get(
+            field_paths=[QUESTION_OPTIONS_KEY, QUESTION_PACK_ENTRY_KEY], timeout=timeout))
+        if not question_doc.exists:
+            return None
+        question_data = question_doc.to_dict()
+        pack_entry = question_data.get(QUESTION_PACK_ENTRY_KEY, None)
+        if pack_entry != None:
+            self._remember_pack_entry(question_id, pack_entry)
+            return self.get_pack_options([pack_entry]).get(pack_entry, None)
+        return question_options(question_data)
+
     def get_question_responses(self, question_id):
         if not self.question_exists(question_id):
             return None
         db = firestore.client()
-        response_ids = db.collection('questions').document(question_id).collection(QUESTION_RESPONSES_KEY).get()
+        response_ids = db.collection('questions').document(question_id).collection(QUESTION_RESPONSES_KEY) \
+            .get(timeout=rpc_timeout())
         question_doc = {el.id : el.to_dict()[RESPONSE_KEY_ID] for el in response_ids}
         return question_doc
         
 
-    def make_new_question(self, options):
+    def get_tallies(self, question_ids):
+        """
+        Parameters:
+        question_ids - Ids of the questions
+
+        Description:
+        Sums the tally shards of several questions in one batched read. Answers
+        counted on the question document by earlier versions are not included.
+
+        Returns:
+        Dictionary of the answer tallies of each question with answers
+        """
+        if len(question_ids) == 0:
+            return dict()
+        db = firestore.client()
+        refs = [db.collection('questions').document(question_id).collection(TALLY_SHARDS_KEY).document(str(shard))
+            for question_id in question_ids for shard in range(TALLY_SHARDS)]
+        timeout = rpc_timeout()
+        docs = self._hedged(lambda: list(db.get_all(refs, field_paths=[QUESTION_TALLIES_KEY], timeout=timeout)))
+        shards = dict()
+        for doc in docs:
+            if doc.exists:
+                shards.setdefault(doc.reference.parent.parent.id, []).append(doc.to_dict().get(QUESTION_TALLIES_KEY, {}))
+        return {question_id: sum_tallies(tallies_list) for question_id, tallies_list in shards.items()}
+
+    def get_untallied_responses(self, question_id):
+        """
+        Parameters:
+        question_id - Id of the question
+
+        Description:
+        Counts the answers to a question that its tally shards leave out, such as
+        answers recorded before tallies were kept. The responses and shards are
+        read in one transaction, so an answer recorded meanwhile is in both or in
+        neither and the count stays right as more answers come in.
+
+        Returns:
+        Dictionary of the count of each answer missing from the shards, None if
+        the question does not exist
+        """
+        if not self.question_exists(question_id):
+            return None
+        db = firestore.client()
+        question_ref = db.collection('questions').document(question_id)
+        shard_refs = [question_ref.collection(TALLY_SHARDS_KEY).document(str(shard)) for shard in range(TALLY_SHARDS)]
+
+        @firestore.transactional
+        def count_responses(transaction):
+            query = question_ref.collection(QUESTION_RESPONSES_KEY).select([RESPONSE_KEY_ID])
+            responses = {doc.id: doc.to_dict()[RESPONSE_KEY_ID] for doc in transaction.get(query, timeout=rpc_timeout())}
+            shards = [doc.to_dict().get(QUESTION_TALLIES_KEY, {})
+                for doc in transaction.get_all(shard_refs, timeout=rpc_timeout()) if doc.exists]
+            missing = {key: -count for key, count in sum_tallies(shards).items()}
+            return sum_tallies([tally_responses(responses), missing])
+
+        return count_responses(db.transaction(read_only=True))
+
+    def make_new_question(self, options, room_id=None, pack_entry=None):
+        """
+        Parameters:
+        options - List of the question's options
+        room_id - Id of the room the question is asked in
+        pack_entry - Versioned reference of the question pack entry the question
+        is created from, in which case only the reference is stored and options
+        is ignored
+
+        Returns:
+        Id of the new question
+        """
         new_id = self._get_new_question_id()
         empty_question = {
             QUESTION_ID_KEY: new_id,
-            QUESTION_OPTIONS_KEY: options,
+            ROOM_ID_KEY: room_id,
             TIME_START_KEY: time.time(),
+            QUESTION_TALLIES_KEY: {},
+            SCHEMA_VERSION_KEY: QUESTION_SCHEMA_VERSION,
             #QUESTION_RESPONSES_KEY: {}
         }
+        if pack_entry != None:
+            empty_question[QUESTION_PACK_ENTRY_KEY] = pack_entry
+        else:
+            empty_question[QUESTION_OPTIONS_KEY] = options
 
         if new_id == None:
             return None
         
+        if pack_entry != None:
+            self._archive_pack_entry(pack_entry)
         db = firestore.client()
         rooms_ref = db.collection('questions')
-        rooms_ref.document(new_id).set(empty_question)
+        rooms_ref.document(new_id).set(empty_question, timeout=rpc_timeout())
+        if pack_entry != None:
+            self._remember_pack_entry(new_id, pack_entry)
         return new_id
 
     def get_question(self, question_id):
-        if not self.question_exists(question_id):
-            return None
         db = firestore.client()
-        question_doc = db.collection('questions').document(question_id).get()
-        question_data = question_doc.to_dict()
-
-        return question_data
+        question_ref = db.collection('questions').document(question_id)
+        timeout = rpc_timeout()
+        question_doc = self._hedged(lambda: question_ref.get(timeout=timeout))
+        if not question_doc.exists:
+            return None
+        return question_doc.to_dict()
 
     def question_exists(self, question_id):
         db = firestore.client()
-        questions_ref = db.collection('questions')
-        return questions_ref.document(question_id).get().exists
+        question_ref = db.collection('questions').document(question_id)
+        timeout = rpc_timeout()
+        return self._hedged(lambda: question_ref.get(field_paths=[QUESTION_ID_KEY], timeout=timeout)).exists
 
     def get_active_question(self, room_id):
-        if not self.room_exists(room_id):
+        room_data = self._get_room_fields(room_id, [ACTIVE_QUESTION_KEY])
+        if room_data == None:
             return None
-        db = firestore.client()
-        room_data = self.get_room(room_id)
         return room_data[ACTIVE_QUESTION_KEY]
 
-    def get_question_list(self, room_id):
-        if not self.room_exists(room_id):
+    def get_question_list(self, room_id, limit=None, after=None):
+        """
+        Parameters:
+        room_id - Id of the room to check
+        limit - Maximum number of question ids to return, None for all of them
+        after - Question id to start after, None to start from the newest question
+
+        Description:
+        Gets a page of the question history of a room, newest question first.
+        The history is stored in a subcollection of the room so the room document
+        itself stays a fixed size. Rooms not migrated to schema version 2 can still
+        have older questions in the legacy all_questions array.
+
+        Returns:
+        List of question ids. Will be an empty list if the room does not exist
+        and None if the after cursor is not a question of this room.
+        """
+        room_data = self._get_room_fields(room_id, [ROOM_ID_KEY, SCHEMA_VERSION_KEY, LEGACY_QUESTION_LIST_KEY])
+        if room_data == None:
             return []
         db = firestore.client()
-        room_data = self.get_room(room_id)
-        return room_data[QUESTION_LIST_KEY]
+        history_ref = db.collection('rooms').document(room_id).collection(ROOM_QUESTIONS_KEY)
+        query = history_ref.order_by(TIME_START_KEY, direction=firestore.Query.DESCENDING)
+        if schema_version(room_data) < ROOM_SCHEMA_VERSION:
+            # Rooms that are not migrated yet can still have questions in the legacy array
+            history = [doc.id for doc in query.stream(timeout=rpc_timeout())]
+            legacy_history = room_data.get(LEGACY_QUESTION_LIST_KEY, [])
+            return page_history(merge_legacy_history(history, legacy_history), limit, after)
+        if after is not None:
+            cursor = history_ref.document(after).get(timeout=rpc_timeout())
+            if not cursor.exists:
+                return None
+            query = query.start_after(cursor)
+        if limit is not None:
+            query = query.limit(limit)
+        return [doc.id for doc in query.stream(timeout=rpc_timeout())]
+
+    def add_question_to_room(self, room_id, question_id):
+        """
+        Parameters:
+        room_id - Id of the room
+        question_id - Id of the question to record
+
+        Description:
+        Records a question in the question history of a room.
+
+        Returns:
+        The question id or None if the room does not exist
+        """
+        if not self.room_exists(room_id):
+            return None
+        db = firestore.client()
+        db.collection('rooms').document(room_id) \
+            .collection(ROOM_QUESTIONS_KEY) \
+            .document(question_id).set({QUESTION_ID_KEY: question_id, TIME_START_KEY: time.time()}, timeout=rpc_timeout())
+        return question_id
     
     def room_exists(self, room_id):
         """
@@ -148,9 +825,50 @@ class DatabaseManager:
         Returns:
         True if the room exists, false otherwise
         """
+        return self._get_room_fields(room_id, [ROOM_ID_KEY]) != None
+
+    def _get_room_fields(self, room_id, fields):
+        """
+        Parameters:
+        room_id - Identity of the room
+        fields - List of the room fields to read, None to read the whole document
+
+        Description:
+        Reads only the given fields of a room document so accessors that need a
+        single field do not download and deserialise the whole room.
+
+        Returns:
+        Dictionary of the requested fields or None if no room exists
+        """
+        if self.room_cache == None and self.replica == None:
+            return self._read_room(room_id, fields)
+        snapshot = self._get_room_snapshot(room_id)
+        return project_fields(snapshot[0], fields) if snapshot != None else None
+
+    def _get_room_snapshot(self, room_id):
+        if self.room_cache != None:
+            return self.room_cache.get(room_id, self._load_room)
+        return self._load_room(room_id)
+
+    def _load_room(self, room_id):
+        if self.replica != None:
+            return self.replica.get(room_id, self._read_room_snapshot)
+        return self._read_room_snapshot(room_id)
+
+    def _read_room_snapshot(self, room_id):
         db = firestore.client()
-        rooms_ref = db.collection('rooms')
-        return rooms_ref.document(room_id).get().exists
+        room_ref = db.collection('rooms').document(room_id)
+        timeout = rpc_timeout()
+        return room_snapshot(self._hedged(lambda: room_ref.get(timeout=timeout)))
+
+    def _read_room(self, room_id, fields=None):
+        db = firestore.client()
+        room_ref = db.collection('rooms').document(room_id)
+        timeout = rpc_timeout()
+        room_doc = self._hedged(lambda: room_ref.get(field_paths=fields, timeout=timeout))
+        if not room_doc.exists:
+            return None
+        return room_doc.to_dict()
 
     def _get_new_id(self):
         """
@@ -175,13 +893,25 @@ class DatabaseManager:
         Returns:
         the room data associated with a room or None if no room exists
         """
-        if self.room_exists(room_id):
-            db = firestore.client()
-            room_doc = db.collection('rooms').document(room_id).get()
-            room_data = room_doc.to_dict()
+        return self._get_room_fields(room_id, None)
 
-            return room_data
-        return None
+    def get_room_snapshot(self, room_id, fresh=False):
+        """
+        Parameters:
+        room_id - Identity of the room
+        fresh - True to read the room from the database even if it is cached
+
+        Description:
+        Gets the data associated with the given room along with its version, which
+        changes on every write to the room.
+
+        Returns:
+        Tuple of the room data and version or None if no room exists
+        """
+        snapshot = self._read_room_snapshot(room_id) if fresh else self._get_room_snapshot(room_id)
+        if snapshot == None:
+            return None
+        return dict(snapshot[0]), snapshot[1]
 
     def is_player_in_room(self, room_id, player_id):
         """
@@ -196,9 +926,10 @@ class DatabaseManager:
         True if the player is in the room, false if the player is not in the room.
         This will return None if the room does not exist or if there is another error. 
         """
-        if not self.room_exists(room_id):
+        current_players = self.get_players(room_id)
+        if current_players == None:
             return None
-        return player_id in self.get_players(room_id)        
+        return player_id in current_players
 
     def add_player(self, room_id, player_id):
         """
@@ -208,7 +939,9 @@ class DatabaseManager:
 
         Description:
         Adds a player to a given room. Will check to ensure that that player
-        is not already a member of that room. 
+        is not already a member of that room. The checks read the room in the
+        same transaction as the update, never from a cache, so concurrent joins
+        can neither drop a player nor fill the room past its maximum.
 
         Returns:
         If the player with the given ID
@@ -217,23 +950,23 @@ class DatabaseManager:
 
         If the player successfully joins the room, this will return the player's name
         """
-        if not self.room_exists(room_id):
-            return None
-        if self.is_player_in_room(room_id, player_id) or self.is_room_full(room_id):
-            return None
+        def join(room_data):
+            current_players = room_data.get(PLAYERS_KEY, [])
+            if player_id in current_players or len(current_players) >= room_capacity(room_data):
+                return None
+            return {PLAYERS_KEY: current_players + [player_id]}
 
-        current_players = self.get_players(room_id)
-        new_players = current_players + [player_id]
-        self.update_room(room_id, {PLAYERS_KEY: new_players})
+        if self._transact_room(room_id, [PLAYERS_KEY, MAX_PLAYERS_KEY], join) == None:
+            return None
         return player_id
 
     def _delete_collection(self, coll_ref, batch_size):
-        docs = coll_ref.limit(batch_size).stream()
+        docs = coll_ref.limit(batch_size).stream(timeout=rpc_timeout())
         deleted = 0
 
         for doc in docs:
             print(u'Deleting doc {} => {}'.format(doc.id, doc.to_dict()))
-            doc.reference.delete()
+            doc.reference.delete(timeout=rpc_timeout())
             deleted = deleted + 1
 
         if deleted >= batch_size:
@@ -246,17 +979,206 @@ class DatabaseManager:
         update_data - Data to update in the room object as dictionary
 
         Description:
-        Updates that data associated with a room_id.
+        Updates that data associated with a room_id. The room version is bumped
+        and the update logged in the room's change log in the same transaction.
         
         Returns:
         the room data associated with a room after the update or None if
         the room id is invalid
         """
+        if self._transact_room(room_id, [], lambda room_data: update_data) == None:
+            return None
+        return self.get_room(room_id)
+
+    def _transact_room(self, room_id, fields, make_update):
+        """
+        Parameters:
+        room_id - Identity of the room
+        fields - List of the room fields make_update needs
+        make_update - Function given the fields read in the transaction, returning
+            the update to make or None to leave the room as it is
+
+        Description:
+        Reads a room and writes the update made from it in one transaction,
+        bumping the room version and logging the update in the room's change
+        log. The transaction is retried from the read if the room is written
+        before it commits.
+
+        Returns:
+        The update made or None if the room does not exist or was left as it is.
+        Raises Aborted if every attempt lost to other writes of the room.
+        """
+        db = firestore.client()
+        room_ref = db.collection('rooms').document(room_id)
+
+        @firestore.transactional
+        def apply_update(transaction):
+            room_doc = room_ref.get(field_paths=fields + [ROOM_VERSION_KEY], transaction=transaction,
+                timeout=rpc_timeout())
+            if not room_doc.exists:
+                return None
+            room_data = room_doc.to_dict()
+            update_data = make_update(room_data)
+            if update_data == None:
+                return None
+            version = room_data.get(ROOM_VERSION_KEY, 0) + 1
+            transaction.update(room_ref, versioned_update(update_data, version))
+            self._log_room_change(transaction, room_ref, version, update_data)
+            return update_data
+
+        try:
+            return apply_update(db.transaction(max_attempts=MAX_ROOM_TRANSACTION_ATTEMPTS))
+        except ValueError as error:
+            if not isinstance(error.__cause__, Aborted):
+                raise
+            raise Aborted("Room %s has too many concurrent updates" % room_id) from error
+        finally:
+            self._invalidate_room(room_id)
+
+    def _log_room_change(self, write, room_ref, version, update_data):
+        # Adds the change record of a version to a batch or transaction, dropping
+        # the record that falls out of the change log
+        changes_ref = room_ref.collection(ROOM_CHANGES_KEY)
+        write.set(changes_ref.document(change_id(version)), change_record(version, update_data))
+        if version > MAX_ROOM_CHANGES:
+            write.delete(changes_ref.document(change_id(version - MAX_ROOM_CHANGES)))
+
+    def patch_room(self, room_id, update_data, snapshot, expected_version=None):
+        """
+        Parameters:
+        room_id - Identity of the room
+        update_data - Data to update in the room object as dictionary
+        snapshot - Room data and version from get_room_snapshot the update is based on
+        expected_version - Version the room must still be at, None to update it regardless
+
+        Description:
+        Updates a room without reading it back, the result is built by applying
+        the update to the snapshot it was based on. The update, the bump of the
+        room version counted from the snapshot and its change record are
+        committed together, only if the room is still at the snapshot's version.
+        Without expected_version a room written since the snapshot is read again
+        and the update retried.
+
+        Returns:
+        Tuple of the room data after the update and its new version, None if the
+        room does not exist. Raises VersionConflict if the room is no longer at
+        expected_version.
+        """
+        db = firestore.client()
+        room_ref = db.collection('rooms').document(room_id)
+        base_version = expected_version if expected_version != None else snapshot[1]
+        for _ in range(MAX_PATCH_RETRIES):
+            try:
+                last_update = DatetimeWithNanoseconds.from_rfc3339(base_version).timestamp_pb()
+            except ValueError:
+                raise VersionConflict(room_id)
+            version = snapshot[0].get(ROOM_VERSION_KEY, 0) + 1
+            batch = db.batch()
+            batch.update(room_ref, versioned_update(update_data, version),
+                option=db.write_option(last_update_time=last_update))
+            self._log_room_change(batch, room_ref, version, update_data)
+            try:
+                results = batch.commit(timeout=rpc_timeout())
+            except NotFound:
+                return None
+            except FailedPrecondition:
+                if expected_version != None:
+                    raise VersionConflict(room_id)
+                snapshot = self._read_room_snapshot(room_id)
+                if snapshot == None:
+                    return None
+                base_version = snapshot[1]
+                continue
+            finally:
+                self._invalidate_room(room_id)
+            return merge_update(snapshot[0], versioned_update(update_data, version)), results[0].update_time.rfc3339()
+        raise VersionConflict(room_id)
+
+    def get_room_changes(self, room_id, since):
+        """
+        Parameters:
+        room_id - Identity of the room
+        since - Room version the caller already has
+
+        Description:
+        Gets the changes made to a room after a version from its change log. The
+        change records are read by id in one batched read, and only when the
+        room is ahead of the caller.
+
+        Returns:
+        Tuple of the current room version and the list of change records after
+        since in version order, with None instead of the list when the change log
+        no longer reaches back to since. None if the room does not exist.
+        """
+        room_data = self._get_room_fields(room_id, [ROOM_VERSION_KEY])
+        if room_data == None:
+            return None
+        version = room_data.get(ROOM_VERSION_KEY, 0)
+        if since > version or version - since > MAX_ROOM_CHANGES:
+            return version, None
+        if since == version:
+            return version, []
+        db = firestore.client()
+        changes_ref = db.collection('rooms').document(room_id).collection(ROOM_CHANGES_KEY)
+        docs = db.get_all([changes_ref.document(change_id(change)) for change in range(since + 1, version + 1)],
+            timeout=rpc_timeout())
+        changes = sorted([doc.to_dict() for doc in docs if doc.exists], key=lambda change: change[CHANGE_VERSION_KEY])
+        if len(changes) < version - since:
+            return version, None
+        return version, changes
+
+    def get_presence(self, room_id):
+        """
+        Parameters:
+        room_id - Identity of the room
+
+        Description:
+        Gets the players of a room and the presence summaries flushed for it by
+        each instance.
+
+        Returns:
+        Tuple of the list of players and dictionary of summaries by instance id,
+        None if the room does not exist
+        """
+        room_data = self._get_room_fields(room_id, [PLAYERS_KEY])
+        if room_data == None:
+            return None
+        db = firestore.client()
+        presence_ref = db.collection(PRESENCE_KEY).document(room_id)
+        timeout = rpc_timeout()
+        presence_doc = self._hedged(lambda: presence_ref.get(timeout=timeout))
+        return room_data.get(PLAYERS_KEY, []), presence_doc.to_dict() if presence_doc.exists else {}
+
+    def set_presence(self, room_id, instance_id, summary, max_age=None):
+        """
+        Parameters:
+        room_id - Identity of the room
+        instance_id - Identity of the instance the summary is from
+        summary - Presence summary of the players seen by the instance
+        max_age - Seconds the summaries of instances that stopped writing are kept
+            for, None to keep them
+
+        Description:
+        Writes the presence summary of an instance to the room's presence
+        document without touching the summaries of other instances. Presence is
+        kept out of the room document so it neither grows the room nor changes
+        its version. Summaries older than max_age are dropped in the same write.
+
+        Returns:
+        The summary or None if the room does not exist
+        """
         if not self.room_exists(room_id):
             return None
         db = firestore.client()
-        db.collection('rooms').document(room_id).update(update_data)
-        return self.get_room(room_id)
+        presence_ref = db.collection(PRESENCE_KEY).document(room_id)
+        presence_doc = presence_ref.get(timeout=rpc_timeout())
+        summaries = presence_doc.to_dict() if presence_doc.exists else {}
+        update_data = {expired_id: firestore.DELETE_FIELD
+            for expired_id in expired_summaries(summaries, summary[PRESENCE_UPDATED_KEY], max_age)}
+        update_data[instance_id] = summary
+        # Merging only sets this instance's summary so concurrent flushes do not collide
+        presence_ref.set(update_data, merge=True, timeout=rpc_timeout())
+        return summary
     
     def delete_room(self, room_id):
         """
@@ -271,10 +1193,85 @@ class DatabaseManager:
         """
         if self.room_exists(room_id):
             db = firestore.client()
-            db.collection('rooms').document(room_id).delete()
+            room_ref = db.collection('rooms').document(room_id)
+            self._delete_collection(room_ref.collection(ROOM_QUESTIONS_KEY), 100)
+            self._delete_collection(room_ref.collection(ROOM_CHANGES_KEY), 100)
+            room_ref.delete(timeout=rpc_timeout())
+            scores_ref = db.collection('scores').document(room_id)
+            self._delete_collection(scores_ref.collection(SCORES_PLAYERS_KEY), 100)
+            scores_ref.delete(timeout=rpc_timeout())
+            db.collection(PRESENCE_KEY).document(room_id).delete(timeout=rpc_timeout())
+            self._invalidate_room(room_id)
+            if self.replica != None:
+                self.replica.remove(room_id)
             return True
         return False
 
+    def claim_request(self, request_id, fingerprint, lease):
+        """
+        Parameters:
+        request_id - Id of the record of a request sent with an idempotency key
+        fingerprint - Hash of the request
+        lease - Seconds the request has to finish before another request can claim its key
+
+        Description:
+        Creates the record of a request only if no record that has not expired
+        exists. An expired record is replaced only if no other request replaced
+        it first, so a single request across every instance claims the key.
+
+        Returns:
+        Tuple of the record of the request claiming the key and True if the
+        caller created it
+        """
+        db = firestore.client()
+        record_ref = db.collection(IDEMPOTENCY_KEY).document(request_id)
+        record = {REQUEST_FINGERPRINT_KEY: fingerprint, REQUEST_RESULT_KEY: None, REQUEST_EXPIRES_KEY: time.time() + lease}
+        while True:
+            try:
+                record_ref.create(record, timeout=rpc_timeout())
+                return record, True
+            except Conflict:
+                pass
+            record_doc = record_ref.get(timeout=rpc_timeout())
+            if not record_doc.exists:
+                continue
+            stored = record_doc.to_dict()
+            if stored[REQUEST_EXPIRES_KEY] > time.time():
+                return stored, False
+            try:
+                record_ref.update(record, option=db.write_option(last_update_time=record_doc.update_time.timestamp_pb()),
+                    timeout=rpc_timeout())
+                return record, True
+            except (FailedPrecondition, NotFound):
+                continue
+
+    def get_request(self, request_id):
+        """
+        Parameters:
+        request_id - Id of the record of a request sent with an idempotency key
+
+        Returns:
+        The record of the request or None if there is none
+        """
+        db = firestore.client()
+        record_doc = db.collection(IDEMPOTENCY_KEY).document(request_id).get(timeout=rpc_timeout())
+        return record_doc.to_dict() if record_doc.exists else None
+
+    def finish_request(self, request_id, result, ttl):
+        """
+        Parameters:
+        request_id - Id of the record of a request claimed with claim_request
+        result - Dictionary of the response to replay, None to drop the record so
+            the request can be retried
+        ttl - Seconds the response is replayed for
+        """
+        db = firestore.client()
+        record_ref = db.collection(IDEMPOTENCY_KEY).document(request_id)
+        if result == None:
+            record_ref.delete(timeout=rpc_timeout())
+            return
+        record_ref.update({REQUEST_RESULT_KEY: result, REQUEST_EXPIRES_KEY: time.time() + ttl}, timeout=rpc_timeout())
+
     def list_rooms(self):
         """
         Description:
@@ -285,10 +1282,143 @@ class DatabaseManager:
         """
         db = firestore.client()
         rooms_ref = db.collection('rooms')
-        rooms = [doc.id for doc in rooms_ref.get()]
+        rooms = [doc.id for doc in rooms_ref.get(timeout=rpc_timeout())]
 
         return rooms
 
+    def stream_documents(self, path, page_size=100, after=None):
+        """
+        Parameters:
+        path - Path of the collection, such as 'rooms' or 'questions/<id>/responses'
+        page_size - Number of documents read per query
+        after - Document id to start after, None to start from the beginning
+
+        Description:
+        Iterates through every document of a collection in document id order,
+        reading one page at a time so memory use does not grow with the collection.
+
+        Returns:
+        Generator of (document id, document data) tuples
+        """
+        db = firestore.client()
+        query = db.collection(path).order_by(FieldPath.document_id()).limit(page_size)
+        while True:
+            page_query = query if after == None else query.start_after({FieldPath.document_id(): after})
+            page = [(doc.id, doc.to_dict()) for doc in page_query.stream(timeout=rpc_timeout())]
+            for document in page:
+                yield document
+            if len(page) < page_size:
+                return
+            after = page[-1][0]
+
+    def get_documents(self, path, document_ids, fields=None):
+        """
+        Parameters:
+        path - Path of the collection
+        document_ids - Ids of the documents to read
+        fields - List of the fields to read, None to read the whole documents
+
+        Description:
+        Reads several documents of a collection with a single batched read.
+
+        Returns:
+        Dictionary of document data by id, documents that do not exist are left out
+        """
+        if len(document_ids) == 0:
+            return dict()
+        db = firestore.client()
+        collection_ref = db.collection(path)
+        refs = [collection_ref.document(document_id) for document_id in document_ids]
+        timeout = rpc_timeout()
+        docs = self._hedged(lambda: list(db.get_all(refs, field_paths=fields, timeout=timeout)))
+        return {doc.id: doc.to_dict() for doc in docs if doc.exists}
+
+    def write_documents(self, writes):
+        """
+        Parameters:
+        writes - List of (collection path, document id, document data) tuples
+
+        Description:
+        Sets documents with as few batched commits as possible.
+
+        Returns:
+        Number of batches committed
+        """
+        db = firestore.client()
+        commits = 0
+        for start in range(0, len(writes), MAX_BATCH_WRITES):
+            batch = db.batch()
+            for path, document_id, data in writes[start:start + MAX_BATCH_WRITES]:
+                batch.set(db.collection(path).document(document_id), data)
+            batch.commit(timeout=rpc_timeout())
+            commits += 1
+        for path, document_id, _ in writes:
+            if path == 'rooms':
+                self._invalidate_room(document_id)
+        return commits
+
+    def get_page(self, path, page_size=100, after=None):
+        """
+        Parameters:
+        path - Path of the collection
+        page_size - Maximum number of documents to read
+        after - Document id to start after, None to start from the beginning
+
+        Description:
+        Reads a page of a collection in document id order along with the version
+        of each document, to be passed to patch_documents.
+
+        Returns:
+        List of (document id, document data, version) tuples
+        """
+        db = firestore.client()
+        query = db.collection(path).order_by(FieldPath.document_id()).limit(page_size)
+        if after != None:
+            query = query.start_after({FieldPath.document_id(): after})
+        return [(doc.id, doc.to_dict(), doc.update_time.rfc3339()) for doc in query.stream(timeout=rpc_timeout())]
+
+    def patch_documents(self, path, patches, writes=[]):
+        """
+        Parameters:
+        path - Path of the collection of the patched documents
+        patches - List of (document id, fields to set, fields to delete, version) tuples,
+            the version from get_page or None to patch the document regardless
+        writes - List of (collection path, document id, document data) tuples to set
+            in the same commit
+
+        Description:
+        Updates fields of several documents in a single batched commit, as long as
+        none of them changed since they were read.
+
+        Returns:
+        Number of documents patched. Raises VersionConflict if a document is no
+        longer at its version, in which case nothing is written.
+        """
+        if len(patches) + len(writes) > MAX_BATCH_WRITES:
+            raise ValueError("At most %d writes fit in a batch" % MAX_BATCH_WRITES)
+        db = firestore.client()
+        batch = db.batch()
+        for write_path, document_id, data in writes:
+            batch.set(db.collection(write_path).document(document_id), data)
+        for document_id, set_fields, delete_fields, version in patches:
+            update_data = dict(set_fields)
+            for field in delete_fields:
+                update_data[field] = firestore.DELETE_FIELD
+            option = None
+            if version != None:
+                last_update = DatetimeWithNanoseconds.from_rfc3339(version).timestamp_pb()
+                option = db.write_option(last_update_time=last_update)
+            batch.update(db.collection(path).document(document_id), update_data, option=option)
+        try:
+            batch.commit(timeout=rpc_timeout())
+        except (FailedPrecondition, NotFound):
+            raise VersionConflict(path)
+        finally:
+            if path == 'rooms':
+                for document_id, _, _, _ in patches:
+                    self._invalidate_room(document_id)
+        return len(patches)
+
     def is_room_full(self, room_id):
         """
         Parameters:
@@ -302,13 +1432,10 @@ class DatabaseManager:
         True if the room is full, false otherwise. If there is an error
         if the room does not exist, this will return None.
         """
-        if not self.room_exists(room_id):
+        room_data = self._get_room_fields(room_id, [PLAYERS_KEY, MAX_PLAYERS_KEY])
+        if room_data == None:
             return None
-        room_data = self.get_room(room_id)
-        max_players = room_data[MAX_PLAYERS_KEY]
-        num_players = self.get_num_player_in_room(room_id)
-
-        return num_players >= max_players
+        return len(room_data[PLAYERS_KEY]) >= room_capacity(room_data)
 
     def get_num_player_in_room(self, room_id):
         """
@@ -322,7 +1449,8 @@ class DatabaseManager:
         Number of players in a given room. If the room does not exist or another error
         occurs, this will return none.
         """
-        return len(self.get_players(room_id)) if self.room_exists(room_id) else None
+        current_players = self.get_players(room_id)
+        return len(current_players) if current_players != None else None
 
     def get_players(self, room_id):
         """
@@ -336,9 +1464,10 @@ class DatabaseManager:
         List of all players in a room. Will be an empty list if the room is empty.
         Will return None if something went wrong.
         """
-        if not self.room_exists(room_id):
+        room_data = self._get_room_fields(room_id, [PLAYERS_KEY])
+        if room_data == None:
             return None
-        return self.get_room(room_id)[PLAYERS_KEY]
+        return room_data[PLAYERS_KEY]
 
     def create_room(self):
         """
@@ -352,12 +1481,13 @@ class DatabaseManager:
         empty_room = {
             ROOM_ID_KEY: new_id,
             ROOM_STATUS_KEY: "lobby",
-            ROOM_TYPE_KEY: "game",
+            ROOM_TYPE_KEY: DEFAULT_ROOM_TYPE,
             TIME_START_KEY: time.time(),
-            MAX_PLAYERS_KEY: 999,
+            MAX_PLAYERS_KEY: DEFAULT_MAX_PLAYERS,
             PLAYERS_KEY: [],
-            QUESTION_LIST_KEY: [],
             ACTIVE_QUESTION_KEY: "",
+            SCHEMA_VERSION_KEY: ROOM_SCHEMA_VERSION,
+            ROOM_VERSION_KEY: 0,
         }
 
         if new_id == None:
@@ -365,15 +1495,237 @@ class DatabaseManager:
         
         db = firestore.client()
         rooms_ref = db.collection('rooms')
-        rooms_ref.document(new_id).set(empty_room)
+        rooms_ref.document(new_id).set(empty_room, timeout=rpc_timeout())
+        self._invalidate_room(new_id)
         return new_id
 
+    def _get_new_ids(self, count):
+        """
+        Description:
+        Gets up to count new, available ids, checking candidates with batched reads
+        """
+        db = firestore.client()
+        rooms_ref = db.collection('rooms')
+        id_generator = room_id_generator()
+        new_ids = []
+        while len(new_ids) < count:
+            candidates = [room_id for _, room_id in zip(range(count - len(new_ids)), id_generator)]
+            if len(candidates) == 0:
+                break
+            docs = db.get_all([rooms_ref.document(room_id) for room_id in candidates], field_paths=[ROOM_ID_KEY],
+                timeout=rpc_timeout())
+            taken = set([doc.id for doc in docs if doc.exists])
+            new_ids += [room_id for room_id in candidates if room_id not in taken]
+        return new_ids
+
+    def create_rooms(self, count, max_players=DEFAULT_MAX_PLAYERS, room_type=DEFAULT_ROOM_TYPE):
+        """
+        Parameters:
+        count - Number of rooms to create
+        max_players - Max players of each room
+        room_type - Type of each room
+
+        Description:
+        Creates many rooms at once. Ids are allocated and rooms are written in
+        batches of up to MAX_BATCH_WRITES, so each batch costs one batched read
+        and one commit. A batch is drawn again if another instance took one of
+        its ids in the meantime.
+
+        Returns:
+        List of the ids of the new rooms, shorter than count if the ids ran out
+        """
+        db = firestore.client()
+        rooms_ref = db.collection('rooms')
+        created = []
+        while len(created) < count:
+            new_ids = self._get_new_ids(min(count - len(created), MAX_BATCH_WRITES))
+            if len(new_ids) == 0:
+                break
+            batch = db.batch()
+            for room_id in new_ids:
+                batch.create(rooms_ref.document(room_id), {
+                    ROOM_ID_KEY: room_id,
+                    ROOM_STATUS_KEY: "lobby",
+                    ROOM_TYPE_KEY: room_type,
+                    TIME_START_KEY: time.time(),
+                    MAX_PLAYERS_KEY: max_players,
+                    PLAYERS_KEY: [],
+                    ACTIVE_QUESTION_KEY: "",
+                    SCHEMA_VERSION_KEY: ROOM_SCHEMA_VERSION,
+                    ROOM_VERSION_KEY: 0,
+                })
+            try:
+                batch.commit(timeout=rpc_timeout())
+            except Conflict:
+                continue
+            for room_id in new_ids:
+                self._invalidate_room(room_id)
+            created += new_ids
+        return created
+
+@trace_calls
+@guard_calls
 class TestDatabaseManager:
     def __init__(self):
-        self.rooms = dict()
+        self.breaker = None
+        self.faults = None
+        self.lock = threading.Lock()
+        self._reset()
 
     def _reset(self):
+        self.requests = dict()
         self.rooms = dict()
+        self.questions = dict()
+        self.tally_shards = dict()
+        self.room_questions = dict()
+        self.scores = dict()
+        self.legacy_scores = dict()
+        self.versions = dict()
+        self.room_changes = dict()
+        self.presence = dict()
+        self.documents = dict()
+
+    def _get_new_question_id(self):
+        qid = get_uuid()
+        while self.question_exists(qid):
+            qid = get_uuid()
+        return qid
+
+    def set_question_response(self, question_id, user_id, response):
+        if not self.question_exists(question_id):
+            return None
+        responses = self.questions[question_id][QUESTION_RESPONSES_KEY]
+        room_id = self.questions[question_id][ROOM_ID_KEY]
+        previous = responses.get(user_id, None)
+        if room_id in self.scores:
+            deltas = player_deltas(user_id, previous, response, responses)
+            if deltas[PLAYER_ANSWERED_KEY] != 0 or len(deltas[PLAYER_PAIRS_KEY]) > 0:
+                player_scores = self.scores[room_id].setdefault(user_id, {})
+                apply_player_deltas(player_scores, deltas)
+        shard = self.tally_shards.setdefault(question_id, {}).setdefault(tally_shard(user_id), {QUESTION_TALLIES_KEY: {}})
+        tallies = shard[QUESTION_TALLIES_KEY]
+        if previous != response:
+            tallies[tally_key(response)] = tallies.get(tally_key(response), 0) + 1
+            if previous != None:
+                tallies[tally_key(previous)] = tallies.get(tally_key(previous), 0) - 1
+        responses[user_id] = response
+        return response
+
+    def get_scores(self, room_id):
+        if not self.room_exists(room_id):
+            return None
+        return combine_player_scores(self.scores[room_id], self.legacy_scores.get(room_id, None))
+
+    def rebuild_scores(self, room_id):
+        if not self.room_exists(room_id):
+            return None
+        question_responses = [self.get_question_responses(qid) for qid in self.get_question_list(room_id)]
+        self.scores[room_id] = compute_player_scores([responses for responses in question_responses if responses != None])
+        self.legacy_scores.pop(room_id, None)
+        return self.get_scores(room_id)
+
+    def get_pack_options(self, pack_entries):
+        archived = self.documents.get(PACK_ENTRIES_KEY, dict())
+        options = dict()
+        for pack_entry in pack_entries:
+            entry_options = question_packs.get_options(pack_entry)
+            if entry_options == None and pack_entry_id(pack_entry) in archived:
+                entry_options = list(archived[pack_entry_id(pack_entry)][QUESTION_OPTIONS_KEY])
+            if entry_options != None:
+                options[pack_entry] = entry_options
+        return options
+
+    def get_question_options(self, question_id):
+        if not self.question_exists(question_id):
+            return None
+        pack_entry = self.questions[question_id].get(QUESTION_PACK_ENTRY_KEY, None)
+        if pack_entry != None:
+            return self.get_pack_options([pack_entry]).get(pack_entry, None)
+        return question_options(self.questions[question_id])
+
+    def get_question_responses(self, question_id):
+        if not self.question_exists(question_id):
+            return None
+        return dict(self.questions[question_id][QUESTION_RESPONSES_KEY])
+
+    def get_tallies(self, question_ids):
+        return {question_id: sum_tallies([shard[QUESTION_TALLIES_KEY] for shard in self.tally_shards[question_id].values()])
+            for question_id in question_ids if question_id in self.tally_shards}
+
+    def get_untallied_responses(self, question_id):
+        if not self.question_exists(question_id):
+            return None
+        shards = self.get_tallies([question_id]).get(question_id, {})
+        missing = {key: -count for key, count in shards.items()}
+        return sum_tallies([tally_responses(self.questions[question_id][QUESTION_RESPONSES_KEY]), missing])
+
+    def make_new_question(self, options, room_id=None, pack_entry=None):
+        new_id = self._get_new_question_id()
+        self.questions[new_id] = {
+            QUESTION_ID_KEY: new_id,
+            ROOM_ID_KEY: room_id,
+            TIME_START_KEY: time.time(),
+            QUESTION_TALLIES_KEY: {},
+            SCHEMA_VERSION_KEY: QUESTION_SCHEMA_VERSION,
+            QUESTION_RESPONSES_KEY: {},
+        }
+        if pack_entry != None:
+            self.questions[new_id][QUESTION_PACK_ENTRY_KEY] = pack_entry
+            self.documents.setdefault(PACK_ENTRIES_KEY, dict())[pack_entry_id(pack_entry)] = \
+                {QUESTION_OPTIONS_KEY: question_packs.get_options(pack_entry)}
+        else:
+            self.questions[new_id][QUESTION_OPTIONS_KEY] = options
+        return new_id
+
+    def get_question(self, question_id):
+        if not self.question_exists(question_id):
+            return None
+        question_data = dict(self.questions[question_id])
+        del question_data[QUESTION_RESPONSES_KEY]
+        return question_data
+
+    def question_exists(self, question_id):
+        return question_id in self.questions
+
+    def get_active_question(self, room_id):
+        room_data = self._get_room_fields(room_id, [ACTIVE_QUESTION_KEY])
+        if room_data == None:
+            return None
+        return room_data[ACTIVE_QUESTION_KEY]
+
+    def get_question_list(self, room_id, limit=None, after=None):
+        """
+        Parameters:
+        room_id - Id of the room to check
+        limit - Maximum number of question ids to return, None for all of them
+        after - Question id to start after, None to start from the newest question
+        Description:
+        Gets a page of the question history of a room, newest question first.
+        Returns:
+        List of question ids. Will be an empty list if the room does not exist
+        and None if the after cursor is not a question of this room.
+        """
+        if not self.room_exists(room_id):
+            return []
+        history = self.room_questions[room_id]
+        if schema_version(self.rooms[room_id]) < ROOM_SCHEMA_VERSION:
+            history = merge_legacy_history(history, self.rooms[room_id].get(LEGACY_QUESTION_LIST_KEY, []))
+        return page_history(history, limit, after)
+
+    def add_question_to_room(self, room_id, question_id):
+        """
+        Parameters:
+        room_id - Id of the room
+        question_id - Id of the question to record
+        Description:
+        Records a question in the question history of a room.
+        Returns:
+        The question id or None if the room does not exist
+        """
+        if not self.room_exists(room_id):
+            return None
+        self.room_questions[room_id].insert(0, question_id)
+        return question_id
 
     def room_exists(self, room_id):
         """
@@ -386,6 +1738,20 @@ class TestDatabaseManager:
         """
         return room_id in self.rooms
 
+    def _get_room_fields(self, room_id, fields):
+        """
+        Parameters:
+        room_id - Identity of the room
+        fields - List of the room fields to read, None to read the whole document
+        Description:
+        Reads only the given fields of a room document.
+        Returns:
+        Dictionary of the requested fields or None if no room exists
+        """
+        if room_id not in self.rooms:
+            return None
+        return project_fields(self.rooms[room_id], fields)
+
     def _get_new_id(self):
         """
         Description:
@@ -408,9 +1774,7 @@ class TestDatabaseManager:
         Returns:
         the room data associated with a room or None if no room exists
         """
-        if self.room_exists(room_id):
-            return self.rooms[room_id]
-        return None
+        return self._get_room_fields(room_id, None)
 
     def is_player_in_room(self, room_id, player_id):
         """
@@ -423,10 +1787,10 @@ class TestDatabaseManager:
         True if the player is in the room, false if the player is not in the room.
         This will return None if the room does not exist or if there is another error. 
         """
-        if not self.room_exists(room_id):
-            return None
         current_players = self.get_players(room_id)
-        return player_id in current_players        
+        if current_players == None:
+            return None
+        return player_id in current_players
 
     def add_player(self, room_id, player_id):
         """
@@ -442,12 +1806,13 @@ class TestDatabaseManager:
         players this will return None. If any other error occurs, this will return None.
         If the player successfully joins the room, this will return the player's name
         """
-        if not self.room_exists(room_id):
+        room_data = self._get_room_fields(room_id, [PLAYERS_KEY, MAX_PLAYERS_KEY])
+        if room_data == None:
             return None
-        if self.is_player_in_room(room_id, player_id) or self.is_room_full(room_id):
+        current_players = room_data[PLAYERS_KEY]
+        if player_id in current_players or len(current_players) >= room_capacity(room_data):
             return None
 
-        current_players = self.get_players(room_id)
         new_players = current_players + [player_id]
         self.update_room(room_id, {PLAYERS_KEY: new_players})
         return player_id
@@ -466,9 +1831,51 @@ class TestDatabaseManager:
         """
         if not self.room_exists(room_id):
             return None
-        for elem in update_data:
-            self.rooms[room_id][elem] = update_data[elem]
-        return self.rooms[room_id]
+        version = self.rooms[room_id].get(ROOM_VERSION_KEY, 0) + 1
+        self.rooms[room_id] = merge_update(self.rooms[room_id], versioned_update(update_data, version))
+        self.versions[room_id] += 1
+        changes = self.room_changes.setdefault(room_id, [])
+        changes.append(change_record(version, copy.deepcopy(update_data)))
+        del changes[:-MAX_ROOM_CHANGES]
+        return self.get_room(room_id)
+
+    def get_room_snapshot(self, room_id, fresh=False):
+        if room_id not in self.rooms:
+            return None
+        return copy.deepcopy(self.rooms[room_id]), str(self.versions[room_id])
+
+    def patch_room(self, room_id, update_data, snapshot, expected_version=None):
+        if not self.room_exists(room_id):
+            return None
+        if expected_version != None and expected_version != str(self.versions[room_id]):
+            raise VersionConflict(room_id)
+        self.update_room(room_id, update_data)
+        return merge_update(snapshot[0], versioned_update(update_data, self.rooms[room_id][ROOM_VERSION_KEY])), \
+            str(self.versions[room_id])
+
+    def get_room_changes(self, room_id, since):
+        if room_id not in self.rooms:
+            return None
+        version = self.rooms[room_id].get(ROOM_VERSION_KEY, 0)
+        changes = [copy.deepcopy(change) for change in self.room_changes.get(room_id, [])
+            if change[CHANGE_VERSION_KEY] > since]
+        if since > version or len(changes) < version - since:
+            return version, None
+        return version, changes
+
+    def get_presence(self, room_id):
+        if room_id not in self.rooms:
+            return None
+        return list(self.rooms[room_id].get(PLAYERS_KEY, [])), copy.deepcopy(self.presence.get(room_id, {}))
+
+    def set_presence(self, room_id, instance_id, summary, max_age=None):
+        if room_id not in self.rooms:
+            return None
+        summaries = self.presence.setdefault(room_id, dict())
+        for expired_id in expired_summaries(summaries, summary[PRESENCE_UPDATED_KEY], max_age):
+            del summaries[expired_id]
+        summaries[instance_id] = copy.deepcopy(summary)
+        return summary
     
     def delete_room(self, room_id):
         """
@@ -482,9 +1889,36 @@ class TestDatabaseManager:
         """
         if self.room_exists(room_id):
             del self.rooms[room_id]
+            del self.room_questions[room_id]
+            del self.scores[room_id]
+            self.legacy_scores.pop(room_id, None)
+            del self.versions[room_id]
+            self.room_changes.pop(room_id, None)
+            self.presence.pop(room_id, None)
             return True
         return False
 
+    def claim_request(self, request_id, fingerprint, lease):
+        with self.lock:
+            stored = self.requests.get(request_id, None)
+            if stored != None and stored[REQUEST_EXPIRES_KEY] > time.time():
+                return copy.deepcopy(stored), False
+            record = {REQUEST_FINGERPRINT_KEY: fingerprint, REQUEST_RESULT_KEY: None, REQUEST_EXPIRES_KEY: time.time() + lease}
+            self.requests[request_id] = record
+            return copy.deepcopy(record), True
+
+    def get_request(self, request_id):
+        with self.lock:
+            return copy.deepcopy(self.requests.get(request_id, None))
+
+    def finish_request(self, request_id, result, ttl):
+        with self.lock:
+            if result == None:
+                self.requests.pop(request_id, None)
+            elif request_id in self.requests:
+                self.requests[request_id][REQUEST_RESULT_KEY] = copy.deepcopy(result)
+                self.requests[request_id][REQUEST_EXPIRES_KEY] = time.time() + ttl
+
     def list_rooms(self):
         """
         Description:
@@ -494,6 +1928,96 @@ class TestDatabaseManager:
         """
         return list(self.rooms.keys())
 
+    def _collection(self, path):
+        # Maps a collection path onto the in-memory tables as a dictionary of documents
+        parts = path.split("/")
+        if path == 'rooms':
+            return self.rooms
+        if path == 'questions':
+            return {qid: self.get_question(qid) for qid in self.questions}
+        if path == 'scores':
+            return self.legacy_scores
+        if len(parts) == 3 and parts[0] == 'scores' and parts[2] == SCORES_PLAYERS_KEY:
+            return self.scores.get(parts[1], dict())
+        if len(parts) == 3 and parts[0] == 'rooms' and parts[2] == ROOM_QUESTIONS_KEY:
+            return {qid: {QUESTION_ID_KEY: qid, TIME_START_KEY: self.questions[qid][TIME_START_KEY]}
+                for qid in self.room_questions.get(parts[1], [])}
+        if len(parts) == 3 and parts[0] == 'questions' and parts[2] == TALLY_SHARDS_KEY:
+            return self.tally_shards.get(parts[1], dict())
+        if len(parts) == 3 and parts[0] == 'questions' and parts[2] == QUESTION_RESPONSES_KEY:
+            responses = self.get_question_responses(parts[1]) or dict()
+            return {user_id: {RESPONSE_KEY_ID: responses[user_id]} for user_id in responses}
+        return self.documents.get(path, dict())
+
+    def stream_documents(self, path, page_size=100, after=None):
+        documents = self._collection(path)
+        for document_id in sorted(documents):
+            if after == None or document_id > after:
+                yield document_id, dict(documents[document_id])
+
+    def get_documents(self, path, document_ids, fields=None):
+        documents = self._collection(path)
+        return {document_id: project_fields(documents[document_id], fields)
+            for document_id in document_ids if document_id in documents}
+
+    def write_documents(self, writes):
+        for path, document_id, data in writes:
+            parts = path.split("/")
+            if path == 'rooms':
+                self.rooms[document_id] = dict(data)
+                self.versions[document_id] = self.versions.get(document_id, 0) + 1
+                self.room_questions.setdefault(document_id, [])
+                self.scores.setdefault(document_id, dict())
+            elif path == 'questions':
+                responses = self.questions.get(document_id, {}).get(QUESTION_RESPONSES_KEY, {})
+                self.questions[document_id] = dict(data, **{QUESTION_RESPONSES_KEY: responses})
+            elif path == 'scores':
+                self.legacy_scores[document_id] = copy.deepcopy(data)
+            elif parts[0] == 'scores':
+                self.scores.setdefault(parts[1], dict())[document_id] = copy.deepcopy(data)
+            elif parts[0] == 'rooms':
+                history = self.room_questions.setdefault(parts[1], [])
+                if document_id not in history:
+                    history.append(document_id)
+                history.sort(key=lambda qid: -self.questions[qid][TIME_START_KEY] if qid in self.questions else 0)
+            elif parts[0] == 'questions' and parts[2] == TALLY_SHARDS_KEY:
+                self.tally_shards.setdefault(parts[1], dict())[document_id] = copy.deepcopy(data)
+            elif parts[0] == 'questions':
+                self.questions[parts[1]][QUESTION_RESPONSES_KEY][document_id] = data[RESPONSE_KEY_ID]
+            else:
+                self.documents.setdefault(path, dict())[document_id] = dict(data)
+        return (len(writes) + MAX_BATCH_WRITES - 1) // MAX_BATCH_WRITES
+
+    def get_page(self, path, page_size=100, after=None):
+        documents = self._collection(path)
+        document_ids = sorted(document_id for document_id in documents if after == None or document_id > after)
+        return [(document_id, copy.deepcopy(documents[document_id]), self._version(path, document_id))
+            for document_id in document_ids[:page_size]]
+
+    def _version(self, path, document_id):
+        if path == 'rooms':
+            return str(self.versions[document_id])
+        if path == 'questions':
+            return str(hash(json.dumps(self.questions[document_id], sort_keys=True, default=str)))
+        return None
+
+    def patch_documents(self, path, patches, writes=[]):
+        if len(patches) + len(writes) > MAX_BATCH_WRITES:
+            raise ValueError("At most %d writes fit in a batch" % MAX_BATCH_WRITES)
+        documents = self.rooms if path == 'rooms' else self.questions if path == 'questions' else self.documents.get(path, {})
+        for document_id, _, _, version in patches:
+            if document_id not in documents or (version != None and version != self._version(path, document_id)):
+                raise VersionConflict(path)
+        self.write_documents(writes)
+        for document_id, set_fields, delete_fields, _ in patches:
+            data = documents[document_id]
+            data.update(copy.deepcopy(set_fields))
+            for field in delete_fields:
+                data.pop(field, None)
+            if path == 'rooms':
+                self.versions[document_id] += 1
+        return len(patches)
+
     def is_room_full(self, room_id):
         """
         Parameters:
@@ -505,13 +2029,10 @@ class TestDatabaseManager:
         True if the room is full, false otherwise. If there is an error
         if the room does not exist, this will return None.
         """
-        if not self.room_exists(room_id):
+        room_data = self._get_room_fields(room_id, [PLAYERS_KEY, MAX_PLAYERS_KEY])
+        if room_data == None:
             return None
-        room_data = self.get_room(room_id)
-        max_players = room_data[MAX_PLAYERS_KEY]
-        num_players = self.get_num_player_in_room(room_id)
-
-        return num_players >= max_players
+        return len(room_data[PLAYERS_KEY]) >= room_capacity(room_data)
 
     def get_num_player_in_room(self, room_id):
         """
@@ -523,8 +2044,8 @@ class TestDatabaseManager:
         Number of players in a given room. If the room does not exist or another error
         occurs, this will return none.
         """
-        return len(self.get_players(room_id)) if self.room_exists(room_id) else None
-
+        current_players = self.get_players(room_id)
+        return len(current_players) if current_players != None else None
 
     def get_players(self, room_id):
         """
@@ -536,9 +2057,10 @@ class TestDatabaseManager:
         List of all players in a room. Will be an empty list if the room is empty.
         Will return None if something went wrong.
         """
-        if not self.room_exists(room_id):
+        room_data = self._get_room_fields(room_id, [PLAYERS_KEY])
+        if room_data == None:
             return None
-        return self.get_room(room_id)[PLAYERS_KEY]
+        return room_data[PLAYERS_KEY]
 
     def create_room(self):
         """
@@ -552,18 +2074,35 @@ class TestDatabaseManager:
         empty_room = {
             ROOM_ID_KEY: new_id,
             ROOM_STATUS_KEY: "lobby",
-            ROOM_TYPE_KEY: "game",
+            ROOM_TYPE_KEY: DEFAULT_ROOM_TYPE,
             TIME_START_KEY: str(time.time()),
-            MAX_PLAYERS_KEY: 999,
+            MAX_PLAYERS_KEY: DEFAULT_MAX_PLAYERS,
             PLAYERS_KEY: [],
+            ACTIVE_QUESTION_KEY: "",
+            SCHEMA_VERSION_KEY: ROOM_SCHEMA_VERSION,
+            ROOM_VERSION_KEY: 0,
         }
 
         if new_id == None:
             return None
         
         self.rooms[new_id] = empty_room
+        self.room_questions[new_id] = []
+        self.scores[new_id] = dict()
+        self.versions[new_id] = 1
         return new_id
 
+    def create_rooms(self, count, max_players=DEFAULT_MAX_PLAYERS, room_type=DEFAULT_ROOM_TYPE):
+        created = []
+        while len(created) < count:
+            new_id = self.create_room()
+            if new_id == None:
+                break
+            self.rooms[new_id][MAX_PLAYERS_KEY] = max_players
+            self.rooms[new_id][ROOM_TYPE_KEY] = room_type
+            created.append(new_id)
+        return created
+
 class DatabaseContainer:
     def __init__(self):
         self.database = DatabaseManager()
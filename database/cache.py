@@ -0,0 +1,93 @@
+import threading
+import time
+
+class _Flight:
+    def __init__(self):
+        self.invalidated = False
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+
+class MicroCache:
+    """
+    Description:
+    Cache holding values for a short ttl, shared by every request on an
+    instance. Concurrent misses for the same key wait on a single load instead
+    of each loading the value themselves.
+    """
+    def __init__(self, ttl, max_entries=10000):
+        """
+        Parameters:
+        ttl - Seconds a loaded value is served for
+        max_entries - Number of entries above which expired entries are purged
+        """
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.values = dict()
+        self.flights = dict()
+        self.lock = threading.Lock()
+
+    def get(self, key, load):
+        """
+        Parameters:
+        key - Key of the value
+        load - Function loading the value for the key on a miss
+
+        Description:
+        Gets a value from the cache, loading it when missing or expired. If a load
+        for the key is already running the caller waits for its result.
+
+        Returns:
+        The cached or loaded value
+        """
+        with self.lock:
+            cached = self.values.get(key, None)
+            if cached != None and cached[1] > time.time():
+                return cached[0]
+            flight = self.flights.get(key, None)
+            leader = flight == None
+            if leader:
+                flight = _Flight()
+                self.flights[key] = flight
+
+        if not leader:
+            flight.done.wait()
+            if flight.error != None:
+                raise flight.error
+            return flight.value
+
+        try:
+            flight.value = load(key)
+        except Exception as error:
+            flight.error = error
+            raise
+        finally:
+            with self.lock:
+                if self.flights.get(key, None) is flight:
+                    del self.flights[key]
+                # Values loaded before an invalidation are not kept
+                if flight.error == None and not flight.invalidated:
+                    self._store(key, flight.value)
+            flight.done.set()
+        return flight.value
+
+    def invalidate(self, key):
+        """
+        Parameters:
+        key - Key of the value
+
+        Description:
+        Drops the cached value for a key. Loads already running for the key are
+        not cached and later reads start a new load.
+        """
+        with self.lock:
+            self.values.pop(key, None)
+            flight = self.flights.pop(key, None)
+            if flight != None:
+                flight.invalidated = True
+
+    def _store(self, key, value):
+        now = time.time()
+        if len(self.values) >= self.max_entries:
+            self.values = {k: cached for k, cached in self.values.items() if cached[1] > now}
+        self.values[key] = (value, now + self.ttl)
@@ -0,0 +1,170 @@
+from collections import OrderedDict
+import threading
+import time
+
+class _ReplicaEntry:
+    def __init__(self, data, synced_at):
+        self.data = data
+        self.synced_at = synced_at
+        self.last_access = synced_at
+        self.listener = None
+
+class RoomReplica:
+    """
+    Description:
+    In-memory copy of the rooms an instance is serving. Each cached room is kept
+    current by a snapshot listener so reads can be answered without a round trip
+    to the database.
+
+    Rooms that do not change get no snapshots, so a room is served from memory
+    for as long as its listener is active however long ago its last snapshot
+    was. Listeners stop once their stream fails without recovering, rooms whose
+    listener stopped are only served for max_staleness seconds after their last
+    snapshot, then re-read from the database with a new listener. At most
+    max_rooms rooms are kept, the least recently used room is evicted first and
+    rooms not read for idle_timeout seconds are dropped along with their listener.
+    """
+    def __init__(self, watch, max_rooms=500, max_staleness=10.0, idle_timeout=300.0):
+        """
+        Parameters:
+        watch - Function taking a room id and a callback, the callback is called with
+            the room snapshot (or None once the room is deleted) on every change.
+            Returns the listener, with an unsubscribe method that stops it and an
+            is_active property that is False once it stopped.
+        max_rooms - Maximum number of rooms to keep in memory
+        max_staleness - Seconds a room can be served after its last snapshot once
+            its listener stopped
+        idle_timeout - Seconds after the last read before a room is dropped
+        """
+        self.watch = watch
+        self.max_rooms = max_rooms
+        self.max_staleness = max_staleness
+        self.idle_timeout = idle_timeout
+        self.rooms = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, room_id, load):
+        """
+        Parameters:
+        room_id - Identity of the room
+        load - Function reading the room snapshot from the database, used when the
+            room is not in memory or its listener stopped
+
+        Description:
+        Gets the snapshot of a room from memory, loading and starting a listener for
+        the room if it is not already replicated.
+
+        Returns:
+        The room snapshot or None if the room does not exist
+        """
+        now = time.time()
+        with self.lock:
+            entry = self.rooms.get(room_id, None)
+            if entry != None and entry.synced_at > 0 and \
+                    (self._listening(entry) or now - entry.synced_at <= self.max_staleness):
+                entry.last_access = now
+                self.rooms.move_to_end(room_id)
+                return entry.data
+
+        room_data = load(room_id)
+        if room_data == None:
+            self.remove(room_id)
+            return None
+
+        stopped = []
+        with self.lock:
+            entry = self.rooms.get(room_id, None)
+            if entry == None:
+                entry = _ReplicaEntry(room_data, now)
+                self.rooms[room_id] = entry
+                subscribe = True
+            else:
+                entry.data = room_data
+                entry.synced_at = now
+                entry.last_access = now
+                self.rooms.move_to_end(room_id)
+                # A listener that stopped is replaced, one that is still starting is left alone
+                subscribe = entry.listener != None and not entry.listener.is_active
+                if subscribe:
+                    stopped.append(entry.listener.unsubscribe)
+                    entry.listener = None
+            stopped += self._evict(now)
+
+        for unsubscribe in stopped:
+            unsubscribe()
+        if subscribe:
+            listener = self.watch(room_id, lambda data: self._on_snapshot(room_id, entry, data))
+            with self.lock:
+                entry.listener = listener
+                if self.rooms.get(room_id, None) is entry:
+                    listener = None
+            # The room was evicted while the listener was starting
+            if listener != None:
+                listener.unsubscribe()
+        return room_data
+
+    def invalidate(self, room_id):
+        """
+        Parameters:
+        room_id - Identity of the room
+
+        Description:
+        Marks a room as stale so the next read goes to the database. Used after
+        this instance writes to the room so it reads its own writes.
+        """
+        with self.lock:
+            entry = self.rooms.get(room_id, None)
+            if entry != None:
+                entry.synced_at = 0
+
+    def remove(self, room_id):
+        """
+        Parameters:
+        room_id - Identity of the room
+
+        Description:
+        Drops a room from memory and stops its listener.
+        """
+        with self.lock:
+            entry = self.rooms.pop(room_id, None)
+        if entry != None and entry.listener != None:
+            entry.listener.unsubscribe()
+
+    def close(self):
+        """
+        Description:
+        Drops every room and stops all listeners.
+        """
+        with self.lock:
+            entries = list(self.rooms.values())
+            self.rooms.clear()
+        for entry in entries:
+            if entry.listener != None:
+                entry.listener.unsubscribe()
+
+    def _listening(self, entry):
+        return entry.listener != None and entry.listener.is_active
+
+    def _on_snapshot(self, room_id, entry, room_data):
+        with self.lock:
+            if self.rooms.get(room_id, None) is not entry:
+                return
+            if room_data == None:
+                # Listener threads can not stop themselves, the next read of the
+                # room goes to the database and removes the entry
+                entry.synced_at = 0
+                return
+            entry.data = room_data
+            entry.synced_at = time.time()
+
+    def _evict(self, now):
+        # Entries are ordered by last access so idle and least recently used rooms come first
+        stopped = []
+        while len(self.rooms) > 0:
+            room_id, entry = next(iter(self.rooms.items()))
+            if len(self.rooms) <= self.max_rooms and now - entry.last_access <= self.idle_timeout:
+                break
+            del self.rooms[room_id]
+            if entry.listener != None:
+                stopped.append(entry.listener.unsubscribe)
+        return stopped
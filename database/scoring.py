@@ -0,0 +1,149 @@
+SCORE_PLAYERS_KEY = "players"
+SCORE_PAIRS_KEY = "pairs"
+SCORE_ANSWERED_KEY = "answered"
+
+# Each player's score document holds the matches gained by their own answers
+# with every other player and the number of questions they answered
+PLAYER_PAIRS_KEY = "pairs"
+PLAYER_ANSWERED_KEY = "answered"
+
+PAIR_SEPARATOR = "|"
+
+def pair_key(player_a, player_b):
+    """
+    Parameters:
+    player_a - Name of a player
+    player_b - Name of another player
+
+    Description:
+    Gets the key of a pair of players in the scoreboard, the same for either order.
+    """
+    return PAIR_SEPARATOR.join(sorted([player_a, player_b]))
+
+def empty_scores():
+    return {SCORE_PLAYERS_KEY: {}, SCORE_PAIRS_KEY: {}, SCORE_ANSWERED_KEY: {}}
+
+def empty_player_scores():
+    return {PLAYER_PAIRS_KEY: {}, PLAYER_ANSWERED_KEY: 0}
+
+def player_deltas(player, previous, response, responses):
+    """
+    Parameters:
+    player - Name of the player answering
+    previous - Previous answer of the player or None if they had not answered
+    response - New answer of the player
+    responses - Dictionary of the other players' answers to the question
+
+    Description:
+    Works out how the score document of a player changes when they answer a
+    question. A player scores a match with every other player that gave the
+    same answer. Only the answering player's document changes, so players
+    answering at the same time never write the same document.
+
+    Returns:
+    Player score shaped dictionary of the changes to each count
+    """
+    deltas = empty_player_scores()
+    if previous == None:
+        deltas[PLAYER_ANSWERED_KEY] = 1
+    elif previous == response:
+        return deltas
+
+    for other, answer in responses.items():
+        if other == player:
+            continue
+        change = (1 if answer == response else 0) - (1 if previous != None and answer == previous else 0)
+        if change != 0:
+            deltas[PLAYER_PAIRS_KEY][other] = change
+    return deltas
+
+def apply_player_deltas(player_scores, deltas):
+    """
+    Parameters:
+    player_scores - Score document of a player to update in place
+    deltas - Changes from player_deltas
+    """
+    pairs = player_scores.setdefault(PLAYER_PAIRS_KEY, {})
+    for other, amount in deltas[PLAYER_PAIRS_KEY].items():
+        pairs[other] = pairs.get(other, 0) + amount
+    player_scores[PLAYER_ANSWERED_KEY] = player_scores.get(PLAYER_ANSWERED_KEY, 0) + deltas[PLAYER_ANSWERED_KEY]
+
+def combine_player_scores(player_scores, scores=None):
+    """
+    Parameters:
+    player_scores - Dictionary of the score document of each player
+    scores - Scoreboard stored for the whole room by earlier versions, added to the result
+
+    Description:
+    Builds the scoreboard of a room from the score documents of its players.
+    The matches of a pair are those gained by the answers of either player.
+
+    Returns:
+    Normalized scoreboard
+    """
+    combined = empty_scores()
+    if scores != None:
+        apply_deltas(combined, scores)
+
+    def add(section, key, amount):
+        combined[section][key] = combined[section].get(key, 0) + amount
+
+    for player, player_doc in player_scores.items():
+        add(SCORE_ANSWERED_KEY, player, player_doc.get(PLAYER_ANSWERED_KEY, 0))
+        for other, count in player_doc.get(PLAYER_PAIRS_KEY, {}).items():
+            add(SCORE_PLAYERS_KEY, player, count)
+            add(SCORE_PLAYERS_KEY, other, count)
+            add(SCORE_PAIRS_KEY, pair_key(player, other), count)
+    return normalize_scores(combined)
+
+def apply_deltas(scores, deltas):
+    """
+    Parameters:
+    scores - Scoreboard to update in place
+    deltas - Scoreboard shaped dictionary of changes to each count
+    """
+    for section in deltas:
+        counts = scores.setdefault(section, {})
+        for key, amount in deltas[section].items():
+            counts[key] = counts.get(key, 0) + amount
+
+def compute_player_scores(question_responses):
+    """
+    Parameters:
+    question_responses - List of dictionaries of each question's answers by player
+
+    Description:
+    Computes the score document of every player from scratch from the raw answers.
+    """
+    player_scores = dict()
+    for responses in question_responses:
+        answered = dict()
+        for player, response in responses.items():
+            deltas = player_deltas(player, None, response, answered)
+            apply_player_deltas(player_scores.setdefault(player, empty_player_scores()), deltas)
+            answered[player] = response
+    return player_scores
+
+def compute_scores(question_responses):
+    """
+    Parameters:
+    question_responses - List of dictionaries of each question's answers by player
+
+    Description:
+    Computes a scoreboard from scratch from the raw answers.
+    """
+    return combine_player_scores(compute_player_scores(question_responses))
+
+def normalize_scores(scores):
+    """
+    Parameters:
+    scores - Scoreboard
+
+    Description:
+    Drops the counts that went back to zero so scoreboards built incrementally
+    and from scratch compare equal.
+    """
+    normalized = empty_scores()
+    for section in normalized:
+        normalized[section] = {key: count for key, count in scores.get(section, {}).items() if count != 0}
+    return normalized
@@ -0,0 +1,80 @@
+from concurrent.futures import ThreadPoolExecutor
+import threading
+import time
+import unittest
+
+from database.cache import MicroCache
+
+class BasicTests(unittest.TestCase):
+
+    ############################
+    #### setup and teardown ####
+    ############################
+
+    # executed prior to each test
+    def setUp(self):
+        self.loads = []
+        self.release = threading.Event()
+
+    def load(self, key):
+        self.loads.append(key)
+        return {"room_id": key, "load": len(self.loads)}
+
+    def slow_load(self, key):
+        self.release.wait(5)
+        return self.load(key)
+
+    def test_cached_within_ttl(self):
+        cache = MicroCache(60)
+        self.assertEqual(cache.get("ABCD", self.load), {"room_id": "ABCD", "load": 1})
+        self.assertEqual(cache.get("ABCD", self.load), {"room_id": "ABCD", "load": 1})
+        self.assertEqual(self.loads, ["ABCD"])
+
+    def test_expires(self):
+        cache = MicroCache(0)
+        cache.get("ABCD", self.load)
+        cache.get("ABCD", self.load)
+        self.assertEqual(self.loads, ["ABCD", "ABCD"])
+
+    def test_missing_value_cached(self):
+        cache = MicroCache(60)
+        self.assertEqual(cache.get("ABCD", lambda key: self.loads.append(key)), None)
+        self.assertEqual(cache.get("ABCD", lambda key: self.loads.append(key)), None)
+        self.assertEqual(self.loads, ["ABCD"])
+
+    def test_invalidate(self):
+        cache = MicroCache(60)
+        cache.get("ABCD", self.load)
+        cache.invalidate("ABCD")
+        self.assertEqual(cache.get("ABCD", self.load)["load"], 2)
+
+    def test_single_flight(self):
+        cache = MicroCache(60)
+        with ThreadPoolExecutor(16) as pool:
+            results = [pool.submit(cache.get, "ABCD", self.slow_load) for _ in range(16)]
+            time.sleep(0.1)
+            self.release.set()
+            values = [result.result() for result in results]
+        self.assertEqual(self.loads, ["ABCD"])
+        self.assertEqual(values, [{"room_id": "ABCD", "load": 1}] * 16)
+
+    def test_invalidate_during_load(self):
+        cache = MicroCache(60)
+        with ThreadPoolExecutor(1) as pool:
+            result = pool.submit(cache.get, "ABCD", self.slow_load)
+            time.sleep(0.1)
+            cache.invalidate("ABCD")
+            self.release.set()
+            result.result()
+        self.assertEqual(cache.get("ABCD", self.load)["load"], 2)
+
+    def test_load_error(self):
+        cache = MicroCache(60)
+        def fail(key):
+            raise ValueError("unavailable")
+        self.assertRaises(ValueError, cache.get, "ABCD", fail)
+        self.assertEqual(cache.get("ABCD", self.load)["load"], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,264 @@
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+import threading
+import time
+import unittest
+
+from google.api_core.datetime_helpers import DatetimeWithNanoseconds
+from google.api_core.exceptions import Aborted
+from google.auth.credentials import AnonymousCredentials
+from google.cloud import firestore as cloud_firestore
+from google.cloud.firestore_v1 import ReadAfterWriteError
+from google.cloud.firestore_v1.query import Query
+import database
+from database import DatabaseManager, QUESTION_RESPONSES_KEY, RESPONSE_KEY_ID, ROOM_ID_KEY, PLAYERS_KEY, \
+    MAX_PLAYERS_KEY, ROOM_VERSION_KEY, TALLY_SHARDS_KEY, tally_shard
+
+class FakeSnapshot:
+    def __init__(self, path, data):
+        self.id = path.split("/")[-1]
+        self.exists = data != None
+        self.data = data
+        self.update_time = DatetimeWithNanoseconds(2020, 1, 1, nanosecond=5)
+
+    def to_dict(self):
+        return dict(self.data)
+
+class FakeQuery:
+    def __init__(self, client, path, field, value):
+        self.client = client
+        self.path = path
+        self.field = field
+        self.value = value
+
+    def documents(self):
+        prefix = self.path + "/"
+        return [FakeSnapshot(path, data) for path, data in sorted(self.client.documents.items())
+            if path.startswith(prefix) and "/" not in path[len(prefix):] and data.get(self.field, None) == self.value]
+
+class FakeReference:
+    def __init__(self, client, path):
+        self.client = client
+        self.path = path
+
+    def collection(self, name):
+        return FakeReference(self.client, "%s/%s" % (self.path, name))
+
+    def document(self, document_id):
+        return FakeReference(self.client, "%s/%s" % (self.path, document_id))
+
+    def where(self, field, op, value):
+        return FakeQuery(self.client, self.path, field, value)
+
+    def get(self, field_paths=None, transaction=None, timeout=None):
+        with self.client.lock:
+            data = self.client.documents.get(self.path, None)
+            data = dict(data) if data != None else None
+        if transaction != None:
+            transaction.read(self.path)
+        return FakeSnapshot(self.path, data)
+
+class FakeTransaction:
+    """
+    Description:
+    Records the reads and writes of a transaction, refusing reads after writes
+    like Firestore transactions do. Updates are applied when the transaction
+    commits, which fails with Aborted if a document it read was written since.
+    """
+    def __init__(self, client, max_attempts):
+        self.client = client
+        self.max_attempts = max_attempts
+        self.calls = []
+        self.read_versions = dict()
+        self.updates = []
+
+    def begin(self):
+        self.calls = []
+        self.read_versions = dict()
+        self.updates = []
+
+    def read(self, path):
+        if any(call[0] != "get" for call in self.calls):
+            raise ReadAfterWriteError("Attempted read after write in a transaction.")
+        self.calls.append(("get", path))
+        with self.client.lock:
+            self.read_versions.setdefault(path, self.client.versions.get(path, 0))
+        # Leaves time for concurrent transactions to interleave
+        time.sleep(0.001)
+
+    def commit(self):
+        with self.client.lock:
+            if len(self.updates) == 0:
+                return
+            for path, version in self.read_versions.items():
+                if self.client.versions.get(path, 0) != version:
+                    raise Aborted("Transaction lock timeout.")
+            for path, data in self.updates:
+                self.client.documents[path].update(data)
+                self.client.versions[path] = self.client.versions.get(path, 0) + 1
+
+    def get(self, query, timeout=None):
+        self.read(query.path)
+        return query.documents()
+
+    def set(self, reference, data, merge=False):
+        self.calls.append(("set", reference.path))
+
+    def update(self, reference, data):
+        self.calls.append(("update", reference.path))
+        self.updates.append((reference.path, data))
+
+    def delete(self, reference):
+        self.calls.append(("delete", reference.path))
+
+def fake_transactional(function):
+    # Retries the function until its transaction commits, like firestore.transactional
+    def run(transaction, *args, **kwargs):
+        for _ in range(transaction.max_attempts):
+            transaction.begin()
+            result = function(transaction, *args, **kwargs)
+            try:
+                transaction.commit()
+                return result
+            except Aborted as error:
+                last_error = error
+        raise ValueError("Failed to commit transaction in %d attempts." % transaction.max_attempts) from last_error
+    return run
+
+class FakeClient:
+    def __init__(self, documents):
+        self.documents = documents
+        self.versions = dict()
+        self.transactions = []
+        self.lock = threading.Lock()
+
+    def collection(self, name):
+        return FakeReference(self, name)
+
+    def transaction(self, max_attempts=5):
+        transaction = FakeTransaction(self, max_attempts)
+        with self.lock:
+            self.transactions.append(transaction)
+        return transaction
+
+class StreamedQueries:
+    """
+    Description:
+    Stands in for Query.stream, recording the real queries built against an
+    offline client and answering each with the next page of documents.
+    """
+    def __init__(self, pages):
+        self.pages = pages
+        self.queries = []
+
+    def stream(self, query, timeout=None):
+        self.queries.append(query)
+        return [FakeSnapshot(document_id, {}) for document_id in self.pages.pop(0)]
+
+class BasicTests(unittest.TestCase):
+
+    ############################
+    #### setup and teardown ####
+    ############################
+
+    # executed prior to each test
+    def setUp(self):
+        self.client = FakeClient({
+            "questions/Q1": {ROOM_ID_KEY: "ABCD"},
+            "questions/Q1/%s/P1" % QUESTION_RESPONSES_KEY: {RESPONSE_KEY_ID: "a"},
+            "questions/Q1/%s/P2" % QUESTION_RESPONSES_KEY: {RESPONSE_KEY_ID: "b"},
+            "rooms/ABCD": {ROOM_ID_KEY: "ABCD", PLAYERS_KEY: ["P1"], MAX_PLAYERS_KEY: 2, ROOM_VERSION_KEY: 3},
+        })
+        patches = [
+            mock.patch.object(database.firestore, "client", lambda: self.client),
+            mock.patch.object(database.firestore, "transactional", fake_transactional),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    # executed after each test
+    def tearDown(self):
+        pass
+
+    def test_response_reads_before_writes(self):
+        database_manager = DatabaseManager()
+        self.assertEqual(database_manager.set_question_response("Q1", "P2", "a"), "a")
+
+        calls = self.client.transactions[-1].calls
+        responses = "questions/Q1/%s" % QUESTION_RESPONSES_KEY
+        self.assertEqual(calls, [
+            ("get", responses + "/P2"),
+            ("get", responses),
+            ("get", responses),
+            ("set", responses + "/P2"),
+            ("set", "questions/Q1/%s/%s" % (TALLY_SHARDS_KEY, tally_shard("P2"))),
+            ("set", "scores/ABCD/players/P2"),
+        ])
+
+    def test_join_checks_room_in_transaction(self):
+        database_manager = DatabaseManager()
+        self.assertEqual(database_manager.add_player("ABCD", "P2"), "P2")
+        self.assertEqual(self.client.transactions[-1].calls, [
+            ("get", "rooms/ABCD"),
+            ("update", "rooms/ABCD"),
+            ("set", "rooms/ABCD/changes/0000000004"),
+        ])
+        self.assertEqual(self.client.documents["rooms/ABCD"][PLAYERS_KEY], ["P1", "P2"])
+
+        # The room is full by the transaction's read, nothing is written
+        self.assertEqual(database_manager.add_player("ABCD", "P3"), None)
+        self.assertEqual(self.client.transactions[-1].calls, [("get", "rooms/ABCD")])
+        self.assertEqual(database_manager.add_player("ABCD", "P1"), None)
+
+    def test_concurrent_joins(self):
+        self.client.documents["rooms/ABCD"] = {ROOM_ID_KEY: "ABCD", PLAYERS_KEY: [], MAX_PLAYERS_KEY: 5,
+            ROOM_VERSION_KEY: 0}
+        database_manager = DatabaseManager()
+        players = ["P%d" % i for i in range(8)]
+        with ThreadPoolExecutor(len(players)) as pool:
+            joined = list(pool.map(lambda player: database_manager.add_player("ABCD", player), players))
+
+        # No join is lost and the room never goes past its maximum
+        room_data = self.client.documents["rooms/ABCD"]
+        self.assertEqual(sorted(room_data[PLAYERS_KEY]), sorted(player for player in joined if player != None))
+        self.assertEqual(len(room_data[PLAYERS_KEY]), 5)
+        self.assertEqual(room_data[ROOM_VERSION_KEY], 5)
+
+    def stream_real_queries(self, pages):
+        # Queries are built by a real client that never connects
+        client = cloud_firestore.Client(project="test", credentials=AnonymousCredentials())
+        streamed = StreamedQueries(pages)
+        patches = [
+            mock.patch.object(database.firestore, "client", lambda: client),
+            mock.patch.object(Query, "stream", lambda query, timeout=None: streamed.stream(query, timeout)),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+        return streamed
+
+    def test_stream_documents_query(self):
+        streamed = self.stream_real_queries([["A", "B"], ["C"]])
+        documents = list(DatabaseManager().stream_documents("rooms", page_size=2))
+        self.assertEqual([document_id for document_id, _ in documents], ["A", "B", "C"])
+
+        self.assertEqual(len(streamed.queries), 2)
+        for query in streamed.queries:
+            self.assertEqual([order.field.field_path for order in query._orders], ["__name__"])
+            self.assertEqual(query._limit, 2)
+        self.assertEqual(streamed.queries[0]._start_at, None)
+        self.assertEqual(streamed.queries[1]._start_at, ({"__name__": "B"}, False))
+
+    def test_get_page_query(self):
+        streamed = self.stream_real_queries([["C", "D"]])
+        page = DatabaseManager().get_page("questions", page_size=2, after="B")
+        self.assertEqual(page, [("C", {}, "2020-01-01T00:00:00.000000005Z"), ("D", {}, "2020-01-01T00:00:00.000000005Z")])
+
+        query = streamed.queries[0]
+        self.assertEqual([order.field.field_path for order in query._orders], ["__name__"])
+        self.assertEqual(query._limit, 2)
+        self.assertEqual(query._start_at, ({"__name__": "B"}, False))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,122 @@
+import unittest
+
+from database.replica import RoomReplica
+
+class FakeListener:
+    def __init__(self, watch, room_id):
+        self.watch = watch
+        self.room_id = room_id
+        self.is_active = True
+
+    def unsubscribe(self):
+        self.is_active = False
+        self.watch.stopped.append(self.room_id)
+
+class FakeWatch:
+    def __init__(self):
+        self.callbacks = dict()
+        self.listeners = dict()
+        self.stopped = []
+
+    def __call__(self, room_id, callback):
+        self.callbacks[room_id] = callback
+        self.listeners[room_id] = FakeListener(self, room_id)
+        return self.listeners[room_id]
+
+class BasicTests(unittest.TestCase):
+
+    ############################
+    #### setup and teardown ####
+    ############################
+
+    # executed prior to each test
+    def setUp(self):
+        self.watch = FakeWatch()
+        self.loads = []
+        self.rooms = {"ABCD": {"active_question": ""}, "EFGH": {"active_question": ""}, "IJKL": {}}
+
+    def load(self, room_id):
+        self.loads.append(room_id)
+        return self.rooms.get(room_id, None)
+
+    def test_served_from_memory(self):
+        replica = RoomReplica(self.watch)
+        self.assertEqual(replica.get("ABCD", self.load), {"active_question": ""})
+        self.assertEqual(replica.get("ABCD", self.load), {"active_question": ""})
+        self.assertEqual(self.loads, ["ABCD"])
+        self.assertIn("ABCD", self.watch.callbacks)
+
+    def test_snapshot_updates(self):
+        replica = RoomReplica(self.watch)
+        replica.get("ABCD", self.load)
+        self.watch.callbacks["ABCD"]({"active_question": "q1"})
+        self.assertEqual(replica.get("ABCD", self.load), {"active_question": "q1"})
+        self.assertEqual(self.loads, ["ABCD"])
+
+    def test_missing_room(self):
+        replica = RoomReplica(self.watch)
+        self.assertEqual(replica.get("ZZZZ", self.load), None)
+        self.assertEqual(replica.get("ZZZZ", self.load), None)
+        self.assertEqual(self.loads, ["ZZZZ", "ZZZZ"])
+        self.assertNotIn("ZZZZ", self.watch.callbacks)
+
+    def test_deleted_room(self):
+        replica = RoomReplica(self.watch)
+        replica.get("ABCD", self.load)
+        del self.rooms["ABCD"]
+        self.watch.callbacks["ABCD"](None)
+        self.assertEqual(replica.get("ABCD", self.load), None)
+        self.assertEqual(self.watch.stopped, ["ABCD"])
+
+    def test_served_while_listening(self):
+        # Rooms that do not change are served from memory however old their last snapshot
+        replica = RoomReplica(self.watch, max_staleness=0)
+        replica.get("ABCD", self.load)
+        replica.rooms["ABCD"].synced_at -= 60
+        replica.get("ABCD", self.load)
+        self.assertEqual(self.loads, ["ABCD"])
+
+    def test_listener_stopped(self):
+        replica = RoomReplica(self.watch, max_staleness=0)
+        replica.get("ABCD", self.load)
+        listener = self.watch.listeners["ABCD"]
+        # The stream failed without recovering
+        listener.is_active = False
+        self.rooms["ABCD"] = {"active_question": "q3"}
+        self.assertEqual(replica.get("ABCD", self.load), {"active_question": "q3"})
+        self.assertEqual(self.loads, ["ABCD", "ABCD"])
+        self.assertEqual(self.watch.stopped, ["ABCD"])
+
+        # A new listener replaces the stopped one
+        self.assertIsNot(self.watch.listeners["ABCD"], listener)
+        self.assertIs(replica.rooms["ABCD"].listener, self.watch.listeners["ABCD"])
+        replica.get("ABCD", self.load)
+        self.assertEqual(self.loads, ["ABCD", "ABCD"])
+
+    def test_invalidate(self):
+        replica = RoomReplica(self.watch)
+        replica.get("ABCD", self.load)
+        self.rooms["ABCD"] = {"active_question": "q2"}
+        replica.invalidate("ABCD")
+        self.assertEqual(replica.get("ABCD", self.load), {"active_question": "q2"})
+
+    def test_lru_eviction(self):
+        replica = RoomReplica(self.watch, max_rooms=2)
+        replica.get("ABCD", self.load)
+        replica.get("EFGH", self.load)
+        replica.get("ABCD", self.load)
+        replica.get("IJKL", self.load)
+        self.assertEqual(list(replica.rooms.keys()), ["ABCD", "IJKL"])
+        self.assertEqual(self.watch.stopped, ["EFGH"])
+
+    def test_idle_eviction(self):
+        replica = RoomReplica(self.watch, idle_timeout=0)
+        replica.get("ABCD", self.load)
+        replica.rooms["ABCD"].last_access -= 1
+        replica.get("EFGH", self.load)
+        self.assertEqual(list(replica.rooms.keys()), ["EFGH"])
+        self.assertEqual(self.watch.stopped, ["ABCD"])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,5 +1,6 @@
 from flask import Blueprint, jsonify, request, session
-from database import db_container, valid_room_id
+from database import db_container, valid_room_id, room_capacity, PLAYERS_KEY
+import presence
 import re
 
 SESSION_USERNAME = "SESSION_USERNAME"
@@ -20,6 +21,21 @@ def get_filtered_username(name):
 def valid_username(name):
     return username_regex.match(name) != None
 
+def join_refused(join_room, join_name):
+    # The checks before joining read cached data, the join itself checks the
+    # room again in its transaction and can still be refused
+    snapshot = db_container.get_database().get_room_snapshot(join_room, fresh=True)
+    if snapshot != None and join_name in snapshot[0][PLAYERS_KEY]:
+        response = jsonify("Name is taken")
+        response.status_code = 401
+    elif snapshot != None and len(snapshot[0][PLAYERS_KEY]) >= room_capacity(snapshot[0]):
+        response = jsonify("Room is full")
+        response.status_code = 401
+    else:
+        response = jsonify("Error joining room")
+        response.status_code = 500
+    return response
+
 def attempt_join(join_room, join_name):
     if not valid_room_id(join_room):
         response = jsonify("Room Id not valid")
@@ -64,12 +80,8 @@ def attempt_join(join_room, join_name):
         return response
 
     # Make request to join game from database
-    join_name = db_container.get_database().add_player(join_room, join_name)
-
-    if join_name == None:
-        response = jsonify("Error joining room")
-        response.status_code = 500
-        return response
+    if db_container.get_database().add_player(join_room, join_name) == None:
+        return join_refused(join_room, join_name)
     
     # Set session token
     session[SESSION_USERNAME] = join_name
@@ -98,6 +110,7 @@ def pingGame():
     game_room = session[SESSION_ROOM] if SESSION_ROOM in session else None
 
     if player_name != None and game_room != None:
+        presence.heartbeat(game_room, player_name)
         response = jsonify({SESSION_ROOM: game_room, SESSION_USERNAME: player_name})
         response.status_code = 200
         return response
@@ -1,3 +1,4 @@
+from unittest import mock
 import os
 import unittest
 
@@ -78,6 +79,18 @@ class BasicTests(unittest.TestCase):
         result_join = self.app.post('/games/join', headers={USERNAME: "user", ROOM_ID: self.room_id})
         self.assertEqual(result_join.status_code, 401)
 
+    def test_join_full_stale_check(self):
+        database = db_container.get_database()
+        database.update_room(self.room_id, {"max_players": 1})
+        self.assertEqual(self.app.post('/games/join', headers={USERNAME: "user1", ROOM_ID: self.room_id}).status_code, 200)
+
+        # The checks before joining can see a stale room, the join itself does not
+        with mock.patch.object(database, "is_room_full", return_value=False):
+            result_join = app.test_client().post('/games/join', headers={USERNAME: "user2", ROOM_ID: self.room_id})
+        self.assertEqual(result_join.status_code, 401)
+        self.assertEqual(result_join.json, "Room is full")
+        self.assertEqual(database.get_players(self.room_id), ["USER1"])
+
     def test_rejoin(self):
         test_client = app.test_client()
         name = "USER"
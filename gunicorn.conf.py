@@ -0,0 +1,38 @@
+"""
+Description:
+Production gunicorn settings. Requests spend most of their time waiting on
+Firestore, so each worker process runs a fixed pool of threads and capacity
+grows with the number of worker processes, which follows the number of CPUs.
+The total thread count stays linear in the CPUs. Counts can be overridden with
+the GUNICORN_WORKERS and GUNICORN_THREADS environment variables.
+
+Usage:
+gunicorn -c gunicorn.conf.py main:app
+"""
+import multiprocessing
+import os
+
+bind = "0.0.0.0:%s" % os.environ.get("PORT", "8080")
+
+worker_class = "gthread"
+workers = int(os.environ.get("GUNICORN_WORKERS", max(2, multiprocessing.cpu_count() + 1)))
+threads = int(os.environ.get("GUNICORN_THREADS", 4))
+
+# Load the app once in the master so every worker shares the same session
+# secret key and imports are not repeated per worker.
+preload_app = True
+
+# On SIGTERM workers stop accepting connections and finish the requests they
+# are serving, for up to graceful_timeout seconds, before exiting.
+graceful_timeout = 30
+timeout = 60
+keepalive = 5
+
+def post_fork(server, worker):
+    # gRPC channels are not fork safe, give each worker its own Firestore client
+    from main import init_firebase
+    init_firebase()
+    # Presence summaries are flushed by a thread of each worker
+    from main import app
+    from presence import write_presence
+    app.extensions["presence"].start(write_presence)
@@ -0,0 +1,212 @@
+from flask import current_app, jsonify, make_response, request
+from database import db_container, REQUEST_FINGERPRINT_KEY, REQUEST_RESULT_KEY, REQUEST_EXPIRES_KEY
+from resilience import remaining_time
+import functools
+import hashlib
+import os
+import threading
+import time
+
+IDEMPOTENCY_KEY_HEADER = "Idempotency-Key"
+IDEMPOTENCY_REPLAYED_HEADER = "Idempotent-Replayed"
+
+IDEMPOTENCY_TTL = "IDEMPOTENCY_TTL"
+IDEMPOTENCY_LEASE = "IDEMPOTENCY_LEASE"
+
+RESULT_BODY_KEY = "body"
+RESULT_STATUS_KEY = "status"
+RESULT_HEADERS_KEY = "headers"
+
+# Headers of the original response that are replayed with it
+REPLAYED_HEADERS = ["Content-Type", "Location"]
+
+class _IdempotentRequest:
+    def __init__(self, fingerprint):
+        self.fingerprint = fingerprint
+        self.done = threading.Event()
+        self.result = None
+
+def request_id(key):
+    """
+    Parameters:
+    key - Idempotency key scoped to the method and path of the request
+
+    Returns:
+    Id of the database record of the request
+    """
+    return hashlib.sha1(" ".join(key).encode()).hexdigest()
+
+class IdempotencyStore:
+    """
+    Description:
+    Responses to requests sent with an Idempotency-Key, recorded in the
+    database so retries reaching any instance or worker are replayed. The first
+    request with a key creates its record only if no live record exists, and
+    its response is written to the record once handled. Responses are replayed
+    for ttl seconds, and records of requests that never finish, such as those of
+    an instance that crashed, expire after lease seconds.
+
+    Duplicates reaching the instance handling a request wait for it in memory,
+    duplicates on other instances poll its record every poll_interval seconds.
+    Only requests in flight are kept in memory, so none is dropped while it runs.
+    """
+    def __init__(self, ttl, lease, poll_interval=0.05):
+        self.ttl = ttl
+        self.lease = lease
+        self.poll_interval = poll_interval
+        self.requests = dict()
+        self.lock = threading.Lock()
+
+    def begin(self, key, fingerprint):
+        """
+        Parameters:
+        key - Idempotency key scoped to the method and path of the request
+        fingerprint - Hash of the request body
+
+        Description:
+        Registers a request for a key unless a request with the same key is
+        already in flight on this instance.
+
+        Returns:
+        Tuple of the in flight request for the key and whether the caller is the
+        first request with the key on this instance and has to claim it
+        """
+        with self.lock:
+            if key in self.requests:
+                return self.requests[key], False
+            stored = _IdempotentRequest(fingerprint)
+            self.requests[key] = stored
+            return stored, True
+
+    def claim(self, key, stored):
+        """
+        Parameters:
+        key - Idempotency key of the request
+        stored - Request returned by begin
+
+        Description:
+        Claims the key in the database. When another request claimed it first,
+        the fingerprint of that request is kept in stored and its response is
+        waited for.
+
+        Returns:
+        True if the caller claimed the key and has to handle the request
+        """
+        record, claimed = db_container.get_database().claim_request(request_id(key), stored.fingerprint, self.lease)
+        if claimed:
+            return True
+        if record[REQUEST_FINGERPRINT_KEY] == stored.fingerprint:
+            stored.result = self._wait(key, record)
+        stored.fingerprint = record[REQUEST_FINGERPRINT_KEY]
+        return False
+
+    def _wait(self, key, record):
+        # Polls the record until it has a response, it expires or the request
+        # waiting for it is about to run out of time
+        while record != None and record[REQUEST_RESULT_KEY] == None:
+            remaining = remaining_time()
+            if time.time() >= record[REQUEST_EXPIRES_KEY] or (remaining != None and remaining < 2 * self.poll_interval):
+                return None
+            time.sleep(self.poll_interval)
+            record = db_container.get_database().get_request(request_id(key))
+        if record == None:
+            return None
+        result = record[REQUEST_RESULT_KEY]
+        return (result[RESULT_BODY_KEY], result[RESULT_STATUS_KEY], result[RESULT_HEADERS_KEY])
+
+    def finish(self, key, stored, result, claimed):
+        """
+        Parameters:
+        key - Idempotency key of the request
+        stored - Request returned by begin
+        result - Tuple of the response body, status and headers, None to forget
+            the key so the request can be retried
+        claimed - True if the caller claimed the key in the database
+
+        Description:
+        Records the response to a request and wakes up its duplicates.
+        """
+        try:
+            if claimed:
+                record_result = None
+                if result != None:
+                    record_result = {RESULT_BODY_KEY: result[0], RESULT_STATUS_KEY: result[1], RESULT_HEADERS_KEY: result[2]}
+                db_container.get_database().finish_request(request_id(key), record_result, self.ttl)
+        finally:
+            with self.lock:
+                if self.requests.get(key, None) is stored:
+                    del self.requests[key]
+                stored.result = result
+            stored.done.set()
+
+def _replay(stored, fingerprint):
+    if stored.fingerprint != fingerprint:
+        response = jsonify("Idempotency key reused with a different request")
+        response.status_code = 422
+        return response
+    body, status, headers = stored.result
+    response = make_response(body, status, headers)
+    response.headers[IDEMPOTENCY_REPLAYED_HEADER] = "true"
+    return response
+
+def idempotent(route):
+    """
+    Description:
+    Replays the response of the first request sent with the same Idempotency-Key
+    header to the same method and path instead of handling it again. Duplicates
+    that arrive while the first request is still running wait for its response,
+    and get a 409 if it does not come before their deadline. Server errors are
+    not stored so the client can retry them.
+    """
+    @functools.wraps(route)
+    def handle(*args, **kwargs):
+        key = request.headers.get(IDEMPOTENCY_KEY_HEADER, None)
+        if key == None:
+            return route(*args, **kwargs)
+        store = current_app.extensions["idempotency"]
+        scoped_key = (request.method, request.path, key)
+        fingerprint = hashlib.sha1(request.get_data()).hexdigest()
+
+        while True:
+            stored, first = store.begin(scoped_key, fingerprint)
+            if first:
+                break
+            stored.done.wait(store.lease)
+            if stored.fingerprint != fingerprint or stored.result != None:
+                return _replay(stored, fingerprint)
+
+        claimed = False
+        result = None
+        try:
+            claimed = store.claim(scoped_key, stored)
+            if not claimed:
+                result = stored.result
+                if stored.fingerprint != fingerprint or result != None:
+                    return _replay(stored, fingerprint)
+                response = jsonify("A request with this idempotency key is still in progress")
+                response.status_code = 409
+                response.headers["Retry-After"] = "1"
+                return response
+
+            response = make_response(route(*args, **kwargs))
+            if response.status_code < 500:
+                headers = {name: response.headers[name] for name in REPLAYED_HEADERS if name in response.headers}
+                result = (response.get_data(), response.status_code, headers)
+            return response
+        finally:
+            store.finish(scoped_key, stored, result, claimed)
+    return handle
+
+def init_app(app):
+    """
+    Parameters:
+    app - Flask app
+
+    Description:
+    Sets up the store used by routes decorated with idempotent. Responses are
+    replayed for IDEMPOTENCY_TTL seconds, and keys of requests that never
+    finished can be reused after IDEMPOTENCY_LEASE seconds.
+    """
+    app.config.setdefault(IDEMPOTENCY_TTL, float(os.environ.get(IDEMPOTENCY_TTL, "300")))
+    app.config.setdefault(IDEMPOTENCY_LEASE, float(os.environ.get(IDEMPOTENCY_LEASE, "60")))
+    app.extensions["idempotency"] = IdempotencyStore(app.config[IDEMPOTENCY_TTL], app.config[IDEMPOTENCY_LEASE])
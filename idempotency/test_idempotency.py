@@ -0,0 +1,109 @@
+from concurrent.futures import ThreadPoolExecutor
+import hashlib
+import json
+import unittest
+
+from main import app
+from database import db_container
+from idempotency import IdempotencyStore, IDEMPOTENCY_KEY_HEADER, IDEMPOTENCY_REPLAYED_HEADER, request_id
+from resilience import DEADLINE_HEADER
+
+class BasicTests(unittest.TestCase):
+
+    ############################
+    #### setup and teardown ####
+    ############################
+
+    # executed prior to each test
+    def setUp(self):
+        self.app = app.test_client()
+        db_container.set_test_mode()
+        db_container.get_database()._reset()
+        self.store = app.extensions["idempotency"]
+
+    # executed after each test
+    def tearDown(self):
+        app.extensions["idempotency"] = self.store
+
+
+    def test_duplicate_room_post(self):
+        first = self.app.post('/rooms/', headers={IDEMPOTENCY_KEY_HEADER: "key-1"})
+        second = self.app.post('/rooms/', headers={IDEMPOTENCY_KEY_HEADER: "key-1"})
+        self.assertEqual(first.status_code, 201)
+        self.assertEqual(second.status_code, 201)
+        self.assertEqual(first.json, second.json)
+        self.assertEqual(second.headers[IDEMPOTENCY_REPLAYED_HEADER], "true")
+        self.assertEqual(len(self.app.get('/rooms/').json), 1)
+
+        third = self.app.post('/rooms/', headers={IDEMPOTENCY_KEY_HEADER: "key-2"})
+        self.assertNotEqual(first.json, third.json)
+        self.assertEqual(len(self.app.get('/rooms/').json), 2)
+
+    def test_without_key(self):
+        self.app.post('/rooms/')
+        self.app.post('/rooms/')
+        self.assertEqual(len(self.app.get('/rooms/').json), 2)
+
+    def test_key_reused_with_different_body(self):
+        room_id = self.app.post('/rooms/').json
+        first = self.app.post('/questions/%s' % room_id, data=json.dumps({"opt": ["a"]}),
+            headers={IDEMPOTENCY_KEY_HEADER: "key-1"})
+        self.assertEqual(first.status_code, 200)
+        second = self.app.post('/questions/%s' % room_id, data=json.dumps({"opt": ["b"]}),
+            headers={IDEMPOTENCY_KEY_HEADER: "key-1"})
+        self.assertEqual(second.status_code, 422)
+
+    def test_concurrent_duplicates(self):
+        room_id = self.app.post('/rooms/').json
+        body = json.dumps({"opt": ["a", "b"]})
+
+        def post_question(_):
+            return app.test_client().post('/questions/%s' % room_id, data=body,
+                headers={IDEMPOTENCY_KEY_HEADER: "retry-storm"})
+
+        with ThreadPoolExecutor(16) as pool:
+            results = list(pool.map(post_question, range(64)))
+
+        self.assertEqual(set([result.status_code for result in results]), {200})
+        self.assertEqual(len(set([result.json for result in results])), 1)
+        self.assertEqual(self.app.get('/questions/%s' % room_id).json, [results[0].json])
+
+    def test_duplicate_on_other_instance(self):
+        first = self.app.post('/rooms/', headers={IDEMPOTENCY_KEY_HEADER: "key-1"})
+
+        # Another instance sees the response recorded in the database
+        app.extensions["idempotency"] = IdempotencyStore(300, 60)
+        second = self.app.post('/rooms/', headers={IDEMPOTENCY_KEY_HEADER: "key-1"})
+        self.assertEqual(second.status_code, 201)
+        self.assertEqual(second.json, first.json)
+        self.assertEqual(second.headers[IDEMPOTENCY_REPLAYED_HEADER], "true")
+        self.assertEqual(len(self.app.get('/rooms/').json), 1)
+
+    def test_in_flight_on_other_instance(self):
+        database = db_container.get_database()
+        record_id = request_id(("POST", "/rooms/", "key-1"))
+        fingerprint = hashlib.sha1(b"").hexdigest()
+        self.assertTrue(database.claim_request(record_id, fingerprint, 60)[1])
+
+        # Duplicates wait for the other instance until their deadline
+        waiting = self.app.post('/rooms/', headers={IDEMPOTENCY_KEY_HEADER: "key-1", DEADLINE_HEADER: "300"})
+        self.assertEqual(waiting.status_code, 409)
+        self.assertEqual(self.app.get('/rooms/').json, [])
+
+        database.finish_request(record_id, {"body": b'"ABCD"', "status": 201,
+            "headers": {"Content-Type": "application/json"}}, 300)
+        replayed = self.app.post('/rooms/', headers={IDEMPOTENCY_KEY_HEADER: "key-1"})
+        self.assertEqual(replayed.status_code, 201)
+        self.assertEqual(replayed.json, "ABCD")
+
+    def test_expired_claim(self):
+        # Keys of requests that never finished can be claimed again after their lease
+        record_id = request_id(("POST", "/rooms/", "key-1"))
+        db_container.get_database().claim_request(record_id, hashlib.sha1(b"").hexdigest(), 0)
+        result = self.app.post('/rooms/', headers={IDEMPOTENCY_KEY_HEADER: "key-1"})
+        self.assertEqual(result.status_code, 201)
+        self.assertNotIn(IDEMPOTENCY_REPLAYED_HEADER, result.headers)
+        self.assertEqual(self.app.get('/rooms/').json, [result.json])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -3,34 +3,109 @@ from rooms import rooms_api
 from games import games_api
 from questions import questions_api
 from responses import responses_api
+from admin import admin_api
+from database import db_container
+import compression
+import idempotency
+import packs
+import presence
+import profiling
+import resilience
+import tracing
 from flask_cors import CORS
+import firebase_admin
 from firebase_admin import credentials, initialize_app
 import os
 
-# If `entrypoint` is not defined in app.yaml, App Engine will look for an app
-# called `app` in `main.py`.
-app = Flask(__name__)
-app.secret_key = os.urandom(24)
+FIREBASE_KEY_PATH = 'secrets/firebase-key.json'
+
+def init_firebase():
+    """
+    Description:
+    Initializes the default firebase app. Any existing default app is deleted
+    first so a process forked after the app was created (such as a gunicorn
+    worker with preload_app) opens its own Firestore connections instead of
+    sharing the parent's gRPC channels.
+
+    Returns:
+    The initialized firebase app
+    """
+    try:
+        firebase_admin.delete_app(firebase_admin.get_app())
+    except ValueError:
+        pass
+    cred = credentials.Certificate(FIREBASE_KEY_PATH)
+    return initialize_app(cred)
+
+def create_app():
+    """
+    Description:
+    Creates the flask app with all the blueprints registered. Creating the app
+    does not open any database connections so it is safe to call before
+    forking worker processes.
+
+    Returns:
+    The flask app
+    """
+    app = Flask(__name__)
+    app.secret_key = os.urandom(24)
+
+    #cors = CORS(app, resources={r"/*": {"origins": "*"}}, send_wildcard=True)
+    cors = CORS(app, supports_credentials=True)
+
+    tracing.init_app(app)
+    resilience.init_app(app)
+    compression.init_app(app)
+    idempotency.init_app(app)
+    profiling.init_app(app)
+    presence.init_app(app)
+    packs.init_app(app)
+
+    app.register_blueprint(rooms_api, url_prefix='/rooms')
+    app.register_blueprint(games_api, url_prefix='/games')
+    app.register_blueprint(questions_api, url_prefix='/questions')
+    app.register_blueprint(responses_api, url_prefix='/responses')
+    app.register_blueprint(admin_api, url_prefix='/admin')
+
+    @app.route("/")
+    def hello():
+        return "Hello World!"
+
+    return app
 
 # Initialize Firestore DB
-cred = credentials.Certificate('secrets/firebase-key.json')
-default_app = initialize_app(cred)
+default_app = init_firebase()
 
-#cors = CORS(app, resources={r"/*": {"origins": "*"}}, send_wildcard=True)
-cors = CORS(app, supports_credentials=True)
+# Opt in to serving room reads from an in-memory replica with ROOM_REPLICA=1
+if os.environ.get("ROOM_REPLICA", "0") == "1":
+    db_container.get_database().enable_replica(
+        max_rooms=int(os.environ.get("ROOM_REPLICA_MAX_ROOMS", "500")),
+        max_staleness=float(os.environ.get("ROOM_REPLICA_MAX_STALENESS", "10")),
+        idle_timeout=float(os.environ.get("ROOM_REPLICA_IDLE_TIMEOUT", "300")))
 
-app.register_blueprint(rooms_api, url_prefix='/rooms')
-app.register_blueprint(games_api, url_prefix='/games')
-app.register_blueprint(questions_api, url_prefix='/questions')
-app.register_blueprint(responses_api, url_prefix='/responses')
+# Share room reads between requests on an instance for ROOM_CACHE_TTL seconds
+if float(os.environ.get("ROOM_CACHE_TTL", "0")) > 0:
+    db_container.get_database().enable_room_cache(float(os.environ["ROOM_CACHE_TTL"]))
 
-@app.route("/")
-def hello():
-    return "Hello World!"
+# Fail database calls fast while most of them are failing, set
+# DB_BREAKER_ERROR_RATE=0 to turn the circuit breaker off
+if float(os.environ.get("DB_BREAKER_ERROR_RATE", "0.5")) > 0:
+    db_container.get_database().enable_circuit_breaker(
+        error_rate=float(os.environ.get("DB_BREAKER_ERROR_RATE", "0.5")),
+        min_calls=int(os.environ.get("DB_BREAKER_MIN_CALLS", "20")),
+        window=float(os.environ.get("DB_BREAKER_WINDOW", "10")),
+        cooldown=float(os.environ.get("DB_BREAKER_COOLDOWN", "5")))
+
+# Opt in to hedging slow single document reads with HEDGED_READS=1
+if os.environ.get("HEDGED_READS", "0") == "1":
+    db_container.get_database().enable_hedged_reads(
+        percentile=float(os.environ.get("HEDGED_READS_PERCENTILE", "95")))
+
+# App Engine runs gunicorn with gunicorn.conf.py through the `entrypoint`
+# in app.yaml, which serves the `app` in `main.py`.
+app = create_app()
 
 if __name__ == '__main__':
     # This is used when running locally only. When deploying to Google App
-    # Engine, a webserver process such as Gunicorn will serve the app. This
-    # can be configured by adding an `entrypoint` to app.yaml.
+    # Engine, gunicorn serves the app as configured in gunicorn.conf.py.
     app.run(threaded=True, host='127.0.0.1', debug=True)
-
@@ -0,0 +1,231 @@
+from database import schema_version, VersionConflict, LEGACY_QUESTION_LIST_KEY, \
+    MAX_BATCH_WRITES, QUESTION_ID_KEY, QUESTION_SCHEMA_VERSION, QUESTION_TALLIES_KEY, ROOM_QUESTIONS_KEY, \
+    ROOM_SCHEMA_VERSION, ROOM_VERSION_KEY, SCHEMA_VERSION_KEY, TIME_START_KEY
+import threading
+import time
+
+# Collection holding the progress of the migration of each collection
+MIGRATION_STATE_COLLECTION = "migrations"
+
+STATE_AFTER = "after"
+STATE_SCANNED = "scanned"
+STATE_MIGRATED = "migrated"
+STATE_DONE = "done"
+
+def migrate_room_history(database, rooms):
+    """
+    Parameters:
+    database - Database manager
+    rooms - List of (room id, room data) tuples of version 1 rooms
+
+    Description:
+    Moves the question history of rooms from the legacy all_questions array to
+    the questions subcollection. Each question keeps the time it was asked so
+    the history stays in order, questions whose document is gone are ordered
+    by their place in the array instead.
+
+    Returns:
+    Tuple of a dictionary of (fields to set, fields to delete) by room id and
+    the list of subcollection documents to write
+    """
+    question_ids = [question_id for _, data in rooms for question_id in data.get(LEGACY_QUESTION_LIST_KEY, [])]
+    questions = dict()
+    for start in range(0, len(question_ids), MAX_BATCH_WRITES):
+        questions.update(database.get_documents("questions", question_ids[start:start + MAX_BATCH_WRITES],
+            [TIME_START_KEY]))
+
+    changes = dict()
+    writes = []
+    for room_id, data in rooms:
+        for index, question_id in enumerate(data.get(LEGACY_QUESTION_LIST_KEY, [])):
+            time_start = questions.get(question_id, {}).get(TIME_START_KEY, index)
+            writes.append(("rooms/%s/%s" % (room_id, ROOM_QUESTIONS_KEY), question_id,
+                {QUESTION_ID_KEY: question_id, TIME_START_KEY: time_start}))
+        changes[room_id] = ({}, [LEGACY_QUESTION_LIST_KEY])
+    return changes, writes
+
+def migrate_question_tallies(database, questions):
+    """
+    Parameters:
+    database - Database manager
+    questions - List of (question id, question data) tuples of version 1 questions
+
+    Description:
+    Counts the answers of questions recorded before tallies were kept. Only
+    the answers missing from the tally shards of a question are stored on the
+    question document, the shards already count those recorded since.
+
+    Returns:
+    Tuple of a dictionary of (fields to set, fields to delete) by question id and
+    the list of other documents to write
+    """
+    changes = dict()
+    for question_id, _ in questions:
+        tallies = database.get_untallied_responses(question_id) or dict()
+        changes[question_id] = ({QUESTION_TALLIES_KEY: tallies}, [])
+    return changes, []
+
+# Schema version each collection is migrated to and the step upgrading each older version
+MIGRATIONS = {
+    "rooms": (ROOM_SCHEMA_VERSION, {1: migrate_room_history}),
+    "questions": (QUESTION_SCHEMA_VERSION, {1: migrate_question_tallies}),
+}
+
+def new_state():
+    return {STATE_AFTER: None, STATE_SCANNED: 0, STATE_MIGRATED: 0, STATE_DONE: False}
+
+class Migrator:
+    """
+    Description:
+    Rewrites the documents of a collection to the latest schema version while
+    the app keeps serving them. Documents are read a page at a time and each
+    page is written back in a batched commit that only applies if none of its
+    documents changed since they were read, pages that lose a race are read
+    again. At most rate documents are rewritten per second.
+
+    Progress is stored in the migrations collection after every page so an
+    interrupted migration resumes where it stopped, from any instance.
+    """
+    def __init__(self, database, collection, batch_size=100, rate=50.0, max_retries=5):
+        """
+        Parameters:
+        database - Database manager
+        collection - Collection to migrate, one of MIGRATIONS
+        batch_size - Number of documents read and written at a time
+        rate - Maximum number of documents rewritten per second, 0 for no limit
+        max_retries - Number of times a page is retried after losing a race
+        """
+        self.database = database
+        self.collection = collection
+        self.target, self.steps = MIGRATIONS[collection]
+        self.batch_size = batch_size
+        self.rate = rate
+        self.max_retries = max_retries
+
+    def load_state(self):
+        states = self.database.get_documents(MIGRATION_STATE_COLLECTION, [self.collection])
+        return states.get(self.collection, new_state())
+
+    def save_state(self, state):
+        self.database.write_documents([(MIGRATION_STATE_COLLECTION, self.collection, state)])
+
+    def run(self, stop=None, pages=None, restart=False):
+        """
+        Parameters:
+        stop - Event that stops the migration after the current page once set
+        pages - Maximum number of pages to migrate, None to migrate the whole collection
+        restart - True to scan the collection from the start again
+
+        Returns:
+        The progress of the migration
+        """
+        state = new_state() if restart else self.load_state()
+        while not state[STATE_DONE] and (stop == None or not stop.is_set()) and (pages == None or pages > 0):
+            started = time.monotonic()
+            page = self.database.get_page(self.collection, self.batch_size, state[STATE_AFTER])
+            if len(page) == 0:
+                state[STATE_DONE] = True
+                self.save_state(state)
+                break
+            migrated = self._migrate_page(page, state[STATE_AFTER])
+            state[STATE_AFTER] = page[-1][0]
+            state[STATE_SCANNED] += len(page)
+            state[STATE_MIGRATED] += migrated
+            self.save_state(state)
+            if pages != None:
+                pages -= 1
+            if migrated > 0 and self.rate > 0:
+                time.sleep(max(0, migrated / self.rate - (time.monotonic() - started)))
+        return state
+
+    def _migrate_page(self, page, after):
+        for _ in range(self.max_retries):
+            try:
+                return self._write_page(page)
+            except VersionConflict:
+                # Documents written since the page was read are read again
+                page = self.database.get_page(self.collection, len(page), after)
+        return self._write_page(page)
+
+    def _write_page(self, page):
+        documents = {document_id: data for document_id, data, _ in page if schema_version(data) < self.target}
+        changes = {document_id: ({}, []) for document_id in documents}
+        writes = []
+        for version in range(1, self.target):
+            at_version = [(document_id, data) for document_id, data in documents.items()
+                if schema_version(data) == version]
+            if len(at_version) == 0:
+                continue
+            step_changes, step_writes = self.steps[version](self.database, at_version)
+            writes += step_writes
+            for document_id, (set_fields, delete_fields) in step_changes.items():
+                changes[document_id][0].update(set_fields)
+                changes[document_id][1].extend(delete_fields)
+                data = dict(documents[document_id], **set_fields)
+                for field in delete_fields:
+                    data.pop(field, None)
+                data[SCHEMA_VERSION_KEY] = version + 1
+                documents[document_id] = data
+        if len(documents) == 0:
+            return 0
+
+        versions = {document_id: version for document_id, _, version in page}
+        patches = []
+        for document_id, (set_fields, delete_fields) in changes.items():
+            set_fields = dict(set_fields, **{SCHEMA_VERSION_KEY: self.target})
+            if self.collection == "rooms":
+                # Clients syncing the room must see the rewrite, it has no change
+                # record so they fall back to a snapshot of the room
+                set_fields[ROOM_VERSION_KEY] = documents[document_id].get(ROOM_VERSION_KEY, 0) + 1
+            patches.append((document_id, set_fields, delete_fields, versions[document_id]))
+        # Writes are idempotent, those that do not fit in the commit are made first
+        if len(patches) + len(writes) > MAX_BATCH_WRITES:
+            self.database.write_documents(writes)
+            writes = []
+        return self.database.patch_documents(self.collection, patches, writes)
+
+class BackgroundMigrations:
+    """
+    Description:
+    Runs the migrations of every collection in a background thread of an
+    instance, one collection after the other.
+    """
+    def __init__(self):
+        self.thread = None
+        self.stop = threading.Event()
+        self.error = None
+        self.lock = threading.Lock()
+
+    def running(self):
+        return self.thread != None and self.thread.is_alive()
+
+    def start(self, database, batch_size=100, rate=50.0, restart=False):
+        """
+        Returns:
+        False if the migrations are already running
+        """
+        with self.lock:
+            if self.running():
+                return False
+            self.stop = threading.Event()
+            self.error = None
+            self.thread = threading.Thread(target=self._run, args=(database, batch_size, rate, restart, self.stop),
+                name="migrations", daemon=True)
+            self.thread.start()
+            return True
+
+    def _run(self, database, batch_size, rate, restart, stop):
+        try:
+            for collection in MIGRATIONS:
+                Migrator(database, collection, batch_size, rate).run(stop, restart=restart)
+        except Exception as error:
+            self.error = str(error)
+
+    def status(self, database):
+        return {
+            "running": self.running(),
+            "error": self.error,
+            "collections": {collection: Migrator(database, collection).load_state() for collection in MIGRATIONS},
+        }
+
+background_migrations = BackgroundMigrations()
@@ -0,0 +1,35 @@
+"""
+Description:
+Migrates room and question documents to the latest schema version while the
+app keeps serving them. Progress is stored in the database, so rerunning the
+command after an interruption resumes where it stopped.
+
+Usage:
+python -m migrations --rate 50
+python -m migrations questions --restart
+"""
+import argparse
+
+from migrations import Migrator, MIGRATIONS, STATE_SCANNED, STATE_MIGRATED
+
+def main():
+    parser = argparse.ArgumentParser(description="Migrate documents to the latest schema version")
+    parser.add_argument("collections", nargs="*", help="Collections to migrate, any of %s, all of them by default"
+        % ", ".join(MIGRATIONS))
+    parser.add_argument("--batch-size", type=int, default=100, help="Documents read and written per commit")
+    parser.add_argument("--rate", type=float, default=50, help="Maximum documents rewritten per second, 0 for no limit")
+    parser.add_argument("--restart", action="store_true", help="Scan the collections from the start again")
+    args = parser.parse_args()
+    collections = args.collections or list(MIGRATIONS)
+    for collection in collections:
+        if collection not in MIGRATIONS:
+            parser.error("unknown collection %s" % collection)
+
+    from main import db_container
+    database = db_container.get_database()
+    for collection in collections:
+        state = Migrator(database, collection, args.batch_size, args.rate).run(restart=args.restart)
+        print("%s: %d documents scanned, %d migrated" % (collection, state[STATE_SCANNED], state[STATE_MIGRATED]))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,137 @@
+import json
+import unittest
+
+from main import app
+from database import db_container
+from admin import ADMIN_TOKEN, ADMIN_TOKEN_HEADER
+from games import USERNAME
+from migrations import Migrator, background_migrations
+
+class BasicTests(unittest.TestCase):
+
+    ############################
+    #### setup and teardown ####
+    ############################
+
+    # executed prior to each test
+    def setUp(self):
+        self.app = app.test_client()
+        db_container.set_test_mode()
+        db_container.get_database()._reset()
+
+        self.token = app.config[ADMIN_TOKEN]
+        app.config[ADMIN_TOKEN] = "test-token"
+
+    # executed after each test
+    def tearDown(self):
+        app.config[ADMIN_TOKEN] = self.token
+
+    def add_question(self, room_id, options):
+        return self.app.post('/questions/%s' % room_id, data=json.dumps({"opt": options})).json
+
+    def make_legacy_room(self):
+        # Rooms from before schema versions keep their history in the room document
+        database = db_container.get_database()
+        room_id = self.app.post('/rooms/').json
+        question_ids = [self.add_question(room_id, [str(i)]) for i in range(3)]
+        database.room_questions[room_id] = []
+        database.rooms[room_id]["all_questions"] = question_ids
+        del database.rooms[room_id]["schema_version"]
+        return room_id, question_ids
+
+    def test_legacy_room_history(self):
+        room_id, question_ids = self.make_legacy_room()
+        new_id = self.add_question(room_id, ["new"])
+        history = [new_id] + list(reversed(question_ids))
+        self.assertEqual(self.app.get('/questions/%s' % room_id).json, history)
+        self.assertEqual(self.app.get('/questions/%s?limit=2&after=%s' % (room_id, new_id)).json, history[1:3])
+        version = self.app.get('/rooms/%s' % room_id).json["version"]
+
+        state = Migrator(db_container.get_database(), "rooms", rate=0).run()
+        self.assertTrue(state["done"])
+        self.assertEqual(state["migrated"], 1)
+
+        room_data = self.app.get('/rooms/%s' % room_id).json
+        self.assertEqual(room_data["schema_version"], 2)
+        # The rewrite bumps the room version and clients syncing it get a snapshot
+        self.assertEqual(room_data["version"], version + 1)
+        result_changes = self.app.get('/rooms/%s/changes?since=%d' % (room_id, version))
+        self.assertEqual(result_changes.json["snapshot"], room_data)
+        self.assertNotIn("all_questions", room_data)
+        self.assertEqual(self.app.get('/questions/%s' % room_id).json, history)
+
+    def test_legacy_question_tallies(self):
+        room_id = self.app.post('/rooms/').json
+        question_id = self.add_question(room_id, ["a", "b"])
+        question_data = db_container.get_database().questions[question_id]
+        del question_data["schema_version"]
+        # Answers recorded before tallies were kept are in no tally shard
+        question_data["responses"] = {"P1": "a", "P2": "b"}
+        question_data["tallies"] = {"b": 1}
+        for player, answer in [("P2", "a"), ("P3", "b")]:
+            self.app.post('/responses/%s' % question_id, json=answer, headers={USERNAME: player})
+
+        Migrator(db_container.get_database(), "questions", rate=0).run()
+        self.assertEqual(question_data["schema_version"], 2)
+        self.assertEqual(question_data["tallies"], {"a": 1, "b": 1})
+        result_list = self.app.get('/questions/%s?expand=responses' % room_id)
+        self.assertEqual(result_list.json, [{"question_id": question_id, "responses": {"a": 2, "b": 1}}])
+
+    def test_resumes_from_checkpoint(self):
+        room_ids = sorted(self.make_legacy_room()[0] for _ in range(3))
+        database = db_container.get_database()
+
+        state = Migrator(database, "rooms", batch_size=1, rate=0).run(pages=2)
+        self.assertEqual(state["after"], room_ids[1])
+        self.assertNotIn("schema_version", database.rooms[room_ids[2]])
+
+        state = Migrator(database, "rooms", batch_size=1, rate=0).run()
+        self.assertTrue(state["done"])
+        self.assertEqual(state["scanned"], 3)
+        self.assertEqual(state["migrated"], 3)
+        self.assertEqual(database.rooms[room_ids[2]]["schema_version"], 2)
+
+        # Finished migrations are not run again unless restarted
+        self.assertEqual(Migrator(database, "rooms", rate=0).run()["scanned"], 3)
+        self.assertEqual(Migrator(database, "rooms", rate=0).run(restart=True)["migrated"], 0)
+
+    def test_retries_documents_written_while_migrating(self):
+        room_id, question_ids = self.make_legacy_room()
+        database = db_container.get_database()
+        get_page = database.get_page
+        reads = []
+        def racing_get_page(*args):
+            page = get_page(*args)
+            reads.append(page)
+            # A player joins between the first read of the room and its rewrite
+            if len(reads) == 1:
+                database.update_room(room_id, {"players": ["P1"]})
+            return page
+        database.get_page = racing_get_page
+
+        state = Migrator(database, "rooms", rate=0).run()
+        self.assertEqual(state["migrated"], 1)
+        self.assertEqual(len(reads), 3)
+        self.assertEqual(database.rooms[room_id]["players"], ["P1"])
+        self.assertEqual(database.rooms[room_id]["schema_version"], 2)
+        self.assertEqual(database.get_question_list(room_id), list(reversed(question_ids)))
+
+    def test_admin_migrations(self):
+        room_id, _ = self.make_legacy_room()
+        result_post = self.app.post('/admin/migrations', json={"rate": 0}, headers={ADMIN_TOKEN_HEADER: "test-token"})
+        self.assertEqual(result_post.status_code, 202)
+        background_migrations.thread.join(5)
+
+        result_get = self.app.get('/admin/migrations', headers={ADMIN_TOKEN_HEADER: "test-token"})
+        self.assertEqual(result_get.status_code, 200)
+        self.assertFalse(result_get.json["running"])
+        self.assertEqual(result_get.json["error"], None)
+        self.assertTrue(result_get.json["collections"]["rooms"]["done"])
+        self.assertTrue(result_get.json["collections"]["questions"]["done"])
+        self.assertEqual(db_container.get_database().rooms[room_id]["schema_version"], 2)
+
+        result_post = self.app.post('/admin/migrations', json={"rate": -1}, headers={ADMIN_TOKEN_HEADER: "test-token"})
+        self.assertEqual(result_post.status_code, 400)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,200 @@
+import copy
+import hashlib
+import json
+import os
+import threading
+
+QUESTION_PACKS_DIR = "QUESTION_PACKS_DIR"
+DEFAULT_PACKS_DIR = os.path.join(os.path.dirname(__file__), "data")
+
+PACK_ID_KEY = "pack_id"
+PACK_NAME_KEY = "name"
+PACK_QUESTIONS_KEY = "questions"
+PACK_SIZE_KEY = "size"
+ENTRY_ID_KEY = "id"
+ENTRY_OPTIONS_KEY = "options"
+
+# Separates the pack id from the id of the entry within the pack in entry references
+ENTRY_SEPARATOR = "/"
+# Separates an entry reference from the version of the entry's options
+VERSION_SEPARATOR = "@"
+
+class InvalidPack(Exception):
+    """
+    Description:
+    Raised when a pack file is not a valid question pack.
+    """
+    pass
+
+def entry_reference(pack_id, entry_id):
+    """
+    Parameters:
+    pack_id - Id of the pack
+    entry_id - Id of the entry within the pack
+
+    Returns:
+    The reference a question stores for the entry, such as `starter/colors`
+    """
+    return "%s%s%s" % (pack_id, ENTRY_SEPARATOR, entry_id)
+
+def entry_version(options):
+    """
+    Parameters:
+    options - List of the options of a pack entry
+
+    Returns:
+    Version of the entry, which changes whenever its options do
+    """
+    return hashlib.sha1(json.dumps(options, sort_keys=True).encode()).hexdigest()[:12]
+
+class QuestionPacks:
+    """
+    Description:
+    Curated question prompts loaded into memory from the JSON files of a
+    directory, one pack per file named after the pack id. Questions created
+    from a pack only store the versioned reference of their entry, such as
+    `starter/colors@<version>`, and their options are resolved from memory
+    without reading the database. Versions replaced by a reload are kept in
+    memory so questions created from them still resolve.
+
+    A pack file holds a name and a list of questions, each with an id that is
+    unique within the pack and its list of options:
+    {"name": "Starter", "questions": [{"id": "colors", "options": ["Red", "Blue"]}]}
+    """
+    def __init__(self):
+        self.packs = dict()
+        self.entries = dict()
+        self.versions = dict()
+        self.lock = threading.Lock()
+
+    def load(self, directory):
+        """
+        Parameters:
+        directory - Directory of the pack files
+
+        Description:
+        Replaces the loaded packs with those in the directory. A missing
+        directory leaves no packs loaded.
+
+        Returns:
+        Number of packs loaded
+        """
+        packs = dict()
+        if os.path.isdir(directory):
+            for file_name in sorted(os.listdir(directory)):
+                pack_id, extension = os.path.splitext(file_name)
+                if extension != ".json":
+                    continue
+                with open(os.path.join(directory, file_name), encoding="utf-8") as pack_file:
+                    try:
+                        packs[pack_id] = json.load(pack_file)
+                    except ValueError as error:
+                        raise InvalidPack("%s is not valid JSON: %s" % (file_name, error))
+        self.set_packs(packs)
+        return len(packs)
+
+    def set_packs(self, packs):
+        """
+        Parameters:
+        packs - Dictionary of pack data by pack id
+
+        Description:
+        Validates and indexes the packs, replacing those loaded before. The
+        loaded packs are left untouched when any pack is invalid.
+        """
+        entries = dict()
+        for pack_id, pack in packs.items():
+            if ENTRY_SEPARATOR in pack_id or VERSION_SEPARATOR in pack_id or type(pack) != dict or type(pack.get(PACK_QUESTIONS_KEY, None)) != list:
+                raise InvalidPack("Pack %s must be a dictionary with a list of questions" % pack_id)
+            for entry in pack[PACK_QUESTIONS_KEY]:
+                if type(entry) != dict or type(entry.get(ENTRY_ID_KEY, None)) != str \
+                        or VERSION_SEPARATOR in entry[ENTRY_ID_KEY] or type(entry.get(ENTRY_OPTIONS_KEY, None)) != list:
+                    raise InvalidPack("Questions of pack %s must have an id and a list of options" % pack_id)
+                reference = entry_reference(pack_id, entry[ENTRY_ID_KEY])
+                if reference in entries:
+                    raise InvalidPack("Pack %s has more than one question %s" % (pack_id, entry[ENTRY_ID_KEY]))
+                entries[reference] = entry[ENTRY_OPTIONS_KEY]
+        with self.lock:
+            versions = dict(self.versions)
+            for reference, options in entries.items():
+                versions[reference + VERSION_SEPARATOR + entry_version(options)] = copy.deepcopy(options)
+            self.packs = copy.deepcopy(packs)
+            self.entries = copy.deepcopy(entries)
+            self.versions = versions
+
+    def current_reference(self, reference):
+        """
+        Parameters:
+        reference - Entry reference, with or without a version
+
+        Returns:
+        The reference with the version of the entry's options, the version
+        loaded now if the reference has none, None if there is no such entry
+        """
+        if VERSION_SEPARATOR in reference:
+            return reference if reference in self.versions else None
+        options = self.entries.get(reference, None)
+        if options == None:
+            return None
+        return reference + VERSION_SEPARATOR + entry_version(options)
+
+    def exists(self, reference):
+        return self.current_reference(reference) != None
+
+    def get_options(self, reference):
+        """
+        Parameters:
+        reference - Entry reference of the form `<pack id>/<entry id>`, optionally
+            followed by `@<version>`
+
+        Returns:
+        A copy of the options of the entry, None if there is no such entry or
+        version in memory
+        """
+        entries = self.versions if VERSION_SEPARATOR in reference else self.entries
+        options = entries.get(reference, None)
+        if options == None:
+            return None
+        return list(options)
+
+    def list_packs(self):
+        """
+        Returns:
+        List of the id, name and number of questions of every pack
+        """
+        packs = self.packs
+        return [{PACK_ID_KEY: pack_id, PACK_NAME_KEY: pack.get(PACK_NAME_KEY, pack_id),
+            PACK_SIZE_KEY: len(pack[PACK_QUESTIONS_KEY])} for pack_id, pack in sorted(packs.items())]
+
+    def get_pack(self, pack_id):
+        """
+        Parameters:
+        pack_id - Id of the pack
+
+        Returns:
+        The pack with the reference of each of its entries, None if there is no such pack
+        """
+        pack = self.packs.get(pack_id, None)
+        if pack == None:
+            return None
+        return {
+            PACK_ID_KEY: pack_id,
+            PACK_NAME_KEY: pack.get(PACK_NAME_KEY, pack_id),
+            PACK_QUESTIONS_KEY: [{ENTRY_ID_KEY: entry_reference(pack_id, entry[ENTRY_ID_KEY]),
+                ENTRY_OPTIONS_KEY: list(entry[ENTRY_OPTIONS_KEY])} for entry in pack[PACK_QUESTIONS_KEY]],
+        }
+
+question_packs = QuestionPacks()
+
+def init_app(app):
+    """
+    Parameters:
+    app - Flask app
+
+    Description:
+    Loads the question packs in QUESTION_PACKS_DIR into memory, by default the
+    packs shipped in packs/data.
+    """
+    app.config.setdefault(QUESTION_PACKS_DIR, os.environ.get(QUESTION_PACKS_DIR, DEFAULT_PACKS_DIR))
+    question_packs.load(app.config[QUESTION_PACKS_DIR])
+    app.extensions["packs"] = question_packs
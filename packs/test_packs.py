@@ -0,0 +1,110 @@
+import json
+import os
+import tempfile
+import unittest
+
+from main import app
+from database import db_container, QUESTION_OPTIONS_KEY, QUESTION_PACK_ENTRY_KEY
+from packs import question_packs, QuestionPacks, InvalidPack, QUESTION_PACKS_DIR
+
+class BasicTests(unittest.TestCase):
+
+    ############################
+    #### setup and teardown ####
+    ############################
+
+    # executed prior to each test
+    def setUp(self):
+        self.app = app.test_client()
+        db_container.set_test_mode()
+        db_container.get_database()._reset()
+        question_packs.load(app.config[QUESTION_PACKS_DIR])
+
+        self.room_id = self.app.post('/rooms/').json
+
+    # executed after each test
+    def tearDown(self):
+        question_packs.load(app.config[QUESTION_PACKS_DIR])
+
+    def add_question(self, body):
+        return self.app.post('/questions/%s' % self.room_id, data=json.dumps(body))
+
+    def test_list_packs(self):
+        result_get = self.app.get('/questions/packs')
+        self.assertEqual(result_get.status_code, 200)
+        self.assertIn("starter", [pack["pack_id"] for pack in result_get.json])
+
+        result_get = self.app.get('/questions/packs/starter')
+        self.assertEqual(result_get.status_code, 200)
+        self.assertIn({"id": "starter/pets", "options": ["Cat", "Dog", "Fish", "Bird"]}, result_get.json["questions"])
+
+        self.assertEqual(self.app.get('/questions/packs/none').status_code, 404)
+
+    def test_question_from_pack(self):
+        result_post = self.add_question({"pack": "starter/pets"})
+        self.assertEqual(result_post.status_code, 200)
+        question_id = result_post.json
+
+        # Only the reference is stored with the question, with the version of the entry
+        question_data = db_container.get_database().questions[question_id]
+        self.assertEqual(question_data[QUESTION_PACK_ENTRY_KEY], question_packs.current_reference("starter/pets"))
+        self.assertTrue(question_data[QUESTION_PACK_ENTRY_KEY].startswith("starter/pets@"))
+        self.assertNotIn(QUESTION_OPTIONS_KEY, question_data)
+
+        result_get = self.app.get('/questions/%s/%s' % (self.room_id, question_id))
+        self.assertEqual(result_get.json, ["Cat", "Dog", "Fish", "Bird"])
+
+        other_id = self.add_question({"opt": ["a", "b"]}).json
+        result_list = self.app.get('/questions/%s?expand=options' % self.room_id)
+        self.assertEqual(result_list.json, [
+            {"question_id": other_id, "options": ["a", "b"]},
+            {"question_id": question_id, "options": ["Cat", "Dog", "Fish", "Bird"]},
+        ])
+
+    def test_unknown_pack_entry(self):
+        result_post = self.add_question({"pack": "starter/none"})
+        self.assertEqual(result_post.status_code, 400)
+        self.assertEqual(self.add_question({"pack": ["starter/pets"]}).status_code, 400)
+        self.assertEqual(self.add_question({"pack": {"id": "starter/pets"}}).status_code, 400)
+        self.assertEqual(self.app.get('/questions/%s' % self.room_id).json, [])
+
+    def test_pack_edited(self):
+        question_id = self.add_question({"pack": "starter/pets"}).json
+
+        # Questions keep the options of the version they were created from
+        question_packs.set_packs({"starter": {"questions": [{"id": "pets", "options": ["Cat", "Dog"]}]}})
+        result_get = self.app.get('/questions/%s/%s' % (self.room_id, question_id))
+        self.assertEqual(result_get.json, ["Cat", "Dog", "Fish", "Bird"])
+        new_id = self.add_question({"pack": "starter/pets"}).json
+        self.assertEqual(self.app.get('/questions/%s/%s' % (self.room_id, new_id)).json, ["Cat", "Dog"])
+
+        # Even once the version is no longer in memory
+        packs = QuestionPacks()
+        question_packs.packs, question_packs.entries, question_packs.versions = packs.packs, packs.entries, packs.versions
+        database = db_container.get_database()
+        self.assertEqual(database.get_question_options(question_id), ["Cat", "Dog", "Fish", "Bird"])
+        result_list = self.app.get('/questions/%s?expand=options' % self.room_id)
+        self.assertEqual(result_list.json, [
+            {"question_id": new_id, "options": ["Cat", "Dog"]},
+            {"question_id": question_id, "options": ["Cat", "Dog", "Fish", "Bird"]},
+        ])
+
+    def test_load_packs(self):
+        packs = QuestionPacks()
+        with tempfile.TemporaryDirectory() as directory:
+            with open(os.path.join(directory, "party.json"), "w") as pack_file:
+                json.dump({"name": "Party", "questions": [{"id": "drinks", "options": ["Tea", "Coffee"]}]}, pack_file)
+            with open(os.path.join(directory, "notes.txt"), "w") as other_file:
+                other_file.write("not a pack")
+            self.assertEqual(packs.load(directory), 1)
+        self.assertEqual(packs.get_options("party/drinks"), ["Tea", "Coffee"])
+        self.assertEqual(packs.list_packs(), [{"pack_id": "party", "name": "Party", "size": 1}])
+
+        # Invalid packs leave the loaded packs in place
+        duplicate = {"questions": [{"id": "a", "options": []}, {"id": "a", "options": []}]}
+        self.assertRaises(InvalidPack, packs.set_packs, {"dup": duplicate})
+        self.assertRaises(InvalidPack, packs.set_packs, {"bad": {"questions": [{"id": "a"}]}})
+        self.assertTrue(packs.exists("party/drinks"))
+
+if __name__ == '__main__':
+    unittest.main()
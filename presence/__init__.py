@@ -0,0 +1,299 @@
+from flask import current_app
+from database import db_container, PRESENCE_UPDATED_KEY
+import os
+import threading
+import time
+import uuid
+
+PRESENCE_TIMEOUT = "PRESENCE_TIMEOUT"
+PRESENCE_FLUSH_INTERVAL = "PRESENCE_FLUSH_INTERVAL"
+
+SUMMARY_UPDATED_KEY = PRESENCE_UPDATED_KEY
+SUMMARY_ONLINE_KEY = "online"
+SUMMARY_PLAYERS_KEY = "players"
+
+PLAYER_ONLINE_KEY = "online"
+PLAYER_LAST_SEEN_KEY = "last_seen"
+
+# Players are forgotten once they have not been seen for this many timeouts
+FORGET_AFTER_TIMEOUTS = 10
+# Summaries of instances that stopped flushing a room are dropped after this many
+# flush intervals on top of the timeout, once none of their players can be online
+EXPIRE_AFTER_FLUSHES = 3
+
+class PresenceTracker:
+    """
+    Description:
+    Records player heartbeats in memory and keeps the last time each player of
+    a room was seen by this instance. Heartbeats never touch the database,
+    instead a compact summary of each room is flushed to the database at
+    most once every flush_interval seconds, for rooms with players online and
+    rooms whose players or online count changed since the last flush. Rooms with
+    players online are flushed every time so the last seen times other instances
+    read are never more than flush_interval seconds behind.
+
+    Flushes run on a background thread started by start, so heartbeats never
+    wait on the database.
+
+    A player is online while they have been seen within timeout seconds.
+    """
+    def __init__(self, timeout, flush_interval):
+        """
+        Parameters:
+        timeout - Seconds after the last heartbeat before a player is offline
+        flush_interval - Minimum seconds between flushes to the database
+        """
+        self.timeout = timeout
+        self.flush_interval = flush_interval
+        self.max_summary_age = timeout + flush_interval * EXPIRE_AFTER_FLUSHES
+        self.lock = threading.Lock()
+        self.flushing = threading.Lock()
+        self.flusher = None
+        self.stopped = threading.Event()
+        self._start()
+
+    def _start(self):
+        # Worker processes forked from a preloaded app each track their own players
+        self.pid = os.getpid()
+        self.instance_id = "i" + uuid.uuid4().hex[:12]
+        self.rooms = dict()
+        self.dirty = set()
+        self.flushed = dict()
+        self.last_flush = time.time()
+        self.errors = 0
+
+    def _check_fork(self):
+        if self.pid != os.getpid():
+            self._start()
+
+    def start(self, write):
+        """
+        Parameters:
+        write - Function writing a summary, as given to flush
+
+        Description:
+        Starts the thread flushing summaries every flush_interval seconds, unless
+        this process already runs it. Threads do not survive a fork, so every
+        worker process starts its own.
+        """
+        with self.lock:
+            self._check_fork()
+            if self.flusher != None and self.flusher.is_alive():
+                return
+            self.stopped.clear()
+            self.flusher = threading.Thread(target=self._flush_loop, args=(write,), name="presence-flush", daemon=True)
+            self.flusher.start()
+
+    def stop(self):
+        self.stopped.set()
+
+    def _flush_loop(self, write):
+        while not self.stopped.wait(self.flush_interval):
+            self.flush(write)
+
+    def heartbeat(self, room_id, player, now=None):
+        """
+        Parameters:
+        room_id - Identity of the room
+        player - Name of the player
+        now - Time of the heartbeat, defaults to the current time
+        """
+        now = time.time() if now == None else now
+        with self.lock:
+            self._check_fork()
+            seen = self.rooms.setdefault(room_id, dict())
+            previous = seen.get(player, None)
+            seen[player] = now
+            # Heartbeats from players already online only move their last seen time,
+            # which the next flush writes anyway
+            if previous == None or now - previous > self.timeout:
+                self.dirty.add(room_id)
+
+    def last_seen(self, room_id):
+        """
+        Parameters:
+        room_id - Identity of the room
+
+        Returns:
+        Dictionary of the last time this instance saw each player of the room
+        """
+        with self.lock:
+            self._check_fork()
+            return dict(self.rooms.get(room_id, {}))
+
+    def summary(self, room_id, now=None):
+        """
+        Parameters:
+        room_id - Identity of the room
+        now - Time of the summary, defaults to the current time
+
+        Description:
+        Gets the compact summary of a room that is flushed to the room document.
+        """
+        now = time.time() if now == None else now
+        with self.lock:
+            return self._summary(room_id, now)
+
+    def _summary(self, room_id, now):
+        seen = self.rooms.get(room_id, {})
+        online = sum(1 for last_seen in seen.values() if now - last_seen <= self.timeout)
+        return {SUMMARY_UPDATED_KEY: now, SUMMARY_ONLINE_KEY: online, SUMMARY_PLAYERS_KEY: dict(seen)}
+
+    def flush_due(self, now=None):
+        now = time.time() if now == None else now
+        return now - self.last_flush >= self.flush_interval
+
+    def flush(self, write, now=None):
+        """
+        Parameters:
+        write - Function taking a room id, instance id, summary and the age after
+            which summaries of other instances are dropped, that writes the summary
+            of the room and returns None if the room no longer exists
+        now - Time of the flush, defaults to the current time
+
+        Description:
+        Writes the summary of every room with players online or that changed
+        since the last flush. A room whose write fails is written again at the
+        next flush and does not stop the other rooms from being written. Only
+        one thread flushes at a time, other callers return straight away.
+
+        Returns:
+        Number of rooms written
+        """
+        if not self.flushing.acquire(blocking=False):
+            return 0
+        try:
+            now = time.time() if now == None else now
+            with self.lock:
+                self._check_fork()
+                self.last_flush = now
+                pending = dict()
+                for room_id in list(self.rooms):
+                    seen = self.rooms[room_id]
+                    for player in [p for p, last_seen in seen.items() if now - last_seen > self.timeout * FORGET_AFTER_TIMEOUTS]:
+                        del seen[player]
+                    summary = self._summary(room_id, now)
+                    if room_id in self.dirty or summary[SUMMARY_ONLINE_KEY] > 0 \
+                            or summary[SUMMARY_ONLINE_KEY] != self.flushed.get(room_id, None):
+                        pending[room_id] = summary
+                    if len(seen) == 0:
+                        del self.rooms[room_id]
+                        self.flushed.pop(room_id, None)
+                self.dirty.clear()
+
+            written = 0
+            for room_id, summary in pending.items():
+                try:
+                    result = write(room_id, self.instance_id, summary, self.max_summary_age)
+                except Exception:
+                    with self.lock:
+                        self.errors += 1
+                        if room_id in self.rooms:
+                            self.dirty.add(room_id)
+                    continue
+                if result == None:
+                    self._forget(room_id)
+                else:
+                    with self.lock:
+                        if room_id in self.rooms:
+                            self.flushed[room_id] = summary[SUMMARY_ONLINE_KEY]
+                written += 1
+            return written
+        finally:
+            self.flushing.release()
+
+    def _forget(self, room_id):
+        with self.lock:
+            self.rooms.pop(room_id, None)
+            self.flushed.pop(room_id, None)
+            self.dirty.discard(room_id)
+
+def merge_presence(players, summaries, local_id, local_seen, timeout, flush_interval, now=None):
+    """
+    Parameters:
+    players - List of the players that joined the room
+    summaries - Dictionary of the summaries flushed to the room by instance id
+    local_id - Identity of this instance, whose flushed summary is replaced by local_seen
+    local_seen - Dictionary of the last time this instance saw each player
+    timeout - Seconds after the last heartbeat before a player is offline
+    flush_interval - Seconds summaries from other instances can lag behind
+    now - Time to work out presence at, defaults to the current time
+
+    Description:
+    Combines the presence seen by every instance serving a room. Flushed
+    summaries can be up to flush_interval seconds old so players seen by another
+    instance are online for that much longer.
+
+    Returns:
+    Dictionary of the online count and each player's online state and last seen time
+    """
+    now = time.time() if now == None else now
+    last_seen = dict()
+    remote_seen = dict()
+    for instance_id, summary in summaries.items():
+        if instance_id == local_id:
+            continue
+        for player, seen in summary.get(SUMMARY_PLAYERS_KEY, {}).items():
+            remote_seen[player] = max(seen, remote_seen.get(player, seen))
+            last_seen[player] = max(seen, last_seen.get(player, seen))
+    for player, seen in local_seen.items():
+        last_seen[player] = max(seen, last_seen.get(player, seen))
+
+    presence = dict()
+    for player in players:
+        online = (player in local_seen and now - local_seen[player] <= timeout) or \
+            (player in remote_seen and now - remote_seen[player] <= timeout + flush_interval)
+        presence[player] = {PLAYER_ONLINE_KEY: online, PLAYER_LAST_SEEN_KEY: last_seen.get(player, None)}
+    online = sum(1 for player in presence.values() if player[PLAYER_ONLINE_KEY])
+    return {SUMMARY_ONLINE_KEY: online, SUMMARY_PLAYERS_KEY: presence}
+
+def write_presence(room_id, instance_id, summary, max_age):
+    return db_container.get_database().set_presence(room_id, instance_id, summary, max_age)
+
+def heartbeat(room_id, player):
+    """
+    Parameters:
+    room_id - Identity of the room
+    player - Name of the player
+
+    Description:
+    Records a heartbeat from a player, starting the thread flushing the presence
+    summaries of this instance to the database if it is not running yet.
+    """
+    tracker = current_app.extensions["presence"]
+    tracker.heartbeat(room_id, player)
+    tracker.start(write_presence)
+
+def room_presence(room_id):
+    """
+    Parameters:
+    room_id - Identity of the room
+
+    Description:
+    Gets the presence of every player of a room across all instances.
+
+    Returns:
+    Presence dictionary from merge_presence or None if the room does not exist
+    """
+    tracker = current_app.extensions["presence"]
+    room_data = db_container.get_database().get_presence(room_id)
+    if room_data == None:
+        return None
+    players, summaries = room_data
+    return merge_presence(players, summaries, tracker.instance_id, tracker.last_seen(room_id),
+        tracker.timeout, tracker.flush_interval)
+
+def init_app(app):
+    """
+    Parameters:
+    app - Flask app
+
+    Description:
+    Tracks player presence in memory, flushing summaries of the rooms to the
+    database every PRESENCE_FLUSH_INTERVAL seconds from a background thread of
+    each worker, started by the first heartbeat. Players are offline once they have
+    not sent a heartbeat for PRESENCE_TIMEOUT seconds.
+    """
+    app.config.setdefault(PRESENCE_TIMEOUT, float(os.environ.get(PRESENCE_TIMEOUT, "30")))
+    app.config.setdefault(PRESENCE_FLUSH_INTERVAL, float(os.environ.get(PRESENCE_FLUSH_INTERVAL, "15")))
+    app.extensions["presence"] = PresenceTracker(app.config[PRESENCE_TIMEOUT], app.config[PRESENCE_FLUSH_INTERVAL])
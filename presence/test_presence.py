@@ -0,0 +1,163 @@
+import time
+import unittest
+
+from main import app
+from database import db_container, PRESENCE_KEY
+from games import ROOM_ID, USERNAME
+from presence import PresenceTracker, merge_presence
+
+class BasicTests(unittest.TestCase):
+
+    def setUp(self):
+        self.app = app.test_client()
+        db_container.set_test_mode()
+        db_container.get_database()._reset()
+        self.tracker = PresenceTracker(30, 15)
+        self.previous_tracker = app.extensions["presence"]
+        app.extensions["presence"] = self.tracker
+
+        self.room_id = self.app.post('/rooms/').json
+
+    def tearDown(self):
+        self.tracker.stop()
+        app.extensions["presence"] = self.previous_tracker
+
+    def join(self, name):
+        client = app.test_client()
+        result_join = client.post('/games/join', headers={ROOM_ID: self.room_id, USERNAME: name})
+        self.assertEqual(result_join.status_code, 200)
+        return client
+
+    def test_ping_marks_player_online(self):
+        player = self.join("player1")
+        self.join("player2")
+
+        self.assertEqual(player.get('/games/ping').status_code, 200)
+        result_get = self.app.get('/rooms/%s/presence' % self.room_id)
+        self.assertEqual(result_get.status_code, 200)
+        self.assertEqual(result_get.json["online"], 1)
+        self.assertTrue(result_get.json["players"]["PLAYER1"]["online"])
+        self.assertFalse(result_get.json["players"]["PLAYER2"]["online"])
+        self.assertEqual(result_get.json["players"]["PLAYER2"]["last_seen"], None)
+
+    def test_presence_no_room(self):
+        self.assertEqual(self.app.get('/rooms/ABCD/presence').status_code, 404)
+
+    def test_ping_does_not_write(self):
+        player = self.join("player1")
+        room_before = self.app.get('/rooms/%s' % self.room_id)
+        for _ in range(5):
+            player.get('/games/ping')
+        room_after = self.app.get('/rooms/%s' % self.room_id)
+        self.assertEqual(room_before.headers['ETag'], room_after.headers['ETag'])
+        self.assertNotIn(PRESENCE_KEY, room_after.json)
+
+    def test_flush_writes_changed_rooms(self):
+        now = time.time()
+        room_before = self.app.get('/rooms/%s' % self.room_id)
+        self.tracker.heartbeat(self.room_id, "PLAYER1", now)
+        self.assertEqual(self.tracker.flush(db_container.get_database().set_presence, now), 1)
+        summary = db_container.get_database().get_presence(self.room_id)[1][self.tracker.instance_id]
+        self.assertEqual(summary["online"], 1)
+        self.assertEqual(summary["players"], {"PLAYER1": now})
+
+        # Presence is kept out of the room and its version
+        room_after = self.app.get('/rooms/%s' % self.room_id)
+        self.assertEqual(room_before.headers['ETag'], room_after.headers['ETag'])
+        self.assertNotIn(PRESENCE_KEY, room_after.json)
+
+        # Rooms with players online are flushed with their latest last seen times
+        self.tracker.heartbeat(self.room_id, "PLAYER1", now + 5)
+        self.assertEqual(self.tracker.flush(db_container.get_database().set_presence, now + 15), 1)
+        summary = db_container.get_database().get_presence(self.room_id)[1][self.tracker.instance_id]
+        self.assertEqual(summary["players"], {"PLAYER1": now + 5})
+
+        # The player going offline is flushed once
+        self.assertEqual(self.tracker.flush(db_container.get_database().set_presence, now + 40), 1)
+        self.assertEqual(self.tracker.flush(db_container.get_database().set_presence, now + 55), 0)
+
+    def test_presence_seen_by_other_instance(self):
+        database = db_container.get_database()
+        database.add_player(self.room_id, "PLAYER1")
+        other = PresenceTracker(30, 15)
+        now = self.tracker.last_flush
+
+        # A player keeps pinging one instance for longer than the timeout
+        for seconds in range(0, 120, 5):
+            self.tracker.heartbeat(self.room_id, "PLAYER1", now + seconds)
+            if self.tracker.flush_due(now + seconds):
+                self.tracker.flush(database.set_presence, now + seconds)
+
+        players, summaries = database.get_presence(self.room_id)
+        presence = merge_presence(players, summaries, other.instance_id, other.last_seen(self.room_id),
+            other.timeout, other.flush_interval, now + 115)
+        self.assertEqual(presence["online"], 1)
+        self.assertGreaterEqual(presence["players"]["PLAYER1"]["last_seen"], now + 100)
+
+    def test_flush_drops_expired_summaries(self):
+        database = db_container.get_database()
+        other = PresenceTracker(30, 15)
+        now = time.time()
+        other.heartbeat(self.room_id, "PLAYER2", now)
+        other.flush(database.set_presence, now)
+
+        # Instances that stopped flushing the room have their summaries dropped
+        self.tracker.heartbeat(self.room_id, "PLAYER1", now + 60)
+        self.tracker.flush(database.set_presence, now + 60)
+        self.assertEqual(sorted(database.get_presence(self.room_id)[1]), sorted([other.instance_id, self.tracker.instance_id]))
+        self.tracker.heartbeat(self.room_id, "PLAYER1", now + 80)
+        self.tracker.flush(database.set_presence, now + 80)
+        self.assertEqual(list(database.get_presence(self.room_id)[1]), [self.tracker.instance_id])
+
+    def test_flush_continues_after_failed_room(self):
+        database = db_container.get_database()
+        other_room = self.app.post('/rooms/').json
+        now = time.time()
+        self.tracker.heartbeat(self.room_id, "PLAYER1", now)
+        self.tracker.heartbeat(other_room, "PLAYER2", now)
+
+        def write(room_id, instance_id, summary, max_age):
+            if room_id == self.room_id:
+                raise TimeoutError()
+            return database.set_presence(room_id, instance_id, summary, max_age)
+
+        self.assertEqual(self.tracker.flush(write, now), 1)
+        self.assertEqual(self.tracker.errors, 1)
+        self.assertIn(self.tracker.instance_id, database.get_presence(other_room)[1])
+
+        # The failed room is written by the next flush
+        self.assertEqual(self.tracker.flush(database.set_presence, now + 15), 2)
+        self.assertIn(self.tracker.instance_id, database.get_presence(self.room_id)[1])
+
+    def test_ping_starts_flusher(self):
+        self.tracker = PresenceTracker(30, 0.01)
+        app.extensions["presence"] = self.tracker
+        player = self.join("player1")
+        self.assertEqual(player.get('/games/ping').status_code, 200)
+
+        deadline = time.time() + 5
+        while self.tracker.instance_id not in db_container.get_database().get_presence(self.room_id)[1]:
+            self.assertLess(time.time(), deadline)
+            time.sleep(0.01)
+        self.assertTrue(self.tracker.flusher.is_alive())
+
+    def test_flush_forgets_deleted_rooms(self):
+        self.tracker.heartbeat("ABCD", "PLAYER1")
+        self.assertEqual(self.tracker.flush(db_container.get_database().set_presence), 1)
+        self.assertEqual(self.tracker.last_seen("ABCD"), {})
+
+    def test_merge_presence(self):
+        now = 1000
+        summaries = {
+            "local": {"players": {"A": now - 100}},
+            "other": {"players": {"B": now - 40, "C": now - 50}},
+        }
+        presence = merge_presence(["A", "B", "C", "D"], summaries, "local", {"A": now - 10}, 30, 15, now)
+        self.assertEqual(presence["online"], 2)
+        self.assertEqual(presence["players"]["A"], {"online": True, "last_seen": now - 10})
+        self.assertEqual(presence["players"]["B"], {"online": True, "last_seen": now - 40})
+        self.assertEqual(presence["players"]["C"], {"online": False, "last_seen": now - 50})
+        self.assertEqual(presence["players"]["D"], {"online": False, "last_seen": None})
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,113 @@
+from flask import current_app, g, request
+import cProfile
+import hmac
+import json
+import os
+import pstats
+import random
+import tempfile
+import threading
+
+PROFILE_HEADER = "X-Profile"
+
+PROFILE_DIR = "PROFILE_DIR"
+PROFILE_SAMPLE_RATE = "PROFILE_SAMPLE_RATE"
+
+DATABASE_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "database")
+
+class RequestProfiler:
+    """
+    Description:
+    Profiles a sampled fraction of requests, and requests sending the admin token
+    in the X-Profile header, with cProfile. Profiles are aggregated per route and
+    written to the profile directory as <route>.prof pstats files, along with a
+    summary.json of the time each route spent in each database method.
+
+    One request is profiled at a time, requests arriving while another is being
+    profiled are not profiled.
+    """
+    def __init__(self, profile_dir, sample_rate):
+        self.profile_dir = profile_dir
+        self.sample_rate = sample_rate
+        self.stats = dict()
+        self.summary = dict()
+        self.active = threading.Lock()
+        self.lock = threading.Lock()
+
+    def should_profile(self, token):
+        if self.sample_rate > 0 and random.random() < self.sample_rate:
+            return True
+        given = request.headers.get(PROFILE_HEADER, None)
+        return given != None and token != None and hmac.compare_digest(given.encode(), token.encode())
+
+    def start(self):
+        if not self.active.acquire(blocking=False):
+            return None
+        profile = cProfile.Profile()
+        profile.enable()
+        return profile
+
+    def stop(self, profile, endpoint):
+        profile.disable()
+        self.active.release()
+        profile.create_stats()
+        route = endpoint or "unmatched"
+
+        with self.lock:
+            if route in self.stats:
+                self.stats[route].add(profile)
+            else:
+                self.stats[route] = pstats.Stats(profile)
+            stats = self.stats[route]
+
+            route_summary = self.summary.setdefault(route, {"requests": 0, "seconds": 0.0, "database": {}})
+            route_summary["requests"] += 1
+            route_summary["seconds"] = stats.total_tt
+            route_summary["database"] = database_times(stats)
+
+            os.makedirs(self.profile_dir, exist_ok=True)
+            stats.dump_stats(os.path.join(self.profile_dir, route + ".prof"))
+            with open(os.path.join(self.profile_dir, "summary.json"), "w") as summary_file:
+                json.dump(self.summary, summary_file, indent=2, sort_keys=True)
+
+def database_times(stats):
+    """
+    Parameters:
+    stats - Aggregated pstats of a route
+
+    Description:
+    Gets the cumulative seconds spent in each method of the database managers.
+    """
+    times = dict()
+    for (filename, _, name), (_, _, _, cumulative, _) in stats.stats.items():
+        if os.path.dirname(os.path.abspath(filename)) == DATABASE_DIR and not name.startswith("<"):
+            times[name] = times.get(name, 0) + cumulative
+    return times
+
+def _start_profile():
+    profiler = current_app.extensions["profiling"]
+    if profiler.sample_rate <= 0 and PROFILE_HEADER not in request.headers:
+        return
+    if profiler.should_profile(current_app.config.get("ADMIN_TOKEN", None)):
+        g.profile = profiler.start()
+
+def _stop_profile(error):
+    profile = g.pop("profile", None)
+    if profile != None:
+        current_app.extensions["profiling"].stop(profile, request.endpoint)
+
+def init_app(app):
+    """
+    Parameters:
+    app - Flask app
+
+    Description:
+    Profiles PROFILE_SAMPLE_RATE of requests and requests sending the admin token
+    in the X-Profile header, writing the results to PROFILE_DIR.
+    """
+    app.config.setdefault(PROFILE_DIR, os.environ.get(PROFILE_DIR, os.path.join(tempfile.gettempdir(), "profiles")))
+    app.config.setdefault(PROFILE_SAMPLE_RATE, float(os.environ.get(PROFILE_SAMPLE_RATE, "0")))
+    app.extensions["profiling"] = RequestProfiler(app.config[PROFILE_DIR], app.config[PROFILE_SAMPLE_RATE])
+
+    app.before_request(_start_profile)
+    app.teardown_request(_stop_profile)
@@ -0,0 +1,73 @@
+import json
+import os
+import tempfile
+import unittest
+
+from main import app
+from database import db_container
+from admin import ADMIN_TOKEN, ADMIN_TOKEN_HEADER
+from profiling import PROFILE_HEADER, RequestProfiler
+
+class BasicTests(unittest.TestCase):
+
+    ############################
+    #### setup and teardown ####
+    ############################
+
+    # executed prior to each test
+    def setUp(self):
+        self.app = app.test_client()
+        db_container.set_test_mode()
+        db_container.get_database()._reset()
+
+        self.token = app.config[ADMIN_TOKEN]
+        app.config[ADMIN_TOKEN] = "test-token"
+        self.profile_dir = tempfile.TemporaryDirectory()
+        self.profiler = app.extensions["profiling"]
+        app.extensions["profiling"] = RequestProfiler(self.profile_dir.name, 0)
+
+        self.room_id = self.app.post('/rooms/').json
+
+    # executed after each test
+    def tearDown(self):
+        app.config[ADMIN_TOKEN] = self.token
+        app.extensions["profiling"] = self.profiler
+        self.profile_dir.cleanup()
+
+    def read_summary(self):
+        with open(os.path.join(self.profile_dir.name, "summary.json")) as summary_file:
+            return json.load(summary_file)
+
+    def test_disabled(self):
+        self.app.get('/rooms/%s' % self.room_id)
+        self.assertEqual(os.listdir(self.profile_dir.name), [])
+
+    def test_wrong_token(self):
+        self.app.get('/rooms/%s' % self.room_id, headers={PROFILE_HEADER: "wrong"})
+        self.assertEqual(os.listdir(self.profile_dir.name), [])
+
+    def test_profile_header(self):
+        self.app.get('/rooms/%s' % self.room_id, headers={PROFILE_HEADER: "test-token"})
+        self.app.get('/rooms/%s' % self.room_id, headers={PROFILE_HEADER: "test-token"})
+        self.assertIn("rooms_api.handleRoom.prof", os.listdir(self.profile_dir.name))
+
+        summary = self.read_summary()
+        self.assertEqual(summary["rooms_api.handleRoom"]["requests"], 2)
+        self.assertIn("get_room_snapshot", summary["rooms_api.handleRoom"]["database"])
+
+    def test_admin_sample_rate(self):
+        result_post = self.app.post('/admin/profiling', json={"sample_rate": 1},
+            headers={ADMIN_TOKEN_HEADER: "test-token"})
+        self.assertEqual(result_post.status_code, 200)
+        self.assertEqual(result_post.json["sample_rate"], 1)
+
+        self.app.get('/rooms/%s/active' % self.room_id)
+        self.assertIn("get_active_question", self.read_summary()["rooms_api.handleActiveQuestion"]["database"])
+
+        result_post = self.app.post('/admin/profiling', json={"sample_rate": 2},
+            headers={ADMIN_TOKEN_HEADER: "test-token"})
+        self.assertEqual(result_post.status_code, 400)
+
+
+if __name__ == '__main__':
+    unittest.main()
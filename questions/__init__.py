@@ -1,11 +1,44 @@
 from flask import Blueprint, jsonify, request, session
 import urllib.parse
-from database import db_container, ACTIVE_QUESTION_KEY, QUESTION_LIST_KEY
+from database import db_container, sum_tallies, tally_responses, schema_version, question_options, \
+    ACTIVE_QUESTION_KEY, QUESTION_ID_KEY, QUESTION_OPTIONS_KEY, QUESTION_PACK_ENTRY_KEY, QUESTION_RESPONSES_KEY, QUESTION_TALLIES_KEY, \
+    SCHEMA_VERSION_KEY, QUESTION_SCHEMA_VERSION
+from idempotency import idempotent
+from packs import question_packs
 from games import ROOM_ID, USERNAME
+from collections import defaultdict
 import json
 
+QUESTION_PAGE_LIMIT = "limit"
+QUESTION_PAGE_AFTER = "after"
+QUESTION_EXPAND = "expand"
+MAX_QUESTION_PAGE = 100
+
+# Question fields a listing can be expanded with and the document fields each is read from
+EXPAND_FIELDS = {
+    QUESTION_OPTIONS_KEY: [QUESTION_OPTIONS_KEY, QUESTION_PACK_ENTRY_KEY],
+    QUESTION_RESPONSES_KEY: [QUESTION_TALLIES_KEY],
+}
+
 questions_api = Blueprint('questions_api', __name__)
 
+@questions_api.route("/packs", methods=['GET'])
+def getQuestionPacks():
+    response = jsonify(question_packs.list_packs())
+    response.status_code = 200
+    return response
+
+@questions_api.route("/packs/<packId>", methods=['GET'])
+def getQuestionPack(packId):
+    pack = question_packs.get_pack(packId)
+    if pack == None:
+        response = jsonify("Pack Id not found")
+        response.status_code = 404
+        return response
+    response = jsonify(pack)
+    response.status_code = 200
+    return response
+
 @questions_api.route("/<roomId>", methods=['GET', 'POST'])
 def handleQuestion(roomId):
     if request.method == 'GET':
@@ -34,21 +67,105 @@ def getQuestionList(roomId):
         response = jsonify("Room Id not found")
         response.status_code = 404
         return response
-    question_list = jsonify(db_container.get_database().get_question_list(roomId))
+    limit = request.args.get(QUESTION_PAGE_LIMIT, None)
+    after = request.args.get(QUESTION_PAGE_AFTER, None)
+    if limit != None:
+        if not limit.isdigit() or int(limit) <= 0:
+            response = jsonify("Invalid limit")
+            response.status_code = 400
+            return response
+        limit = min(int(limit), MAX_QUESTION_PAGE)
+    expand = request.args.get(QUESTION_EXPAND, None)
+    expand = [] if expand == None else [field for field in expand.split(",") if field != ""]
+    if any(field not in EXPAND_FIELDS for field in expand):
+        response = jsonify("Invalid expand, must be any of %s" % ",".join(EXPAND_FIELDS))
+        response.status_code = 400
+        return response
+
+    # Page through the history, pass the last id of a page as `after` to get the next one
+    questions = db_container.get_database().get_question_list(roomId, limit=limit, after=after)
+    if questions == None:
+        response = jsonify("Question Id not found")
+        response.status_code = 400
+        return response
+    if len(expand) > 0:
+        questions = expand_questions(questions, expand)
+    question_list = jsonify(questions)
     question_list.status_code = 200
     return question_list
 
+def expand_questions(question_ids, expand):
+    """
+    Parameters:
+    question_ids - Ids of the questions in the listing
+    expand - List of the EXPAND_FIELDS to add to each question
+
+    Description:
+    Reads the requested fields of every question in one batched read. Response
+    tallies are summed from the tally shards of the questions, read in a second
+    batched read, and the tallies kept on the question document by earlier
+    versions. Questions not yet migrated to schema version 2 have them counted
+    from their responses instead.
+    Options of questions created from a question pack are resolved from memory,
+    or from their archived options when their pack entry changed since.
+
+    Returns:
+    List of dictionaries of the question id and expanded fields, in listing order
+    """
+    fields = [document_field for field in expand for document_field in EXPAND_FIELDS[field]] + [SCHEMA_VERSION_KEY]
+    documents = db_container.get_database().get_documents('questions', question_ids, fields)
+    if QUESTION_RESPONSES_KEY in expand:
+        shard_tallies = db_container.get_database().get_tallies([question_id for question_id in question_ids
+            if question_id in documents])
+    expanded = []
+    # Questions by the pack entry versions that are no longer loaded
+    unloaded = defaultdict(list)
+    for question_id in question_ids:
+        question_data = documents.get(question_id, {})
+        question = {QUESTION_ID_KEY: question_id}
+        if QUESTION_OPTIONS_KEY in expand:
+            question[QUESTION_OPTIONS_KEY] = question_options(question_data)
+            if question[QUESTION_OPTIONS_KEY] == None and question_data.get(QUESTION_PACK_ENTRY_KEY, None) != None:
+                unloaded[question_data[QUESTION_PACK_ENTRY_KEY]].append(question)
+        if QUESTION_RESPONSES_KEY in expand:
+            tallies = question_data.get(QUESTION_TALLIES_KEY, None)
+            if question_id in documents and (tallies == None or schema_version(question_data) < QUESTION_SCHEMA_VERSION):
+                tallies = tally_responses(db_container.get_database().get_question_responses(question_id) or {})
+            else:
+                tallies = sum_tallies([tallies or {}, shard_tallies.get(question_id, {})])
+            question[QUESTION_RESPONSES_KEY] = {answer: count for answer, count in tallies.items() if count != 0}
+        expanded.append(question)
+    if len(unloaded) > 0:
+        archived = db_container.get_database().get_pack_options(list(unloaded))
+        for pack_entry, questions in unloaded.items():
+            for question in questions:
+                question[QUESTION_OPTIONS_KEY] = archived.get(pack_entry, None)
+    return expanded
+
+@idempotent
 def addNewQuestion(roomId):
     if not db_container.get_database().room_exists(roomId):
         response = jsonify("Room Id not found")
         response.status_code = 404
         return response
     json_obj = json.loads(urllib.parse.unquote_plus(request.data.decode()))
-    options = json_obj["opt"]
-    questionId = db_container.get_database().make_new_question(options)
+    # Questions from a question pack are created from the reference of their entry
+    pack_entry = json_obj.get("pack", None)
+    if pack_entry != None and type(pack_entry) != str:
+        response = jsonify("pack must be the id of a pack entry")
+        response.status_code = 400
+        return response
+    if pack_entry != None:
+        # Questions keep the version of the entry they were created from
+        pack_entry = question_packs.current_reference(pack_entry)
+        if pack_entry == None:
+            response = jsonify("Pack entry not found")
+            response.status_code = 400
+            return response
+    options = json_obj["opt"] if pack_entry == None else None
+    questionId = db_container.get_database().make_new_question(options, roomId, pack_entry)
+    db_container.get_database().add_question_to_room(roomId, questionId)
     db_container.get_database().update_room(roomId, {ACTIVE_QUESTION_KEY: questionId})
-    current_questions = db_container.get_database().get_question_list(roomId)
-    db_container.get_database().update_room(roomId, {QUESTION_LIST_KEY: [questionId] + current_questions})
 
     response = jsonify(questionId)
     response.status_code = 200
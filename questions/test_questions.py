@@ -0,0 +1,109 @@
+import json
+import unittest
+
+from main import app
+from database import db_container
+
+class BasicTests(unittest.TestCase):
+
+    ############################
+    #### setup and teardown ####
+    ############################
+
+    # executed prior to each test
+    def setUp(self):
+        self.app = app.test_client()
+        db_container.set_test_mode()
+        db_container.get_database()._reset()
+
+        self.assertEqual(app.debug, False)
+
+        result_post_first = self.app.post('/rooms/')
+        self.room_id = result_post_first.json
+
+    # executed after each test
+    def tearDown(self):
+        pass
+
+    def add_question(self, options):
+        return self.app.post('/questions/%s' % self.room_id, data=json.dumps({"opt": options}))
+
+    def test_add_question(self):
+        result_post = self.add_question(["a", "b"])
+        self.assertEqual(result_post.status_code, 200)
+        question_id = result_post.json
+
+        result_active = self.app.get('/rooms/%s/active' % self.room_id)
+        self.assertEqual(result_active.json, question_id)
+
+        result_list = self.app.get('/questions/%s' % self.room_id)
+        self.assertEqual(result_list.status_code, 200)
+        self.assertEqual(result_list.json, [question_id])
+
+    def test_question_history_not_in_room(self):
+        self.add_question(["a", "b"])
+        room_get = self.app.get('/rooms/%s' % self.room_id)
+        self.assertNotIn("all_questions", room_get.json)
+
+    def test_question_list_pages(self):
+        question_ids = [self.add_question([str(i)]).json for i in range(5)]
+        question_ids.reverse()
+
+        first_page = self.app.get('/questions/%s?limit=2' % self.room_id)
+        self.assertEqual(first_page.json, question_ids[:2])
+
+        second_page = self.app.get('/questions/%s?limit=2&after=%s' % (self.room_id, first_page.json[-1]))
+        self.assertEqual(second_page.json, question_ids[2:4])
+
+        last_page = self.app.get('/questions/%s?limit=2&after=%s' % (self.room_id, second_page.json[-1]))
+        self.assertEqual(last_page.json, question_ids[4:])
+
+    def test_question_list_invalid_page(self):
+        result_limit = self.app.get('/questions/%s?limit=none' % self.room_id)
+        self.assertEqual(result_limit.status_code, 400)
+
+        result_after = self.app.get('/questions/%s?after=missing' % self.room_id)
+        self.assertEqual(result_after.status_code, 400)
+
+    def test_question_list_expand(self):
+        first_id = self.add_question(["a", "b"]).json
+        second_id = self.add_question(["c", "d"]).json
+        for user, answer in [("user1", "c"), ("user2", "c"), ("user3", "d")]:
+            self.app.post('/responses/%s' % second_id, json=answer, headers={"USERNAME": user})
+        # Changing an answer moves it between tallies
+        self.app.post('/responses/%s' % second_id, json="c", headers={"USERNAME": "user3"})
+
+        result_options = self.app.get('/questions/%s?expand=options' % self.room_id)
+        self.assertEqual(result_options.status_code, 200)
+        self.assertEqual(result_options.json, [
+            {"question_id": second_id, "options": ["c", "d"]},
+            {"question_id": first_id, "options": ["a", "b"]},
+        ])
+
+        result_expanded = self.app.get('/questions/%s?expand=options,responses&limit=1' % self.room_id)
+        self.assertEqual(result_expanded.json, [
+            {"question_id": second_id, "options": ["c", "d"], "responses": {"c": 3}},
+        ])
+
+    def test_question_list_expand_legacy_tallies(self):
+        question_id = self.add_question(["a", "b"]).json
+        self.app.post('/responses/%s' % question_id, json="a", headers={"USERNAME": "user1"})
+        # Questions from before schema version 2 only have tallies of the answers since
+        question_data = db_container.get_database().questions[question_id]
+        del question_data["schema_version"]
+        question_data["tallies"] = {"b": 1}
+
+        result_list = self.app.get('/questions/%s?expand=responses' % self.room_id)
+        self.assertEqual(result_list.json, [{"question_id": question_id, "responses": {"a": 1}}])
+
+    def test_question_list_invalid_expand(self):
+        result_list = self.app.get('/questions/%s?expand=players' % self.room_id)
+        self.assertEqual(result_list.status_code, 400)
+
+    def test_question_list_no_room(self):
+        result_list = self.app.get('/questions/ASDF')
+        self.assertEqual(result_list.status_code, 404)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,326 @@
+from flask import current_app, g, has_request_context, jsonify, request
+from google.api_core.exceptions import Aborted, DeadlineExceeded, RetryError, ServerError, ServiceUnavailable
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+import functools
+import inspect
+import math
+import os
+import threading
+import time
+
+DEADLINE_HEADER = "X-Request-Timeout-Ms"
+
+REQUEST_DEADLINE_MS = "REQUEST_DEADLINE_MS"
+# Shortest deadline a client can ask for
+MIN_REQUEST_DEADLINE_MS = "MIN_REQUEST_DEADLINE_MS"
+
+# Timeout of database calls made outside of a request, such as exports
+DEFAULT_RPC_TIMEOUT = 30.0
+
+class RequestDeadlineExceeded(Exception):
+    pass
+
+class CircuitOpen(Exception):
+    def __init__(self, retry_after):
+        Exception.__init__(self, "Database circuit is open")
+        self.retry_after = retry_after
+
+def is_failure(error):
+    """
+    Parameters:
+    error - Exception raised by a database call
+
+    Description:
+    Checks if an error means the database is unhealthy. Errors that are part of
+    normal operation, such as a missing document or a failed precondition, are
+    not failures.
+    """
+    return isinstance(error, (ServerError, RetryError, TimeoutError)) and not client_timeout(error)
+
+def client_timeout(error):
+    """
+    Parameters:
+    error - Exception raised by a database call
+
+    Description:
+    Checks if an error is a timeout of a request whose client asked for a
+    shorter deadline. Such timeouts are caused by the client, not the database.
+    """
+    return isinstance(error, (DeadlineExceeded, RetryError, TimeoutError)) and has_request_context() \
+        and g.get("db_deadline_shortened", False)
+
+def remaining_time():
+    """
+    Description:
+    Gets the seconds left before the deadline of the current request.
+
+    Returns:
+    Seconds left, negative once the deadline has passed, or None outside a request
+    """
+    if not has_request_context() or "db_deadline" not in g:
+        return None
+    return g.db_deadline - time.monotonic()
+
+def rpc_timeout():
+    """
+    Description:
+    Gets the timeout to give a database call so it finishes before the deadline
+    of the request making it. Raises RequestDeadlineExceeded if the deadline has
+    already passed.
+    """
+    remaining = remaining_time()
+    if remaining == None:
+        return DEFAULT_RPC_TIMEOUT
+    if remaining <= 0:
+        raise RequestDeadlineExceeded()
+    return remaining
+
+class CircuitBreaker:
+    """
+    Description:
+    Fails database calls fast while the database is unhealthy. The circuit opens
+    once at least min_calls calls were made in the last window seconds and
+    error_rate of them failed. Calls are rejected with CircuitOpen for cooldown
+    seconds, after which a single trial call is let through. The circuit closes
+    again if the trial succeeds and stays open for another cooldown if it fails.
+    """
+    def __init__(self, error_rate=0.5, min_calls=20, window=10.0, cooldown=5.0):
+        self.error_rate = error_rate
+        self.min_calls = min_calls
+        self.window = window
+        self.cooldown = cooldown
+        # Counts of calls and failures per second of the window
+        self.buckets = deque()
+        self.opened_at = None
+        self.trial = False
+        self.lock = threading.Lock()
+
+    def before_call(self):
+        """
+        Description:
+        Checks a call can be made, raising CircuitOpen if it can not.
+
+        Returns:
+        True if the call is the trial call of a half open circuit
+        """
+        with self.lock:
+            if self.opened_at == None:
+                return False
+            waited = time.time() - self.opened_at
+            if waited < self.cooldown or self.trial:
+                raise CircuitOpen(max(self.cooldown - waited, 1.0))
+            self.trial = True
+            return True
+
+    def record(self, failed, trial=False):
+        """
+        Parameters:
+        failed - True if the call failed
+        trial - True if the call was the trial call from before_call
+        """
+        now = time.time()
+        with self.lock:
+            if trial:
+                self.trial = False
+                self.opened_at = now if failed else None
+                self.buckets.clear()
+                return
+            second = int(now)
+            if len(self.buckets) > 0 and self.buckets[-1][0] == second:
+                self.buckets[-1][1] += 1
+                self.buckets[-1][2] += 1 if failed else 0
+            else:
+                self.buckets.append([second, 1, 1 if failed else 0])
+            while self.buckets[0][0] <= now - self.window:
+                self.buckets.popleft()
+
+            calls = sum(bucket[1] for bucket in self.buckets)
+            failures = sum(bucket[2] for bucket in self.buckets)
+            if self.opened_at == None and calls >= self.min_calls and failures >= calls * self.error_rate:
+                self.opened_at = now
+
+    def is_open(self):
+        with self.lock:
+            return self.opened_at != None
+
+class HedgedReads:
+    """
+    Description:
+    Sends a second copy of a read when the first has not answered after the
+    given percentile of recent read latencies, and uses whichever answers first.
+    Only reads that are safe to repeat should be hedged. Reads are not hedged
+    until min_samples latencies have been recorded.
+    """
+    def __init__(self, percentile=95, min_samples=50, min_delay=0.005, max_delay=1.0,
+            max_workers=32, samples=1000):
+        self.percentile = percentile
+        self.min_samples = min_samples
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        self.max_workers = max_workers
+        self.latencies = deque(maxlen=samples)
+        self.hedges = 0
+        self.pool = None
+        self.pool_pid = None
+        self.lock = threading.Lock()
+
+    def record(self, seconds):
+        with self.lock:
+            self.latencies.append(seconds)
+
+    def delay(self):
+        """
+        Description:
+        Gets how long to wait before hedging a read.
+
+        Returns:
+        Seconds to wait or None if too few reads were recorded to hedge
+        """
+        with self.lock:
+            if len(self.latencies) < self.min_samples:
+                return None
+            latencies = sorted(self.latencies)
+        index = max(0, math.ceil(len(latencies) * self.percentile / 100.0) - 1)
+        return min(max(latencies[index], self.min_delay), self.max_delay)
+
+    def _executor(self):
+        # Threads do not survive a fork, workers start their own pool
+        with self.lock:
+            if self.pool == None or self.pool_pid != os.getpid():
+                self.pool = ThreadPoolExecutor(self.max_workers, thread_name_prefix="hedged-read")
+                self.pool_pid = os.getpid()
+            return self.pool
+
+    def read(self, fn):
+        """
+        Parameters:
+        fn - Function making the read, called a second time if the read is hedged
+
+        Returns:
+        The result of the first call of fn to succeed
+        """
+        delay = self.delay()
+        start = time.perf_counter()
+        if delay == None:
+            result = fn()
+            self.record(time.perf_counter() - start)
+            return result
+
+        executor = self._executor()
+        pending = {executor.submit(fn)}
+        done, _ = wait(pending, timeout=delay)
+        if len(done) == 0:
+            with self.lock:
+                self.hedges += 1
+            pending.add(executor.submit(fn))
+
+        error = None
+        while len(pending) > 0:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() == None:
+                    self.record(time.perf_counter() - start)
+                    return future.result()
+                error = future.exception()
+        raise error
+
+def _guarded(fn):
+    @functools.wraps(fn)
+    def wrapper(self, *args, **kwargs):
+        breaker = self.breaker
+        faults = self.faults
+        # Calls made by another database call are covered by the outer call
+        if (breaker == None and faults == None) or getattr(_calls, "depth", 0) > 0:
+            return fn(self, *args, **kwargs)
+        rpc_timeout()
+        trial = breaker.before_call() if breaker != None else False
+        failed = False
+        _calls.depth = 1
+        try:
+            if faults != None:
+                faults.inject(fn.__name__)
+            return fn(self, *args, **kwargs)
+        except Exception as error:
+            failed = is_failure(error)
+            raise
+        finally:
+            _calls.depth = 0
+            if breaker != None:
+                breaker.record(failed, trial)
+    return wrapper
+
+_calls = threading.local()
+
+def guard_calls(cls):
+    """
+    Parameters:
+    cls - Database manager class
+
+    Description:
+    Class decorator passing every public method call through the manager's
+    circuit breaker and fault injector, when it has them. Calls are refused once
+    the deadline of the request making them has passed.
+    """
+    for name, member in list(vars(cls).items()):
+        if name.startswith("_") or not inspect.isfunction(member):
+            continue
+        setattr(cls, name, _guarded(member))
+    return cls
+
+def _start_deadline():
+    deadline_ms = current_app.config[REQUEST_DEADLINE_MS]
+    requested = request.headers.get(DEADLINE_HEADER, "")
+    if requested.isdigit():
+        # The floor keeps clients from timing out requests on purpose
+        requested_ms = max(int(requested), current_app.config[MIN_REQUEST_DEADLINE_MS])
+        if requested_ms < deadline_ms:
+            deadline_ms = requested_ms
+            g.db_deadline_shortened = True
+    g.db_deadline = time.monotonic() + deadline_ms / 1000.0
+
+def _circuit_open(error):
+    response = jsonify("Database unavailable, retry later")
+    response.status_code = 503
+    response.headers["Retry-After"] = str(int(math.ceil(error.retry_after)))
+    return response
+
+def _database_unavailable(error):
+    response = jsonify("Database unavailable, retry later")
+    response.status_code = 503
+    return response
+
+def _contention(error):
+    response = jsonify("Too many concurrent updates, retry later")
+    response.status_code = 503
+    response.headers["Retry-After"] = "1"
+    return response
+
+def _deadline_exceeded(error):
+    response = jsonify("Request deadline exceeded")
+    response.status_code = 504
+    return response
+
+def init_app(app):
+    """
+    Parameters:
+    app - Flask app
+
+    Description:
+    Gives every request a deadline of REQUEST_DEADLINE_MS, or less if the client
+    sends a shorter one in the X-Request-Timeout-Ms header, but no less than
+    MIN_REQUEST_DEADLINE_MS. Database calls are given the time left as their
+    timeout, and timeouts of requests with a client deadline do not count toward
+    the circuit breaker. Requests running out of time get a 504
+    and requests refused by an open circuit breaker or an unavailable database,
+    or whose transaction kept losing to concurrent writes, get a 503.
+    """
+    app.config.setdefault(REQUEST_DEADLINE_MS, float(os.environ.get(REQUEST_DEADLINE_MS, "10000")))
+    app.config.setdefault(MIN_REQUEST_DEADLINE_MS, float(os.environ.get(MIN_REQUEST_DEADLINE_MS, "300")))
+
+    app.before_request(_start_deadline)
+    app.register_error_handler(CircuitOpen, _circuit_open)
+    app.register_error_handler(RequestDeadlineExceeded, _deadline_exceeded)
+    app.register_error_handler(DeadlineExceeded, _deadline_exceeded)
+    app.register_error_handler(ServiceUnavailable, _database_unavailable)
+    app.register_error_handler(Aborted, _contention)
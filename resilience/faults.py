@@ -0,0 +1,49 @@
+from google.api_core.exceptions import DeadlineExceeded, ServiceUnavailable
+from resilience import rpc_timeout
+import random
+import threading
+import time
+
+class FaultInjector:
+    """
+    Description:
+    Stand-in for an unhealthy database. Set as the faults of a database manager
+    it slows down and fails calls, so deadlines and the circuit breaker can be
+    exercised locally against the in-memory database.
+    """
+    def __init__(self, error_rate=0.0, latency=0.0, methods=None, seed=None):
+        """
+        Parameters:
+        error_rate - Fraction of calls failing with ServiceUnavailable
+        latency - Seconds every call is delayed by, calls whose timeout is
+            shorter fail with DeadlineExceeded once it runs out
+        methods - Names of the database methods to affect, None for all of them
+        seed - Seed of the random failures
+        """
+        self.error_rate = error_rate
+        self.latency = latency
+        self.methods = methods
+        self.random = random.Random(seed)
+        self.calls = 0
+        self.failures = 0
+        self.lock = threading.Lock()
+
+    def inject(self, method):
+        """
+        Parameters:
+        method - Name of the database method being called
+        """
+        if self.methods != None and method not in self.methods:
+            return
+        if self.latency > 0:
+            timeout = rpc_timeout()
+            time.sleep(min(self.latency, timeout))
+            if self.latency > timeout:
+                raise DeadlineExceeded("Injected latency in %s exceeded the deadline" % method)
+        with self.lock:
+            self.calls += 1
+            failed = self.random.random() < self.error_rate
+            if failed:
+                self.failures += 1
+        if failed:
+            raise ServiceUnavailable("Injected fault in %s" % method)
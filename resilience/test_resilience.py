@@ -0,0 +1,146 @@
+from unittest import mock
+import threading
+import time
+import unittest
+
+from google.api_core.exceptions import Aborted
+from main import app
+from database import db_container
+from resilience import CircuitBreaker, CircuitOpen, HedgedReads, DEADLINE_HEADER, REQUEST_DEADLINE_MS, \
+    MIN_REQUEST_DEADLINE_MS, DEFAULT_RPC_TIMEOUT, rpc_timeout
+from resilience.faults import FaultInjector
+
+class BasicTests(unittest.TestCase):
+
+    ############################
+    #### setup and teardown ####
+    ############################
+
+    # executed prior to each test
+    def setUp(self):
+        self.app = app.test_client()
+        db_container.set_test_mode()
+        db_container.get_database()._reset()
+        self.previous_deadline = app.config[REQUEST_DEADLINE_MS]
+
+        self.room_id = self.app.post('/rooms/').json
+
+    # executed after each test
+    def tearDown(self):
+        app.config[REQUEST_DEADLINE_MS] = self.previous_deadline
+
+    def test_breaker_opens_and_recovers(self):
+        breaker = CircuitBreaker(error_rate=0.5, min_calls=4, window=10, cooldown=0.05)
+        for failed in [False, True, True]:
+            breaker.before_call()
+            breaker.record(failed)
+        self.assertFalse(breaker.is_open())
+        breaker.record(True)
+        self.assertTrue(breaker.is_open())
+        self.assertRaises(CircuitOpen, breaker.before_call)
+
+        # A single trial call is let through after the cooldown
+        time.sleep(0.06)
+        self.assertTrue(breaker.before_call())
+        self.assertRaises(CircuitOpen, breaker.before_call)
+        breaker.record(True, trial=True)
+        self.assertRaises(CircuitOpen, breaker.before_call)
+
+        time.sleep(0.06)
+        self.assertTrue(breaker.before_call())
+        breaker.record(False, trial=True)
+        self.assertFalse(breaker.is_open())
+        self.assertFalse(breaker.before_call())
+
+    def test_unavailable_database_fails_fast(self):
+        database = db_container.get_database()
+        database.breaker = CircuitBreaker(error_rate=0.5, min_calls=5, window=10, cooldown=30)
+        database.faults = FaultInjector(error_rate=1.0, methods=["get_room_snapshot"])
+
+        statuses = [self.app.get('/rooms/%s' % self.room_id).status_code for _ in range(8)]
+        self.assertEqual(statuses, [503] * 8)
+        # Requests after the circuit opened never reached the database
+        self.assertEqual(database.faults.calls, 5)
+
+        result_get = self.app.get('/rooms/%s/active' % self.room_id)
+        self.assertEqual(result_get.status_code, 503)
+        self.assertIn("Retry-After", result_get.headers)
+
+    def test_room_contention(self):
+        database = db_container.get_database()
+        database.breaker = CircuitBreaker(error_rate=0.5, min_calls=2, window=10, cooldown=30)
+        with mock.patch.object(database, "update_room", side_effect=Aborted("Too many concurrent updates")):
+            for _ in range(3):
+                result_join = self.app.post('/games/join', headers={"USERNAME": "user", "ROOM": self.room_id})
+                self.assertEqual(result_join.status_code, 503)
+                self.assertEqual(result_join.headers["Retry-After"], "1")
+        # Losing to concurrent writes does not mean the database is unhealthy
+        self.assertFalse(database.breaker.is_open())
+
+    def test_expected_errors_do_not_open_circuit(self):
+        database = db_container.get_database()
+        database.breaker = CircuitBreaker(error_rate=0.5, min_calls=2, window=10, cooldown=30)
+        for _ in range(5):
+            self.assertEqual(self.app.get('/rooms/ZZZZ').status_code, 404)
+        self.assertFalse(database.breaker.is_open())
+
+    def test_request_deadline(self):
+        app.config[REQUEST_DEADLINE_MS] = 50
+        db_container.get_database().faults = FaultInjector(latency=0.1, methods=["get_room_snapshot"])
+        result_patch = self.app.patch('/rooms/%s' % self.room_id, json={"players": ["user-1"]},
+            headers={'Content-Type': 'application/json'})
+        self.assertEqual(result_patch.status_code, 504)
+        self.assertEqual(db_container.get_database().rooms[self.room_id]["players"], [])
+
+    def test_client_deadline(self):
+        db_container.get_database().faults = FaultInjector(latency=0.5, methods=["get_room_snapshot"])
+        start = time.time()
+        result_patch = self.app.patch('/rooms/%s' % self.room_id, json={"players": ["user-1"]},
+            headers={'Content-Type': 'application/json', DEADLINE_HEADER: "1"})
+        self.assertEqual(result_patch.status_code, 504)
+        # Client deadlines are raised to the minimum
+        self.assertGreaterEqual(time.time() - start, app.config[MIN_REQUEST_DEADLINE_MS] / 1000.0)
+
+        with app.test_request_context('/'):
+            self.assertEqual(rpc_timeout(), DEFAULT_RPC_TIMEOUT)
+
+    def test_client_deadlines_do_not_open_circuit(self):
+        database = db_container.get_database()
+        database.breaker = CircuitBreaker(error_rate=0.5, min_calls=2, window=10, cooldown=30)
+        database.faults = FaultInjector(latency=0.35, methods=["get_room_snapshot"])
+        for _ in range(3):
+            result_get = self.app.get('/rooms/%s' % self.room_id, headers={DEADLINE_HEADER: "1"})
+            self.assertEqual(result_get.status_code, 504)
+        self.assertFalse(database.breaker.is_open())
+
+        # Timeouts under the server's own deadline still count
+        app.config[REQUEST_DEADLINE_MS] = 50
+        for _ in range(4):
+            self.app.get('/rooms/%s' % self.room_id)
+        self.assertTrue(database.breaker.is_open())
+
+    def test_hedged_read(self):
+        hedger = HedgedReads(percentile=95, min_samples=10, min_delay=0.01)
+        self.assertEqual(hedger.read(lambda: "first"), "first")
+        self.assertEqual(hedger.hedges, 0)
+        for _ in range(20):
+            hedger.record(0.01)
+
+        calls = []
+        release = threading.Event()
+        def read():
+            calls.append(1)
+            # The first copy of the read stalls
+            if len(calls) == 1:
+                release.wait(5)
+                return "stalled"
+            return "hedge"
+
+        start = time.time()
+        self.assertEqual(hedger.read(read), "hedge")
+        self.assertLess(time.time() - start, 1)
+        self.assertEqual(hedger.hedges, 1)
+        release.set()
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,8 +1,18 @@
 from flask import Blueprint, jsonify, request
-from database import db_container, ACTIVE_QUESTION_KEY
+from database import db_container, ACTIVE_QUESTION_KEY, MAX_PLAYERS_KEY, ROOM_TYPE_KEY, ROOM_VERSION_KEY, \
+    DEFAULT_MAX_PLAYERS, DEFAULT_ROOM_TYPE, MAX_ROOM_PLAYERS, VersionConflict
+from admin import admin_required
+from idempotency import idempotent
+import presence
+
+MAX_BULK_ROOMS = 5000
 
 rooms_api = Blueprint('rooms_api', __name__)
 
+def valid_max_players(max_players):
+    # The scoreboard keeps a count per pair of players, so rooms are capped
+    return type(max_players) == int and 0 < max_players <= MAX_ROOM_PLAYERS
+
 @rooms_api.route("/", methods=['GET', 'POST'])
 def handleGetCreate():
     if request.method == 'GET':
@@ -16,6 +26,7 @@ def listRooms():
     resp.status_code = 200
     return resp
 
+@idempotent
 def createRoom():
     room_id = db_container.get_database().create_room()
     if room_id == None:
@@ -26,6 +37,33 @@ def createRoom():
     resp.status_code = 201
     return resp
 
+@rooms_api.route("/bulk", methods=['POST'])
+@idempotent
+def createRooms():
+    count = request.args.get("count", "")
+    if not count.isdigit() or int(count) <= 0 or int(count) > MAX_BULK_ROOMS:
+        response = jsonify("count must be between 1 and %d" % MAX_BULK_ROOMS)
+        response.status_code = 400
+        return response
+
+    # Optional template for every room
+    template = request.get_json(silent=True) or {}
+    max_players = template.get(MAX_PLAYERS_KEY, DEFAULT_MAX_PLAYERS)
+    room_type = template.get(ROOM_TYPE_KEY, DEFAULT_ROOM_TYPE)
+    if not valid_max_players(max_players) or type(room_type) != str:
+        response = jsonify("Invalid room template")
+        response.status_code = 400
+        return response
+
+    room_ids = db_container.get_database().create_rooms(int(count), max_players, room_type)
+    if len(room_ids) < int(count):
+        response = jsonify({"error": "Not enough room ids available", "rooms": room_ids})
+        response.status_code = 500
+        return response
+    resp = jsonify(room_ids)
+    resp.status_code = 201
+    return resp
+
 @rooms_api.route("/<roomId>/active", methods=['GET', 'DELETE'])
 def handleActiveQuestion(roomId):
     if request.method == 'DELETE':
@@ -45,18 +83,88 @@ def clearActiveQuestion(roomId):
     return response
 
 def getActiveQuestion(roomId):
-    roomData = db_container.get_database().get_room(roomId)
+    activeQuestion = db_container.get_database().get_active_question(roomId)
     # Check to ensure room exists
-    if roomData == None:
+    if activeQuestion == None:
         response =  jsonify("Room not found")
         response.status_code = 404
         return response
     
-    response = jsonify(roomData[ACTIVE_QUESTION_KEY])
+    response = jsonify(activeQuestion)
     response.status_code = 200
     return response
     
 
+@rooms_api.route("/<roomId>/scores", methods=['GET'])
+def getScores(roomId):
+    scores = db_container.get_database().get_scores(roomId)
+    if scores == None:
+        response = jsonify("Room Id not found")
+        response.status_code = 404
+        return response
+
+    response = jsonify(scores)
+    response.status_code = 200
+    return response
+
+@rooms_api.route("/<roomId>/scores/rebuild", methods=['POST'])
+@admin_required
+def rebuildScores(roomId):
+    # Recompute the scoreboard from the raw responses and report whether the
+    # incrementally maintained scoreboard matched it
+    previous_scores = db_container.get_database().get_scores(roomId)
+    if previous_scores == None:
+        response = jsonify("Room Id not found")
+        response.status_code = 404
+        return response
+
+    scores = db_container.get_database().rebuild_scores(roomId)
+    response = jsonify({"scores": scores, "consistent": scores == previous_scores})
+    response.status_code = 200
+    return response
+
+@rooms_api.route("/<roomId>/presence", methods=['GET'])
+def getPresence(roomId):
+    room_presence = presence.room_presence(roomId)
+    if room_presence == None:
+        response =  jsonify("Room not found")
+        response.status_code = 404
+        return response
+
+    resp = jsonify(room_presence)
+    resp.status_code = 200
+    return resp
+
+@rooms_api.route("/<roomId>/changes", methods=['GET'])
+def getRoomChanges(roomId):
+    since = request.args.get("since", "")
+    if not since.isdigit():
+        response = jsonify("since must be a room version")
+        response.status_code = 400
+        return response
+
+    room_changes = db_container.get_database().get_room_changes(roomId, int(since))
+    if room_changes == None:
+        response =  jsonify("Room not found")
+        response.status_code = 404
+        return response
+
+    version, changes = room_changes
+    if changes != None:
+        resp = jsonify({"version": version, "changes": changes})
+        resp.status_code = 200
+        return resp
+
+    # Clients too far behind the change log get the whole room instead
+    snapshot = db_container.get_database().get_room_snapshot(roomId, fresh=True)
+    if snapshot == None:
+        response =  jsonify("Room not found")
+        response.status_code = 404
+        return response
+    resp = jsonify({"version": snapshot[0].get(ROOM_VERSION_KEY, 0), "snapshot": snapshot[0]})
+    resp.status_code = 200
+    return resp
+
 @rooms_api.route("/<roomId>", methods=['GET', 'PATCH', 'DELETE'])
 def handleRoom(roomId=None):
     if request.method == 'GET':
@@ -67,9 +175,10 @@ def handleRoom(roomId=None):
         return deleteRoom(roomId)
 
 def updateRoom(roomId):
-    roomData = db_container.get_database().get_room(roomId)
+    # The snapshot read is the only read, the write is made against its version
+    snapshot = db_container.get_database().get_room_snapshot(roomId, fresh=True)
     # Check to ensure room exists
-    if roomData == None:
+    if snapshot == None:
         response =  jsonify("Room not found")
         response.status_code = 404
         return response
@@ -79,15 +188,35 @@ def updateRoom(roomId):
         response.status_code = 415
         return response
 
+    if MAX_PLAYERS_KEY in request.json and not valid_max_players(request.json[MAX_PLAYERS_KEY]):
+        response =  jsonify("max_players must be between 1 and %d" % MAX_ROOM_PLAYERS)
+        response.status_code = 400
+        return response
+
+    # With If-Match the update only applies to the version the client last saw
+    expected_version = None
+    if request.if_match:
+        expected_version = snapshot[1]
+        if not request.if_match.contains(expected_version):
+            response =  jsonify("Room was modified, reload it and retry")
+            response.status_code = 412
+            return response
+
     # Update room
-    updated_room = db_container.get_database().update_room(roomId, request.json)
+    try:
+        updated = db_container.get_database().patch_room(roomId, request.json, snapshot, expected_version)
+    except VersionConflict:
+        response =  jsonify("Room was modified, reload it and retry")
+        response.status_code = 412
+        return response
 
-    if updated_room == None:
-        response =  jsonify("Server error updating room")
-        response.status_code = 500
+    if updated == None:
+        response =  jsonify("Room not found")
+        response.status_code = 404
         return response
 
-    resp = jsonify(updated_room)
+    resp = jsonify(updated[0])
+    resp.set_etag(updated[1])
     resp.status_code = 200
     return resp
 
@@ -110,13 +239,14 @@ def deleteRoom(roomId):
     return response
 
 def getRoomData(roomId):
-    roomData = db_container.get_database().get_room(roomId)
+    snapshot = db_container.get_database().get_room_snapshot(roomId)
     # Check to ensure room exists
-    if roomData == None:
+    if snapshot == None:
         response =  jsonify("Room not found")
         response.status_code = 404
         return response
     
-    resp = jsonify(roomData)
+    resp = jsonify(snapshot[0])
+    resp.set_etag(snapshot[1])
     resp.status_code = 200
     return resp
@@ -1,8 +1,11 @@
+import json
 import os
 import unittest
 
 from main import app
-from database import db_container, valid_room_id
+from database import db_container, valid_room_id, MAX_ROOM_CHANGES, MAX_ROOM_PLAYERS
+from admin import ADMIN_TOKEN, ADMIN_TOKEN_HEADER
+from games import USERNAME, ROOM_ID
 
 class BasicTests(unittest.TestCase):
  
@@ -99,6 +102,149 @@ class BasicTests(unittest.TestCase):
             json={"players": ["user-1"]},
             headers={'Content-Type': 'application/json'})
         self.assertEqual(add_players_test.status_code, 200)
+        self.assertEqual(add_players_test.json["players"], ["user-1"])
+
+        max_players_test = self.app.patch('/rooms/%s' % room_id, json={"max_players": MAX_ROOM_PLAYERS + 1})
+        self.assertEqual(max_players_test.status_code, 400)
+
+    def test_update_room_if_match(self):
+        room_id = self.app.post('/rooms/').json
+        room_get = self.app.get('/rooms/%s' % room_id)
+        self.assertEqual(room_get.status_code, 200)
+        etag = room_get.headers['ETag']
+
+        room_patch = self.app.patch(
+            '/rooms/%s' % room_id,
+            json={"players": ["user-1"]},
+            headers={'Content-Type': 'application/json', 'If-Match': etag})
+        self.assertEqual(room_patch.status_code, 200)
+        self.assertEqual(room_patch.json["players"], ["user-1"])
+        self.assertNotEqual(room_patch.headers['ETag'], etag)
+        self.assertEqual(self.app.get('/rooms/%s' % room_id).headers['ETag'], room_patch.headers['ETag'])
+
+        # The room changed since the first read
+        stale_patch = self.app.patch(
+            '/rooms/%s' % room_id,
+            json={"players": ["user-2"]},
+            headers={'Content-Type': 'application/json', 'If-Match': etag})
+        self.assertEqual(stale_patch.status_code, 412)
+        self.assertEqual(self.app.get('/rooms/%s' % room_id).json["players"], ["user-1"])
+
+        missing_patch = self.app.patch(
+            '/rooms/missing',
+            json={"players": ["user-2"]},
+            headers={'Content-Type': 'application/json', 'If-Match': etag})
+        self.assertEqual(missing_patch.status_code, 404)
+
+    def test_room_changes(self):
+        room_id = self.app.post('/rooms/').json
+        result_changes = self.app.get('/rooms/%s/changes?since=0' % room_id)
+        self.assertEqual(result_changes.status_code, 200)
+        self.assertEqual(result_changes.json, {"version": 0, "changes": []})
+
+        result_join = self.app.post('/games/join', headers={USERNAME: "user", ROOM_ID: room_id})
+        self.assertEqual(result_join.status_code, 200)
+        self.app.patch('/rooms/%s' % room_id, json={"room_status": "playing"})
+        question_id = self.app.post('/questions/%s' % room_id, data=json.dumps({"opt": ["a", "b"]})).json
+
+        result_changes = self.app.get('/rooms/%s/changes?since=1' % room_id)
+        self.assertEqual(result_changes.json["version"], 3)
+        self.assertEqual([(change["version"], change["set"]) for change in result_changes.json["changes"]],
+            [(2, {"room_status": "playing"}), (3, {"active_question": question_id})])
+
+        room_get = self.app.get('/rooms/%s' % room_id)
+        self.assertEqual(room_get.json["version"], 3)
+        self.assertEqual(self.app.get('/rooms/%s/changes?since=3' % room_id).json["changes"], [])
+
+    def test_room_changes_snapshot(self):
+        room_id = self.app.post('/rooms/').json
+        for i in range(MAX_ROOM_CHANGES + 1):
+            db_container.get_database().update_room(room_id, {"room_status": str(i)})
+
+        # The change log no longer reaches back to the first version
+        result_changes = self.app.get('/rooms/%s/changes?since=0' % room_id)
+        self.assertEqual(result_changes.json["version"], MAX_ROOM_CHANGES + 1)
+        self.assertNotIn("changes", result_changes.json)
+        self.assertEqual(result_changes.json["snapshot"]["room_status"], str(MAX_ROOM_CHANGES))
+
+        result_changes = self.app.get('/rooms/%s/changes?since=1' % room_id)
+        self.assertEqual(len(result_changes.json["changes"]), MAX_ROOM_CHANGES)
+
+        self.assertEqual(self.app.get('/rooms/%s/changes' % room_id).status_code, 400)
+        self.assertEqual(self.app.get('/rooms/ZZZZ/changes?since=0').status_code, 404)
+
+    def test_scores(self):
+        room_id = self.app.post('/rooms/').json
+        rooms_scores = self.app.get('/rooms/%s/scores' % room_id)
+        self.assertEqual(rooms_scores.status_code, 200)
+        self.assertEqual(rooms_scores.json, {"players": {}, "pairs": {}, "answered": {}})
+
+        question_id = self.app.post('/questions/%s' % room_id, data=json.dumps({"opt": ["a", "b"]})).json
+        for player, answer in [("A", "a"), ("B", "a"), ("C", "b"), ("C", "a")]:
+            self.app.post('/responses/%s' % question_id, json=answer, headers={USERNAME: player})
+
+        rooms_scores = self.app.get('/rooms/%s/scores' % room_id)
+        self.assertEqual(rooms_scores.json["players"], {"A": 2, "B": 2, "C": 2})
+        self.assertEqual(rooms_scores.json["pairs"], {"A|B": 1, "A|C": 1, "B|C": 1})
+        self.assertEqual(rooms_scores.json["answered"], {"A": 1, "B": 1, "C": 1})
+
+        # Each player's score document only holds the matches of their own answers
+        player_scores = db_container.get_database().stream_documents('scores/%s/players' % room_id)
+        self.assertEqual(dict(player_scores), {
+            "A": {"pairs": {}, "answered": 1},
+            "B": {"pairs": {"A": 1}, "answered": 1},
+            "C": {"pairs": {"A": 1, "B": 1}, "answered": 1},
+        })
+
+        token = app.config[ADMIN_TOKEN]
+        app.config[ADMIN_TOKEN] = "test-token"
+        self.addCleanup(app.config.__setitem__, ADMIN_TOKEN, token)
+        self.assertEqual(self.app.post('/rooms/%s/scores/rebuild' % room_id).status_code, 403)
+        rooms_rebuild = self.app.post('/rooms/%s/scores/rebuild' % room_id, headers={ADMIN_TOKEN_HEADER: "test-token"})
+        self.assertEqual(rooms_rebuild.status_code, 200)
+        self.assertEqual(rooms_rebuild.json["scores"], rooms_scores.json)
+        self.assertTrue(rooms_rebuild.json["consistent"])
+
+    def test_legacy_scores(self):
+        room_id = self.app.post('/rooms/').json
+        question_id = self.app.post('/questions/%s' % room_id, data=json.dumps({"opt": ["a", "b"]})).json
+        for player in ["A", "B"]:
+            self.app.post('/responses/%s' % question_id, json="a", headers={USERNAME: player})
+
+        # Scoreboards stored for the whole room are added in until the scores are rebuilt
+        legacy = {"players": {"A": 1, "C": 1}, "pairs": {"A|C": 1}, "answered": {"C": 1}}
+        db_container.get_database().write_documents([("scores", room_id, legacy)])
+        rooms_scores = self.app.get('/rooms/%s/scores' % room_id)
+        self.assertEqual(rooms_scores.json["players"], {"A": 2, "B": 1, "C": 1})
+        self.assertEqual(rooms_scores.json["answered"], {"A": 1, "B": 1, "C": 1})
+
+        scores = db_container.get_database().rebuild_scores(room_id)
+        self.assertEqual(scores["players"], {"A": 1, "B": 1})
+        self.assertEqual(self.app.get('/rooms/%s/scores' % room_id).json, scores)
+
+    def test_scores_no_room(self):
+        rooms_scores = self.app.get('/rooms/ASDF/scores')
+        self.assertEqual(rooms_scores.status_code, 404)
+
+    def test_bulk_create(self):
+        rooms_post = self.app.post('/rooms/bulk?count=50', json={"max_players": 8, "room_type": "classroom"})
+        self.assertEqual(rooms_post.status_code, 201)
+        self.assertEqual(len(set(rooms_post.json)), 50)
+        self.assertTrue(all([valid_room_id(room_id) for room_id in rooms_post.json]))
+        self.assertEqual(sorted(self.app.get('/rooms/').json), sorted(rooms_post.json))
+
+        room_get = self.app.get('/rooms/%s' % rooms_post.json[0])
+        self.assertEqual(room_get.json["max_players"], 8)
+        self.assertEqual(room_get.json["room_type"], "classroom")
+
+    def test_bulk_create_invalid(self):
+        self.assertEqual(self.app.post('/rooms/bulk').status_code, 400)
+        self.assertEqual(self.app.post('/rooms/bulk?count=0').status_code, 400)
+        self.assertEqual(self.app.post('/rooms/bulk?count=100000').status_code, 400)
+        self.assertEqual(self.app.post('/rooms/bulk?count=2', json={"max_players": "8"}).status_code, 400)
+        max_players = {"max_players": MAX_ROOM_PLAYERS + 1}
+        self.assertEqual(self.app.post('/rooms/bulk?count=2', json=max_players).status_code, 400)
+        self.assertEqual(self.app.get('/rooms/').json, [])
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,149 @@
+from flask import g, has_request_context, request
+import functools
+import inspect
+import json
+import os
+import tempfile
+import threading
+import time
+
+TRACE_REQUEST_HEADER = "X-Debug-Trace"
+TRACE_RESPONSE_HEADER = "X-Database-Trace"
+
+SLOW_REQUEST_THRESHOLD_MS = "SLOW_REQUEST_THRESHOLD_MS"
+SLOW_REQUEST_LOG = "SLOW_REQUEST_LOG"
+TRACE_DEBUG = "TRACE_DEBUG"
+
+# Document path of a database call taken from the name of its first argument
+DOCUMENT_PATHS = {
+    "room_id": "rooms/%s",
+    "question_id": "questions/%s",
+}
+
+log_lock = threading.Lock()
+
+def result_size(result):
+    """
+    Parameters:
+    result - Value returned by a database call
+
+    Description:
+    Estimates the size of a database result as the length of its JSON encoding.
+    """
+    if result == None:
+        return 0
+    return len(json.dumps(result, default=str))
+
+def _traced(fn, path_arg):
+    path_format = DOCUMENT_PATHS.get(path_arg, None)
+
+    @functools.wraps(fn)
+    def wrapper(self, *args, **kwargs):
+        if not has_request_context() or "db_trace" not in g:
+            return fn(self, *args, **kwargs)
+        path = None
+        if path_format != None:
+            path = path_format % (args[0] if len(args) > 0 else kwargs.get(path_arg, None))
+        span = {
+            "method": fn.__name__,
+            "path": path,
+            "depth": g.db_trace_depth,
+            "start_ms": round((time.perf_counter() - g.db_trace_start) * 1000, 3),
+        }
+        g.db_trace.append(span)
+        g.db_trace_depth += 1
+        start = time.perf_counter()
+        try:
+            result = fn(self, *args, **kwargs)
+        finally:
+            g.db_trace_depth -= 1
+            span["ms"] = round((time.perf_counter() - start) * 1000, 3)
+        # Sizes are only computed if the trace is reported
+        span["result"] = result
+        return result
+    return wrapper
+
+def trace_calls(cls):
+    """
+    Parameters:
+    cls - Database manager class
+
+    Description:
+    Class decorator recording every public method call made during a request
+    with its document path, duration and result size.
+    """
+    for name, member in list(vars(cls).items()):
+        if name.startswith("_") or not inspect.isfunction(member):
+            continue
+        arg_names = list(inspect.signature(member).parameters)[1:]
+        setattr(cls, name, _traced(member, arg_names[0] if len(arg_names) > 0 else None))
+    return cls
+
+def get_trace():
+    """
+    Description:
+    Gets the database calls made so far during the current request.
+
+    Returns:
+    List of calls with their method, document path, nesting depth, start offset,
+    duration and result size in bytes.
+    """
+    trace = []
+    for span in g.db_trace:
+        entry = {key: span[key] for key in span if key != "result"}
+        entry["bytes"] = result_size(span.get("result", None))
+        trace.append(entry)
+    return trace
+
+def _start_trace():
+    g.db_trace = []
+    g.db_trace_depth = 0
+    g.db_trace_start = time.perf_counter()
+
+def _finish_trace(app, response):
+    if "db_trace" not in g:
+        return response
+    duration_ms = (time.perf_counter() - g.db_trace_start) * 1000
+    wants_header = app.config[TRACE_DEBUG] and TRACE_REQUEST_HEADER in request.headers
+    is_slow = duration_ms >= app.config[SLOW_REQUEST_THRESHOLD_MS]
+    if not wants_header and not is_slow:
+        return response
+
+    trace = get_trace()
+    if wants_header:
+        response.headers[TRACE_RESPONSE_HEADER] = json.dumps(trace, separators=(",", ":"))
+    if is_slow:
+        line = json.dumps({
+            "time": time.time(),
+            "method": request.method,
+            "path": request.path,
+            "endpoint": request.endpoint,
+            "status": response.status_code,
+            "ms": round(duration_ms, 3),
+            "db_calls": len([span for span in trace if span["depth"] == 0]),
+            "db_ms": round(sum([span["ms"] for span in trace if span["depth"] == 0]), 3),
+            "trace": trace,
+        })
+        with log_lock:
+            with open(app.config[SLOW_REQUEST_LOG], "a") as log_file:
+                log_file.write(line + "\n")
+    return response
+
+def init_app(app):
+    """
+    Parameters:
+    app - Flask app
+
+    Description:
+    Traces the database calls of every request. Requests slower than
+    SLOW_REQUEST_THRESHOLD_MS are written as a JSON line to SLOW_REQUEST_LOG and
+    when TRACE_DEBUG is on, requests sending the X-Debug-Trace header get the
+    trace back in the X-Database-Trace response header.
+    """
+    app.config.setdefault(SLOW_REQUEST_THRESHOLD_MS, float(os.environ.get(SLOW_REQUEST_THRESHOLD_MS, "1000")))
+    app.config.setdefault(SLOW_REQUEST_LOG, os.environ.get(SLOW_REQUEST_LOG,
+        os.path.join(tempfile.gettempdir(), "slow_requests.log")))
+    app.config.setdefault(TRACE_DEBUG, os.environ.get(TRACE_DEBUG, "0") == "1")
+
+    app.before_request(_start_trace)
+    app.after_request(lambda response: _finish_trace(app, response))
@@ -0,0 +1,81 @@
+import json
+import os
+import tempfile
+import unittest
+
+from main import app
+from database import db_container
+from tracing import SLOW_REQUEST_LOG, SLOW_REQUEST_THRESHOLD_MS, TRACE_DEBUG, \
+    TRACE_REQUEST_HEADER, TRACE_RESPONSE_HEADER
+
+class BasicTests(unittest.TestCase):
+
+    ############################
+    #### setup and teardown ####
+    ############################
+
+    # executed prior to each test
+    def setUp(self):
+        self.app = app.test_client()
+        db_container.set_test_mode()
+        db_container.get_database()._reset()
+
+        self.config = {key: app.config[key] for key in [SLOW_REQUEST_LOG, SLOW_REQUEST_THRESHOLD_MS, TRACE_DEBUG]}
+        self.log_dir = tempfile.TemporaryDirectory()
+        app.config[SLOW_REQUEST_LOG] = os.path.join(self.log_dir.name, "slow.log")
+
+        self.room_id = self.app.post('/rooms/').json
+
+    # executed after each test
+    def tearDown(self):
+        app.config.update(self.config)
+        self.log_dir.cleanup()
+
+    def read_log(self):
+        if not os.path.exists(app.config[SLOW_REQUEST_LOG]):
+            return []
+        with open(app.config[SLOW_REQUEST_LOG]) as log_file:
+            return [json.loads(line) for line in log_file]
+
+    def test_slow_request_logged(self):
+        app.config[SLOW_REQUEST_THRESHOLD_MS] = 0
+        self.app.get('/rooms/%s/active' % self.room_id)
+
+        lines = self.read_log()
+        self.assertEqual(len(lines), 1)
+        self.assertEqual(lines[0]["path"], '/rooms/%s/active' % self.room_id)
+        self.assertEqual(lines[0]["status"], 200)
+        self.assertEqual(lines[0]["db_calls"], 1)
+        self.assertEqual(lines[0]["trace"][0]["method"], "get_active_question")
+        self.assertEqual(lines[0]["trace"][0]["path"], "rooms/%s" % self.room_id)
+        self.assertEqual(lines[0]["trace"][0]["bytes"], 2)
+
+    def test_fast_request_not_logged(self):
+        app.config[SLOW_REQUEST_THRESHOLD_MS] = 60000
+        self.app.get('/rooms/%s' % self.room_id)
+        self.assertEqual(self.read_log(), [])
+
+    def test_debug_header(self):
+        app.config[TRACE_DEBUG] = True
+        result_get = self.app.get('/rooms/%s' % self.room_id, headers={TRACE_REQUEST_HEADER: "1"})
+        trace = json.loads(result_get.headers[TRACE_RESPONSE_HEADER])
+        self.assertEqual([span["method"] for span in trace], ["get_room_snapshot"])
+
+        result_get = self.app.get('/rooms/%s' % self.room_id)
+        self.assertNotIn(TRACE_RESPONSE_HEADER, result_get.headers)
+
+    def test_debug_header_disabled(self):
+        app.config[TRACE_DEBUG] = False
+        result_get = self.app.get('/rooms/%s' % self.room_id, headers={TRACE_REQUEST_HEADER: "1"})
+        self.assertNotIn(TRACE_RESPONSE_HEADER, result_get.headers)
+
+    def test_nested_calls(self):
+        app.config[TRACE_DEBUG] = True
+        result_join = self.app.post('/games/join', headers={"ROOM": self.room_id, "USERNAME": "user", TRACE_REQUEST_HEADER: "1"})
+        trace = json.loads(result_join.headers[TRACE_RESPONSE_HEADER])
+        update = [span for span in trace if span["method"] == "update_room"][0]
+        self.assertEqual(update["depth"], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,119 @@
+from database import ROOM_QUESTIONS_KEY, QUESTION_RESPONSES_KEY, SCORES_PLAYERS_KEY, TALLY_SHARDS_KEY, MAX_BATCH_WRITES
+import json
+
+RECORD_TYPE = "type"
+RECORD_ID = "id"
+RECORD_PARENT = "parent"
+RECORD_DATA = "data"
+
+ROOM_RECORD = "room"
+ROOM_QUESTION_RECORD = "room_question"
+QUESTION_RECORD = "question"
+RESPONSE_RECORD = "response"
+TALLY_SHARD_RECORD = "tally_shard"
+SCORES_RECORD = "scores"
+PLAYER_SCORES_RECORD = "player_scores"
+
+# Collection path of each record type, formatted with the record's parent id
+RECORD_COLLECTIONS = {
+    ROOM_RECORD: "rooms",
+    ROOM_QUESTION_RECORD: "rooms/%s/" + ROOM_QUESTIONS_KEY,
+    QUESTION_RECORD: "questions",
+    RESPONSE_RECORD: "questions/%s/" + QUESTION_RESPONSES_KEY,
+    TALLY_SHARD_RECORD: "questions/%s/" + TALLY_SHARDS_KEY,
+    SCORES_RECORD: "scores",
+    PLAYER_SCORES_RECORD: "scores/%s/" + SCORES_PLAYERS_KEY,
+}
+
+def make_record(record_type, document_id, data, parent=None):
+    record = {RECORD_TYPE: record_type, RECORD_ID: document_id, RECORD_DATA: data}
+    if parent != None:
+        record[RECORD_PARENT] = parent
+    return record
+
+def export_records(database, after=None, page_size=100):
+    """
+    Parameters:
+    database - Database manager to export from
+    after - Room id to start after, None to export every room
+    page_size - Number of documents read at a time
+
+    Description:
+    Iterates through every room in room id order with its question history,
+    questions, responses, tally shards and player scores. Documents are read a
+    page at a time so memory use stays bounded however many rooms there are.
+    Every record of a room comes after its room record and before the next room
+    record, so the id of the previous room record is a safe point to resume from.
+
+    Returns:
+    Generator of records, dictionaries with the type, id, optional parent id and
+    data of a document
+    """
+    for room_id, room_data in database.stream_documents("rooms", page_size, after):
+        yield make_record(ROOM_RECORD, room_id, room_data)
+
+        history_path = RECORD_COLLECTIONS[ROOM_QUESTION_RECORD] % room_id
+        history = database.stream_documents(history_path, page_size)
+        while True:
+            page = [entry for _, entry in zip(range(page_size), history)]
+            if len(page) == 0:
+                break
+            questions = database.get_documents("questions", [question_id for question_id, _ in page])
+            for question_id, entry in page:
+                if question_id in questions:
+                    yield make_record(QUESTION_RECORD, question_id, questions[question_id])
+                yield make_record(ROOM_QUESTION_RECORD, question_id, entry, room_id)
+                responses_path = RECORD_COLLECTIONS[RESPONSE_RECORD] % question_id
+                for user_id, response in database.stream_documents(responses_path, page_size):
+                    yield make_record(RESPONSE_RECORD, user_id, response, question_id)
+                shards_path = RECORD_COLLECTIONS[TALLY_SHARD_RECORD] % question_id
+                for shard_id, shard in database.stream_documents(shards_path, page_size):
+                    yield make_record(TALLY_SHARD_RECORD, shard_id, shard, question_id)
+
+        scores = database.get_documents("scores", [room_id])
+        if room_id in scores:
+            yield make_record(SCORES_RECORD, room_id, scores[room_id])
+        player_scores_path = RECORD_COLLECTIONS[PLAYER_SCORES_RECORD] % room_id
+        for player, player_scores in database.stream_documents(player_scores_path, page_size):
+            yield make_record(PLAYER_SCORES_RECORD, player, player_scores, room_id)
+
+def import_records(database, records, batch_size=MAX_BATCH_WRITES):
+    """
+    Parameters:
+    database - Database manager to import into
+    records - Iterable of records as produced by export_records
+    batch_size - Number of documents written per batched commit
+
+    Description:
+    Writes records to the database in batched commits, holding at most one
+    batch in memory.
+
+    Returns:
+    Generator of the number of records written so far, yielded after each commit
+    """
+    writes = []
+    written = 0
+    for record in records:
+        path = RECORD_COLLECTIONS[record[RECORD_TYPE]]
+        if RECORD_PARENT in record:
+            path = path % record[RECORD_PARENT]
+        writes.append((path, record[RECORD_ID], record[RECORD_DATA]))
+        if len(writes) >= batch_size:
+            database.write_documents(writes)
+            written += len(writes)
+            writes = []
+            yield written
+    if len(writes) > 0:
+        database.write_documents(writes)
+        written += len(writes)
+        yield written
+
+def to_ndjson(record):
+    return json.dumps(record, separators=(",", ":"), default=str) + "\n"
+
+def from_ndjson(lines):
+    for line in lines:
+        if isinstance(line, bytes):
+            line = line.decode()
+        if line.strip() != "":
+            yield json.loads(line)
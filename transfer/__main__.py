@@ -0,0 +1,73 @@
+"""
+Description:
+Exports rooms with their questions and responses to an NDJSON file, or imports
+such a file. With --checkpoint an interrupted run picks up where it stopped.
+
+Usage:
+python -m transfer export rooms.ndjson --checkpoint export.json
+python -m transfer import rooms.ndjson --checkpoint import.json
+"""
+import argparse
+import json
+import os
+
+from transfer import export_records, import_records, to_ndjson, from_ndjson, \
+    RECORD_TYPE, RECORD_ID, ROOM_RECORD
+
+def read_checkpoint(path):
+    if path == None or not os.path.exists(path):
+        return dict()
+    with open(path) as checkpoint_file:
+        return json.load(checkpoint_file)
+
+def write_checkpoint(path, checkpoint):
+    if path == None:
+        return
+    # Replace the checkpoint atomically so a crash never leaves it half written
+    with open(path + ".tmp", "w") as checkpoint_file:
+        json.dump(checkpoint, checkpoint_file)
+    os.replace(path + ".tmp", path)
+
+def run_export(database, path, checkpoint_path, page_size):
+    checkpoint = read_checkpoint(checkpoint_path)
+    after = checkpoint.get("after", None)
+    with open(path, "ab" if after != None else "wb") as out:
+        # Drop the partly written room that followed the checkpoint
+        out.truncate(checkpoint.get("offset", 0))
+        last_room = after
+        for record in export_records(database, after, page_size):
+            if record[RECORD_TYPE] == ROOM_RECORD:
+                if last_room != None:
+                    out.flush()
+                    write_checkpoint(checkpoint_path, {"after": last_room, "offset": out.tell()})
+                last_room = record[RECORD_ID]
+            out.write(to_ndjson(record).encode())
+        out.flush()
+        write_checkpoint(checkpoint_path, {"after": last_room, "offset": out.tell()})
+
+def run_import(database, path, checkpoint_path, batch_size):
+    checkpoint = read_checkpoint(checkpoint_path)
+    skip = checkpoint.get("records", 0)
+    with open(path, "rb") as source:
+        records = from_ndjson(line for index, line in enumerate(source) if index >= skip)
+        for written in import_records(database, records, batch_size):
+            write_checkpoint(checkpoint_path, {"records": skip + written})
+
+def main():
+    parser = argparse.ArgumentParser(description="Export or import rooms as NDJSON")
+    parser.add_argument("command", choices=["export", "import"])
+    parser.add_argument("path", help="NDJSON file to write or read")
+    parser.add_argument("--checkpoint", default=None, help="File recording progress to resume from")
+    parser.add_argument("--page-size", type=int, default=100, help="Documents read per query when exporting")
+    parser.add_argument("--batch-size", type=int, default=500, help="Documents written per commit when importing")
+    args = parser.parse_args()
+
+    from main import db_container
+    database = db_container.get_database()
+    if args.command == "export":
+        run_export(database, args.path, args.checkpoint, args.page_size)
+    else:
+        run_import(database, args.path, args.checkpoint, args.batch_size)
+
+if __name__ == '__main__':
+    main()